@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+孕线突破策略历史回测（多进程按交易日分片）
+===================================================================
+✅ 核心逻辑：
+   - 把每个历史交易日 T 当作一次尾盘选股：T 日全市场日线充当实时快照（收盘价代替尾盘价），
+     孕线形态只用 T 日之前的K线识别，板块5日动量同样只用 T-1 及以前的收盘价
+   - 与盘中完全相同的规则：filter_stocks_by_rule → 孕线形态表 → score_breakouts → 按综合得分取前 top_k
+   - 记录每只入选股票次日开盘价 / 收盘价相对 T 日收盘价的收益
+   - 回测日取自交易日历；回看窗口或次日缺少本地日线的交易日跳过并提示先 --sync
+   - 交易日切成若干连续分片，分给进程池；每个进程只从本地仓库读取自己分片
+     （含前 140 个交易日回看窗口）的日线，不在进程间传递大表
+✅ 已知偏差：名称与行业取自当前 stock_basic（历史 ST 状态、行业调整无法还原）；
+   历史资金流未接入，主力净流入加分恒为 0
+✅ 用法：
+   TUSHARE_TOKEN=xxx python backtest.py --start 20210101 --end 20251231 --sync   补齐本地日线后回测
+   python backtest.py --start 20210101 --end 20251231 [--top 3] [--workers 8] [--out picks.csv]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bar_store import DailyBarStore
+from market_history import HistoryPanel, load_market_daily, recent_trade_dates
+from premarket import compute_setups
+from providers import make_pro
+from shared_cache import INDUSTRY_TTL_DAYS
+from strategy import filter_stocks_by_rule, score_breakouts, sector_strength_momentum
+from trade_calendar import TradeCalendar
+
+BACKTEST_TABLE = "backtest_picks"
+HISTORY_LIMIT = 120
+# 与盘中 get_market_panel 相同：多取20个交易日，停牌股也能凑满 HISTORY_LIMIT 根K线
+HISTORY_PAD = 20
+BAR_COLUMNS = ['ts_code', 'trade_date', 'open', 'high', 'low', 'close', 'pre_close', 'vol', 'amount']
+PICK_COLUMNS = ['trade_date', '排名', '代码', '名称', '所属行业', '综合得分', '突破幅度', '放量倍数',
+                '板块强度得分', '收盘价', '次日开盘收益', '次日收盘收益']
+
+
+# ===============================
+# 数据准备（主进程，需要 pro）
+# ===============================
+def backtest_trade_dates(pro, start, end, store=None, with_next=False):
+    """
+    回测区间 [start, end] 的开市日，并在前面补足形态识别所需的回看交易日（按交易日历精确计算）；
+    with_next=True 时再追加 end 之后的下一个开市日（已收盘才追加），用于计算次日收益
+    """
+    calendar = TradeCalendar(pro, store)
+    first = calendar.prev(start, HISTORY_LIMIT + HISTORY_PAD)
+    dates = calendar.between(first or start, end)
+    if dates:
+        nxt = calendar.next(end) if with_next else None
+        if nxt and nxt < pd.Timestamp.now(tz='Asia/Shanghai').strftime('%Y%m%d'):
+            dates.append(nxt)
+        return dates
+    n = len(pd.bdate_range(start, end)) + HISTORY_LIMIT + HISTORY_PAD + 10
+    return recent_trade_dates(pro, end, n)
+
+
+def complete_days(dates, all_dates, stored, limit=HISTORY_LIMIT):
+    """
+    按交易日历检查每个回测日的数据是否齐全：T 日、之前 limit + HISTORY_PAD 个开市日、
+    以及日历中的下一个开市日都要在本地仓库。返回 (可回测的交易日, 缺数据跳过的交易日)
+    """
+    stored = set(stored)
+    pos = {d: i for i, d in enumerate(all_dates)}
+    ok, skipped = [], []
+    for d in dates:
+        i = pos[d]
+        lo = i - limit - HISTORY_PAD
+        if lo >= 0 and all(x in stored for x in all_dates[lo:i + 2]):
+            ok.append(d)
+        else:
+            skipped.append(d)
+    return ok, skipped
+
+
+def report_skipped(skipped, log=None, event="回测"):
+    if skipped and log:
+        log(event, f"{len(skipped)} 个交易日的回看窗口或次日缺少本地日线，已跳过"
+                   f"（{skipped[0]} ~ {skipped[-1]}），可先运行 backtest.py --sync 补齐")
+
+
+def sync_history(pro, store, trade_dates, fetcher=None, log=None, chunk=60):
+    """把本地仓库缺失的交易日全市场日线补齐；分块下载，不在内存中常驻整段历史"""
+    missing = store.missing_dates(trade_dates)
+    for i in range(0, len(missing), chunk):
+        load_market_daily(pro, missing[i:i + chunk], {}, log=log, store=store, fetcher=fetcher)
+        if log:
+            log("回测", f"已补齐 {min(i + chunk, len(missing))}/{len(missing)} 个交易日")
+    return missing
+
+
+def load_stock_basic(pro, store, max_age_days=INDUSTRY_TTL_DAYS):
+    """名称 + 行业（以 ts_code 为索引），与盘中共用本地 stock_basic 整表快照"""
+    df = store.read_table('stock_basic', max_age_days=max_age_days)
+    if df is None or 'name' not in df.columns:
+        df = pro.stock_basic(fields='ts_code,name,industry')
+        store.write_table('stock_basic', df)
+    return df.drop_duplicates('ts_code').set_index('ts_code')[['name', 'industry']]
+
+
+def load_index_changes(pro, start, end):
+    """{trade_date: 上证指数涨跌幅%}"""
+    df = pro.index_daily(ts_code='000001.SH', start_date=start, end_date=end)
+    if df is None or df.empty:
+        return {}
+    return dict(zip(df['trade_date'].astype(str), df['pct_chg'].astype(float)))
+
+
+# ===============================
+# 单日选股（回测与参数扫描共用）
+# ===============================
+def snapshot_from_daily(day, basic):
+    """把某交易日全市场日线转成与 fetch_from_tushare 相同列名的快照"""
+    day = day[~day['ts_code'].str.startswith(('688', '300', '301'))]
+    return pd.DataFrame({
+        '代码': day['ts_code'].to_numpy(),
+        '名称': day['ts_code'].map(basic['name']).to_numpy(),
+        '涨跌幅': ((day['close'] - day['pre_close']) / day['pre_close'] * 100).to_numpy(),
+        '最高涨幅': ((day['high'] - day['pre_close']) / day['pre_close'] * 100).to_numpy(),
+        # 日线成交额单位为千元，rt_k 为元
+        '成交额': (day['amount'] * 1000).to_numpy(),
+        '成交量': day['vol'].to_numpy(),
+        '最新价': day['close'].to_numpy(),
+        '最高价': day['high'].to_numpy(),
+        '所属行业': day['ts_code'].map(basic['industry']).to_numpy(),
+    })
+
+
+def sector_strength_from_panel(snap, panel):
+    """板块强度：5日动量取自面板（T-1 及以前）收盘价，口径与盘中 get_historical_data 一致"""
+    top = snap.nlargest(100, '成交额')['代码'].tolist()
+    close = panel.aligned('close', codes=top, limit=6)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct_5d = (close[:, -1] - close[:, 0]) / close[:, 0] * 100
+    stock_5d = {c: p for c, p in zip(top, pct_5d) if close.shape[1] == 6 and not np.isnan(p)}
+    return sector_strength_momentum(snap, stock_5d)
+
+
+def prepare_day(snap, setups, universe=None):
+    """基础过滤 + 连接孕线形态表，返回 (待评分股票, 特征表)，行序一致"""
+    filtered = filter_stocks_by_rule(snap).sort_values('成交额', ascending=False)
+    if universe:
+        filtered = filtered.head(universe)
+    to_check = filtered[filtered['代码'].isin(setups.index)].reset_index(drop=True)
+    feats = setups.loc[to_check['代码']].reset_index(drop=True)
+    return to_check, feats
+
+
+def pick_top(to_check, feats, sector_strength, index_change, top_k=3, **score_kw):
+    """评分并按综合得分取前 top_k（回测视为尾盘 14:30 后选股）"""
+    if to_check.empty:
+        return pd.DataFrame()
+    scores = score_breakouts(to_check, feats, sector_strength=sector_strength,
+                             index_change=index_change, late_session=True, **score_kw)
+    scored = pd.concat([to_check, scores], axis=1)
+    scored = scored[scored['突破有效']].sort_values('综合得分', ascending=False).head(top_k)
+    scored['排名'] = np.arange(1, len(scored) + 1)
+    return scored
+
+
+def attach_next_day(picks, next_day):
+    """次日开盘 / 收盘相对入选日收盘价的收益(%)；次日停牌或无数据为 NaN"""
+    picks = picks.copy()
+    picks['收盘价'] = picks['最新价']
+    if next_day is None or next_day.empty:
+        picks['次日开盘收益'] = np.nan
+        picks['次日收盘收益'] = np.nan
+        return picks
+    nxt = next_day.set_index('ts_code')
+    picks['次日开盘收益'] = (picks['代码'].map(nxt['open']) / picks['收盘价'] - 1) * 100
+    picks['次日收盘收益'] = (picks['代码'].map(nxt['close']) / picks['收盘价'] - 1) * 100
+    return picks
+
+
+# ===============================
+# 分片执行（子进程）
+# ===============================
+def iter_shard_days(store, shard_dates, window_dates, limit=HISTORY_LIMIT):
+    """
+    逐日产出 (T, T之前的面板, T日日线, T+1日日线)。
+    只读取一次分片窗口内的日线，按交易日序号切片，避免逐日重复读盘
+    """
+    bars = store.read_dates(window_dates, columns=BAR_COLUMNS)
+    if bars.empty:
+        return
+    bars = bars.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+    day_idx = np.searchsorted(np.asarray(window_dates), bars['trade_date'].to_numpy(dtype=str))
+    order = np.argsort(day_idx, kind='stable')
+    bounds = np.searchsorted(day_idx[order], np.arange(len(window_dates) + 1))
+    by_day = {d: bars.iloc[order[bounds[i]:bounds[i + 1]]] for i, d in enumerate(window_dates)}
+    pos = {d: i for i, d in enumerate(window_dates)}
+    for d in shard_dates:
+        i = pos[d]
+        lo = max(0, i - limit - HISTORY_PAD)
+        panel = HistoryPanel(bars[(day_idx >= lo) & (day_idx < i)])
+        nxt = by_day[window_dates[i + 1]] if i + 1 < len(window_dates) else None
+        yield d, panel, by_day[d], nxt
+
+
+def run_shard(root, shard_dates, window_dates, basic, index_changes, top_k=3, universe=None,
+              min_gain=5, vol_ratio=1.5, score_kw=None):
+    """回测一个分片，返回 (入选明细, 有效交易日数)"""
+    store = DailyBarStore(root)
+    frames, days = [], 0
+    for d, panel, day, nxt in iter_shard_days(store, shard_dates, window_dates):
+        if len(panel) == 0 or day.empty:
+            continue
+        days += 1
+        snap = snapshot_from_daily(day, basic)
+        setups = compute_setups(panel, min_gain=min_gain, vol_ratio=vol_ratio, limit=HISTORY_LIMIT)
+        to_check, feats = prepare_day(snap, setups, universe)
+        picks = pick_top(to_check, feats, sector_strength_from_panel(snap, panel),
+                         index_changes.get(d), top_k=top_k, **(score_kw or {}))
+        if picks.empty:
+            continue
+        picks = attach_next_day(picks, nxt)
+        picks['trade_date'] = d
+        frames.append(picks[PICK_COLUMNS])
+    picks = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PICK_COLUMNS)
+    return picks, days
+
+
+def _run_shard_task(task):
+    return run_shard(**task)
+
+
+def shard_dates(dates, all_dates, n_shards, limit=HISTORY_LIMIT):
+    """把回测日切成 n_shards 个连续分片，并为每片附上回看窗口（以及次日）"""
+    pos = {d: i for i, d in enumerate(all_dates)}
+    size = max(1, math.ceil(len(dates) / max(1, n_shards)))
+    shards = []
+    for k in range(0, len(dates), size):
+        chunk = dates[k:k + size]
+        lo = max(0, pos[chunk[0]] - limit - HISTORY_PAD)
+        hi = min(len(all_dates), pos[chunk[-1]] + 2)
+        shards.append((chunk, all_dates[lo:hi]))
+    return shards
+
+
+def run_backtest(start, end, basic, index_changes, trade_dates, store=None, top_k=3, universe=None,
+                 min_gain=5, vol_ratio=1.5, workers=None, log=None, **score_kw):
+    """
+    在本地仓库的日线上回测 [start, end]，返回 (入选明细, 有效交易日数)。
+    trade_dates 为交易日历给出的开市日（backtest_trade_dates(..., with_next=True)），
+    回看窗口或次日缺少本地日线的交易日跳过并记日志；workers=1 时在当前进程顺序执行，便于调试
+    """
+    store = store or DailyBarStore()
+    all_dates = list(trade_dates)
+    dates, skipped = complete_days([d for d in all_dates if start <= d <= end], all_dates, store.stored_dates())
+    report_skipped(skipped, log)
+    if not dates:
+        return pd.DataFrame(columns=PICK_COLUMNS), 0
+    workers = workers or os.cpu_count() or 1
+    # 每个进程分到约4片，慢片（行情活跃期形态多）不会拖住整体
+    shards = shard_dates(dates, all_dates, workers * 4 if workers > 1 else 1)
+    tasks = [dict(root=store.root, shard_dates=chunk, window_dates=window, basic=basic,
+                  index_changes=index_changes, top_k=top_k, universe=universe,
+                  min_gain=min_gain, vol_ratio=vol_ratio, score_kw=score_kw)
+             for chunk, window in shards]
+    t0 = time.perf_counter()
+    frames, days = [], 0
+
+    def collect(results):
+        nonlocal days
+        for i, (picks, n) in enumerate(results, 1):
+            if not picks.empty:
+                frames.append(picks)
+            days += n
+            if log:
+                log("回测", f"分片 {i}/{len(tasks)} 完成，累计 {days} 个交易日，用时 {time.perf_counter() - t0:.1f} 秒")
+
+    if workers == 1:
+        collect(map(_run_shard_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            collect(pool.map(_run_shard_task, tasks))
+    if not frames:
+        return pd.DataFrame(columns=PICK_COLUMNS), days
+    picks = pd.concat(frames, ignore_index=True).sort_values(['trade_date', '排名'], kind='mergesort')
+    return picks.reset_index(drop=True), days
+
+
+# ===============================
+# 统计
+# ===============================
+def summarize(picks, days=None):
+    """胜率（次日收盘收益>0）、次日开盘/收盘平均收益、入选次数"""
+    ret = picks['次日收盘收益'].dropna()
+    summary = {
+        '入选次数': len(picks),
+        '有选股天数': picks['trade_date'].nunique(),
+        '胜率': (ret > 0).mean() if len(ret) else np.nan,
+        '次日开盘平均收益': picks['次日开盘收益'].mean(),
+        '次日收盘平均收益': ret.mean() if len(ret) else np.nan,
+    }
+    if days is not None:
+        summary['回测交易日数'] = days
+    return summary
+
+
+def summarize_by_rank(picks):
+    return pd.DataFrame({rank: summarize(g) for rank, g in picks.groupby('排名')}).T
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="孕线突破策略历史回测")
+    parser.add_argument("--start", required=True, help="起始交易日 YYYYMMDD")
+    parser.add_argument("--end", required=True, help="结束交易日 YYYYMMDD")
+    parser.add_argument("--top", type=int, default=3, help="每日入选只数")
+    parser.add_argument("--universe", type=int, default=None, help="只评估成交额前N只（默认全市场）")
+    parser.add_argument("--min-gain", type=float, default=5, help="母线最小涨幅(%%)")
+    parser.add_argument("--vol-ratio", type=float, default=1.5, help="母线放量倍数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--sync", action="store_true", help="先从 Tushare 补齐本地仓库缺失的日线")
+    parser.add_argument("--out", help="入选明细另存为 CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        pro = make_pro()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    def log(event, details):
+        print(f"[{event}] {details}")
+
+    store = DailyBarStore()
+    trade_dates = backtest_trade_dates(pro, args.start, args.end, store, with_next=True)
+    if args.sync:
+        from fetcher import ConcurrentFetcher, RateLimiter
+        fetcher = ConcurrentFetcher(RateLimiter(int(os.environ.get("TUSHARE_CALLS_PER_MINUTE", "500"))))
+        sync_history(pro, store, trade_dates, fetcher=fetcher, log=log)
+    basic = load_stock_basic(pro, store)
+    index_changes = load_index_changes(pro, args.start, args.end)
+
+    picks, days = run_backtest(args.start, args.end, basic, index_changes, trade_dates, store=store,
+                               top_k=args.top, universe=args.universe, min_gain=args.min_gain,
+                               vol_ratio=args.vol_ratio, workers=args.workers, log=log)
+    store.write_table(BACKTEST_TABLE, picks)
+    if args.out:
+        picks.to_csv(args.out, index=False, encoding="utf-8-sig")
+    print(pd.Series(summarize(picks, days)).to_string())
+    if not picks.empty:
+        print(summarize_by_rank(picks).to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+本地列式日线仓库（Parquet，按交易日分区）
+===================================================================
+✅ 目录结构：
+   data_cache/
+     daily/20260105.parquet      ← 某交易日全市场日线（行键 ts_code）
+     tables/stock_basic.parquet  ← 整表快照（行业等低频数据）
+     local/...                   ← MHF_DATA_PROVIDER=local 时的独立根目录（结构同上）
+✅ 特点：
+   - 以 (ts_code, trade_date) 为键，一个交易日一个文件，只追加缺失的交易日
+   - 写入先落临时文件再原子替换，进程中断不会留下半截文件
+   - 不依赖 st.session_state，重启、跨日、强制刷新都不会丢失
+"""
+import os
+import time
+
+import pandas as pd
+
+
+def default_root():
+    """MHF_DATA_DIR 优先；本地数据源用 data_cache/local，避免离线数据与真实行情混在一起"""
+    if os.environ.get("MHF_DATA_DIR"):
+        return os.environ["MHF_DATA_DIR"]
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache")
+    if os.environ.get("MHF_DATA_PROVIDER", "tushare") == "local":
+        root = os.path.join(root, "local")
+    return root
+
+
+DEFAULT_ROOT = default_root()
+
+
+class DailyBarStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    # ---------- 按交易日分区的数据集 ----------
+    def _date_path(self, dataset, trade_date):
+        return os.path.join(self.root, dataset, f"{trade_date}.parquet")
+
+    def has_date(self, trade_date, dataset="daily"):
+        return os.path.exists(self._date_path(dataset, trade_date))
+
+    def stored_dates(self, dataset="daily"):
+        folder = os.path.join(self.root, dataset)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(f[:-len(".parquet")] for f in os.listdir(folder) if f.endswith(".parquet"))
+
+    def missing_dates(self, trade_dates, dataset="daily"):
+        have = set(self.stored_dates(dataset))
+        return [d for d in trade_dates if d not in have]
+
+    def write_date(self, trade_date, df, dataset="daily", keep_empty=False):
+        """写入某交易日分区；默认空表不落盘（盘中当日数据尚未生成）"""
+        if df is None or (df.empty and not keep_empty):
+            return
+        self._atomic_write(self._date_path(dataset, trade_date), df)
+
+    def read_date(self, trade_date, dataset="daily"):
+        path = self._date_path(dataset, trade_date)
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_parquet(path)
+        except Exception:
+            # 损坏的分区直接丢弃，下次重新下载
+            os.remove(path)
+            return None
+
+    def read_dates(self, trade_dates, dataset="daily", columns=None):
+        frames = []
+        for d in trade_dates:
+            path = self._date_path(dataset, d)
+            if os.path.exists(path):
+                frames.append(pd.read_parquet(path, columns=columns))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    # ---------- 整表快照 ----------
+    def _table_path(self, name):
+        return os.path.join(self.root, "tables", f"{name}.parquet")
+
+    def write_table(self, name, df):
+        if df is None or df.empty:
+            return
+        self._atomic_write(self._table_path(name), df)
+
+    def read_table(self, name, max_age_days=None):
+        """读取整表快照；超过 max_age_days 视为过期，返回 None"""
+        path = self._table_path(name)
+        if not os.path.exists(path):
+            return None
+        if max_age_days is not None and time.time() - os.path.getmtime(path) > max_age_days * 86400:
+            return None
+        try:
+            return pd.read_parquet(path)
+        except Exception:
+            return None
+
+    # ---------- 内部 ----------
+    def _atomic_write(self, path, df):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.reset_index(drop=True).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+选股流程性能基准（合成行情，可复现）
+===================================================================
+✅ 核心逻辑：
+   - synthetic.synthetic_market 按固定随机种子生成 N 只股票 × T 日的日线（大盘 + 行业 + 个股三因子），
+     行业分布不均匀、含停牌缺口和次新股，并在一部分股票的最近两根K线上植入
+     「放量大阳母线 + 缩量阴线子线」孕线，当日快照中这些股票放量突破母线高点
+   - 在多个股票池规模下分别计时各阶段：filter_stocks_by_rule、板块强度（SectorEngine，
+     与 calculate_sector_strength_momentum 同一路径，分首次刷新与稳态刷新）、is_strong_mother、
+     find_latest_pregnancy、check_breakout（逐只版本）、find_latest_pregnancy_batch、
+     compute_setups、score_breakouts（批量版本），以及逐只 / 批量两种端到端选股
+   - 结果写成 JSON（含版本、机器与 git 提交信息）；--compare 与基线对比，变慢超过容差即返回非零
+✅ 用法：
+   python benchmark.py [--sizes 500,1000,2000,5000] [--days 250] [--repeat 3] [--out result.json]
+   python benchmark.py --compare data_cache/bench/baseline.json [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from backtest import HISTORY_LIMIT
+from bar_store import DEFAULT_ROOT
+from market_history import HistoryPanel
+from premarket import SETUP_FIELDS, compute_setups
+from sector_engine import SectorEngine
+from strategy import (check_breakout, filter_stocks_by_rule, find_latest_pregnancy, find_latest_pregnancy_batch,
+                      is_strong_mother, score_breakouts)
+from synthetic import synthetic_market
+from trade_calendar import TZ
+
+BENCH_ROOT = os.path.join(DEFAULT_ROOT, "bench")
+# 板块强度写入的快照时刻（尾盘）
+SNAPSHOT_TIME = datetime(2026, 10, 16, 14, 50, tzinfo=TZ)
+
+
+# ===============================
+# 计时
+# ===============================
+def _timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def _scalar_scan(snap, frames, top_k=10):
+    """原逐只流程：每只股票 find_latest_pregnancy + check_breakout"""
+    hits = []
+    for _, row in snap.iterrows():
+        hist = frames[row['代码']]
+        pregnancy = find_latest_pregnancy(hist, lookback=10, min_gain=5, vol_ratio=1.5)
+        if pregnancy is None or len(hist) < 25:
+            continue
+        ok, gain, ratio, _ = check_breakout(row, pregnancy, hist)
+        if ok:
+            hits.append((row['代码'], gain * 25 + ratio * 25))
+    return sorted(hits, key=lambda x: -x[1])[:top_k]
+
+
+def _sector_strength(engine, snap, panel, snapshot_time=SNAPSHOT_TIME):
+    """
+    与 streamlit_app.calculate_sector_strength_momentum 相同的路径：prepare 取尚未计算 5 日涨幅的
+    成交额前 100 → 从面板切片补齐 → compute。引擎已预热时 prepare 返回空，只剩 bincount 聚合
+    """
+    missing = engine.prepare(snap, snapshot_time.strftime('%Y%m%d'))
+    stock_5d = {}
+    if missing:
+        close = panel.aligned('close', codes=missing, limit=6)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pct_5d = (close[:, -1] - close[:, 0]) / close[:, 0] * 100
+        stock_5d = dict(zip(missing, pct_5d if close.shape[1] == 6 else np.full(len(missing), np.nan)))
+    return engine.compute(snap, stock_5d, ts=snapshot_time)
+
+
+def _batch_scan(snap, panel, top_k=10):
+    """批量流程：过滤 → 形态表连接 → 板块强度 → 列式评分"""
+    filtered = filter_stocks_by_rule(snap).sort_values('成交额', ascending=False)
+    setups = compute_setups(panel, limit=HISTORY_LIMIT)
+    to_check = filtered[filtered['代码'].isin(setups.index)].reset_index(drop=True)
+    feats = setups.loc[to_check['代码']].reset_index(drop=True)
+    scores = score_breakouts(to_check, feats, sector_strength=_sector_strength(SectorEngine(), snap, panel),
+                             late_session=True)
+    return scores[scores['突破有效']].nlargest(top_k, '综合得分')
+
+
+def bench_size(bars, snap, n, repeat=3):
+    """在前 n 只股票构成的股票池上计时各阶段，返回结果记录列表"""
+    codes = snap['代码'].iloc[:n]
+    snap_n = snap.iloc[:n].reset_index(drop=True)
+    bars_n = bars[bars['ts_code'].isin(set(codes))]
+    # 每轮重新构造面板，避免 aligned 缓存让批量阶段只计到第一次
+    def fresh_panel():
+        return HistoryPanel(bars_n)
+
+    panel = fresh_panel()
+    frames = {c: panel.frame(c, HISTORY_LIMIT) for c in codes}
+    arrays = {f: panel.aligned(f, codes=list(codes), limit=HISTORY_LIMIT) for f in SETUP_FIELDS}
+    setups = compute_setups(panel, limit=HISTORY_LIMIT)
+    pregnancies = {c: find_latest_pregnancy(frames[c]) for c in codes}
+    with_preg = snap_n[snap_n['代码'].map(lambda c: pregnancies[c] is not None)]
+    to_check = snap_n[snap_n['代码'].isin(setups.index)].reset_index(drop=True)
+    feats = setups.loc[to_check['代码']].reset_index(drop=True)
+    # 稳态引擎：映射与 5 日涨幅已在首次刷新时建好，盘中每次刷新只做聚合
+    engine = SectorEngine()
+    sector_strength = _sector_strength(engine, snap_n, panel)
+
+    stages = {
+        'filter_stocks_by_rule': lambda: filter_stocks_by_rule(snap_n),
+        'sector_strength_first': lambda: _sector_strength(SectorEngine(), snap_n, panel),
+        'sector_strength': lambda: _sector_strength(engine, snap_n, panel),
+        'is_strong_mother': lambda: [is_strong_mother(h.iloc[-2], h.iloc[:-1]) for h in frames.values() if len(h) >= 2],
+        'find_latest_pregnancy': lambda: [find_latest_pregnancy(h) for h in frames.values()],
+        'check_breakout': lambda: [check_breakout(row, pregnancies[row['代码']], frames[row['代码']])
+                                   for _, row in with_preg.iterrows()],
+        'find_latest_pregnancy_batch': lambda: find_latest_pregnancy_batch(
+            arrays['open'], arrays['high'], arrays['low'], arrays['close'], arrays['vol']),
+        'compute_setups': lambda: compute_setups(fresh_panel(), limit=HISTORY_LIMIT),
+        'score_breakouts': lambda: score_breakouts(to_check, feats, sector_strength=sector_strength,
+                                                   late_session=True),
+        'scan_scalar': lambda: _scalar_scan(filter_stocks_by_rule(snap_n), frames),
+        'scan_batch': lambda: _batch_scan(snap_n, fresh_panel()),
+    }
+    records = []
+    for stage, fn in stages.items():
+        times = _timeit(fn, repeat)
+        records.append({
+            'stage': stage,
+            'universe': n,
+            'seconds_min': min(times),
+            'seconds_median': float(np.median(times)),
+            'us_per_stock': min(times) / n * 1e6,
+        })
+    records.append({'stage': 'planted_hits', 'universe': n, 'count': int(len(_batch_scan(snap_n, panel, top_k=n)))})
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(sizes=(500, 1000, 2000, 5000), n_days=250, repeat=3, seed=0, log=None):
+    t0 = time.perf_counter()
+    bars, snap = synthetic_market(max(sizes), n_days, seed=seed)
+    if log:
+        log("基准", f"合成行情 {max(sizes)} 只 × {n_days} 日，用时 {time.perf_counter() - t0:.1f} 秒")
+    results = []
+    for n in sorted(sizes):
+        results.extend(bench_size(bars, snap, n, repeat))
+        if log:
+            log("基准", f"股票池 {n} 完成")
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': seed,
+            'n_days': n_days,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2, min_delta=0.005):
+    """
+    按 (stage, universe) 对比 seconds_min，返回 DataFrame。
+    变慢超过 tolerance 且绝对差超过 min_delta 秒的行标记为回退（毫秒级阶段的抖动不算）
+    """
+    def key(r):
+        return r['stage'], r['universe']
+
+    base = {key(r): r['seconds_min'] for r in baseline['results'] if 'seconds_min' in r}
+    rows = []
+    for r in current['results']:
+        if 'seconds_min' not in r or key(r) not in base:
+            continue
+        ratio = r['seconds_min'] / base[key(r)] if base[key(r)] > 0 else np.nan
+        rows.append({'stage': r['stage'], 'universe': r['universe'], 'baseline': base[key(r)],
+                     'current': r['seconds_min'], 'ratio': ratio,
+                     'regressed': ratio > 1 + tolerance and r['seconds_min'] - base[key(r)] > min_delta})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="选股流程性能基准")
+    parser.add_argument("--sizes", default="500,1000,2000,5000", help="股票池规模，逗号分隔")
+    parser.add_argument("--days", type=int, default=250, help="合成日线天数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数（取最小值）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="结果 JSON 路径，默认 data_cache/bench/bench_时间戳.json")
+    parser.add_argument("--compare", default=None, help="基线 JSON，对比后变慢超过容差则返回 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的变慢比例")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="低于该绝对差（秒）的变慢忽略")
+    args = parser.parse_args(argv)
+
+    def log(event, details):
+        print(f"[{event}] {details}")
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    result = run_benchmark(sizes, args.days, args.repeat, args.seed, log=log)
+    out = args.out or os.path.join(BENCH_ROOT, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    log("基准", f"结果已写入 {out}")
+
+    table = pd.DataFrame([r for r in result['results'] if 'seconds_min' in r])
+    print(table.pivot(index='stage', columns='universe', values='seconds_min').round(4).to_string())
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            diff = compare(result, json.load(f), args.tolerance, args.min_delta)
+        print(diff.round(3).to_string())
+        if diff['regressed'].any():
+            log("基准", f"{int(diff['regressed'].sum())} 项变慢超过 {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+并发数据请求层（线程池 + 全局令牌桶限流）
+===================================================================
+✅ 核心逻辑：
+   - 所有 Tushare 请求共用一个「每分钟调用次数」预算（令牌桶），与账户权限对齐
+   - 线程池并发发送请求，替代原来的串行调用 + 固定 time.sleep
+   - 单个请求失败按指数退避重试，重试耗尽后记录错误，不影响其他请求
+   - 请求函数只做网络 I/O，不访问 st.session_state，可安全在线程中执行
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    """令牌桶：平均速率 calls_per_minute，最多允许 burst 次突发"""
+
+    def __init__(self, calls_per_minute=500, burst=None):
+        self.rate = calls_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, calls_per_minute // 10))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrentFetcher:
+    """
+    并发请求执行器。
+    run({key: 无参函数}) 并发执行，返回 (results, errors) 两个以 key 为键的字典。
+    """
+
+    def __init__(self, limiter, max_workers=8, retries=2, backoff=0.5):
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+
+    def call(self, fn, *args, **kwargs):
+        """限流 + 重试地调用一次，重试耗尽时抛出最后一次异常"""
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def run(self, tasks):
+        futures = {key: self._pool.submit(self.call, fn) for key, fn in tasks.items()}
+        results, errors = {}, {}
+        for key, fut in futures.items():
+            try:
+                results[key] = fut.result()
+            except Exception as e:
+                errors[key] = e
+        return results, errors
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+增量选股评分（只重算快照有变化的股票）
+===================================================================
+✅ 核心逻辑：
+   - 保存上一次评分的输入（快照价量字段 + 孕线特征 + 板块强度得分）与结果，均以代码为索引
+   - 新快照到来时逐列比较，只对「新进入过滤结果 / 价量或板块得分有变化」的股票调用 score_breakouts，
+     其余股票直接复用上次结果；跌出过滤结果的股票自然移除
+   - 评分参数、大盘涨跌幅、尾盘标志任一变化时整表重算（这些输入对所有股票生效）
+   - 记录每次刷新 重算 / 复用 / 新增 / 移除 的行数
+✅ score_breakouts 逐行独立，增量结果与整表重算完全一致
+✅ 用法：
+   scorer = IncrementalScorer()
+   scores = scorer.score(to_check, feats, sector_strength=ss, index_change=0.3, vol_ratio_break=1.5)
+   scorer.last_stats    # {'total', 'recomputed', 'reused', 'added', 'removed'}
+"""
+import numpy as np
+import pandas as pd
+
+from strategy import FEATURE_COLUMNS, score_breakouts, sector_scores
+
+SNAP_INPUTS = ['最新价', '成交量', '最高价', '涨跌幅', '主力净流入占比']
+
+
+class IncrementalScorer:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.context = None
+        self.codes = None      # 上次评分的代码索引
+        self.values = None     # 上次评分的输入（float 数组，行序与 codes 一致）
+        self.scores = None     # 上次评分结果 {列名: 数组}
+        self.last_stats = {}
+
+    def score(self, snap, feats, sector_strength=None, index_change=None, late_session=False, **score_kw):
+        """
+        与 score_breakouts 参数一致（index_change 为标量），返回与 snap 同索引的评分表。
+        snap 需含唯一的 代码 列，feats 与 snap 行序一致
+        """
+        codes = pd.Index(snap['代码'], name='代码')
+        sector = sector_scores(snap, sector_strength)
+        snap_cols = [c for c in SNAP_INPUTS if c in snap.columns]
+        values = np.column_stack([snap[snap_cols].to_numpy(dtype=float),
+                                  feats[FEATURE_COLUMNS].to_numpy(dtype=float), sector])
+        context = (index_change, late_session, tuple(sorted(score_kw.items())), tuple(snap_cols))
+
+        if self.codes is None:
+            pos = np.full(len(codes), -1)
+        else:
+            pos = self.codes.get_indexer(codes)
+        known = pos >= 0
+        # 上下文变化，或与上次没有共同代码（含上次为空表）时整表重算
+        if context != self.context or not known.any():
+            changed = np.ones(len(codes), dtype=bool)
+        else:
+            prev = self.values[np.where(known, pos, 0)]
+            same = ((values == prev) | (np.isnan(values) & np.isnan(prev))).all(axis=1)
+            changed = ~(known & same)
+
+        # 只用窄表重算：score_breakouts 读取的列都已在 values 中，避免对宽快照做布尔切片
+        sub = values[changed]
+        k = len(snap_cols)
+        fresh = score_breakouts(pd.DataFrame(sub[:, :k], columns=snap_cols),
+                                pd.DataFrame(sub[:, k:-1], columns=FEATURE_COLUMNS),
+                                index_change=index_change, late_session=late_session,
+                                sector_score=sub[:, -1], **score_kw)
+        columns = {}
+        for col in fresh.columns:
+            if changed.all():
+                columns[col] = fresh[col].to_numpy()
+            else:
+                merged = self.scores[col][np.where(known, pos, 0)].copy()
+                merged[changed] = fresh[col].to_numpy()
+                columns[col] = merged
+        result = pd.DataFrame(columns, index=snap.index)
+
+        self.last_stats = {
+            'total': len(codes),
+            'recomputed': int(changed.sum()),
+            'reused': int((~changed).sum()),
+            'added': int((~known).sum()),
+            'removed': int(len(self.codes) - np.unique(pos[known]).size) if self.codes is not None else 0,
+        }
+        self.context, self.codes, self.values, self.scores = context, codes, values, columns
+        return result
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标采集（阶段耗时 / 接口调用 / 缓存命中 / 处理行数）
+===================================================================
+✅ 核心逻辑：
+   - Metrics 为进程级单例（由 st.cache_resource 创建），线程安全，页面会话与后台线程共用
+   - stage(name)：记录某阶段耗时与处理行数；在 refresh 内执行时同时计入该次刷新的明细
+   - refresh(kind) / begin_refresh / end_refresh：一次页面运行、一次定时局部刷新或一次后台拉取为一次刷新，
+     结束时追加一行 JSON 到 metrics/refresh-YYYYMMDD.jsonl，并重写 Prometheus 文本文件 metrics/mhf.prom
+   - InstrumentedPro 包装 pro 对象：按接口统计调用次数、失败次数、耗时分布与返回行数
+✅ Prometheus 文本文件可直接交给 node_exporter 的 textfile collector 采集
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from bar_store import DEFAULT_ROOT
+
+METRICS_DIR = os.environ.get("MHF_METRICS_DIR", os.path.join(DEFAULT_ROOT, "metrics"))
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    def __init__(self, export_dir=METRICS_DIR, cache_stats=None, max_refreshes=200):
+        """cache_stats：返回 {命名空间: {'hits','misses','coalesced','expired','evicted','fallbacks','entries','bytes'}} 的函数（如 SharedCache.stats）"""
+        self.export_dir = export_dir
+        self.cache_stats = cache_stats
+        self.refreshes = deque(maxlen=max_refreshes)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._api = defaultdict(lambda: {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max': 0.0, 'rows': 0,
+                                         'buckets': [0] * len(LATENCY_BUCKETS)})
+        self._stages = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'last': 0.0, 'max': 0.0, 'rows': 0})
+        self._refresh_totals = Counter()
+
+    # ---------- 采集 ----------
+    def record_api(self, endpoint, seconds, rows=0, error=False):
+        with self._lock:
+            api = self._api[endpoint]
+            api['calls'] += 1
+            api['errors'] += int(error)
+            api['seconds'] += seconds
+            api['max'] = max(api['max'], seconds)
+            api['rows'] += rows
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if seconds <= le:
+                    api['buckets'][i] += 1
+
+    def record_stage(self, name, seconds, rows=None):
+        with self._lock:
+            st = self._stages[name]
+            st['count'] += 1
+            st['seconds'] += seconds
+            st['last'] = seconds
+            st['max'] = max(st['max'], seconds)
+            st['rows'] += rows or 0
+        current = getattr(self._local, 'current', None)
+        if current is not None:
+            current['stages'][name] = current['stages'].get(name, 0.0) + seconds
+            if rows is not None:
+                current['rows'][name] = current['rows'].get(name, 0) + rows
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """with metrics.stage('filter') as s: ...; s['rows'] = len(df)"""
+        rec = {'rows': rows}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            self.record_stage(name, time.perf_counter() - t0, rec['rows'])
+
+    def begin_refresh(self, kind):
+        """开始一次刷新（当前线程）；未结束的上一次刷新（如被 st.rerun 打断）直接丢弃"""
+        with self._lock:
+            api0 = {ep: a['calls'] for ep, a in self._api.items()}
+        self._local.current = {
+            'kind': kind,
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'stages': {},
+            'rows': {},
+            '_t0': time.perf_counter(),
+            '_api0': api0,
+        }
+
+    def end_refresh(self, **fields):
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            return None
+        self._local.current = None
+        with self._lock:
+            api_calls = {ep: a['calls'] - current['_api0'].get(ep, 0) for ep, a in self._api.items()}
+            self._refresh_totals[current['kind']] += 1
+        record = {
+            'kind': current['kind'],
+            'started': current['started'],
+            'seconds': time.perf_counter() - current['_t0'],
+            'stages': current['stages'],
+            'rows': current['rows'],
+            # 进程内合计：同一时段其他会话/后台线程的调用也会计入
+            'api_calls': {ep: n for ep, n in api_calls.items() if n},
+        }
+        record.update(fields)
+        self.refreshes.append(record)
+        self.export(record)
+        return record
+
+    @contextmanager
+    def refresh(self, kind, **fields):
+        self.begin_refresh(kind)
+        try:
+            yield
+        finally:
+            self.end_refresh(**fields)
+
+    # ---------- 读取 ----------
+    def in_refresh(self):
+        """当前线程是否处于一次未结束的刷新中"""
+        return getattr(self._local, 'current', None) is not None
+
+    def last_refresh(self, kind=None):
+        for record in reversed(self.refreshes):
+            if kind is None or record['kind'] == kind:
+                return record
+        return None
+
+    def api_table(self):
+        with self._lock:
+            return {ep: {'calls': a['calls'], 'errors': a['errors'], 'rows': a['rows'],
+                         'avg_ms': a['seconds'] / a['calls'] * 1000 if a['calls'] else 0.0,
+                         'max_ms': a['max'] * 1000}
+                    for ep, a in sorted(self._api.items())}
+
+    def stage_table(self):
+        with self._lock:
+            return {name: {'count': s['count'], 'last_ms': s['last'] * 1000, 'max_ms': s['max'] * 1000,
+                           'avg_ms': s['seconds'] / s['count'] * 1000 if s['count'] else 0.0, 'rows': s['rows']}
+                    for name, s in sorted(self._stages.items())}
+
+    # ---------- 导出 ----------
+    def export(self, record=None):
+        """追加 JSON 行并重写 Prometheus 文本文件；导出失败不影响主流程"""
+        try:
+            os.makedirs(self.export_dir, exist_ok=True)
+            if record is not None:
+                path = os.path.join(self.export_dir, f"refresh-{datetime.now().strftime('%Y%m%d')}.jsonl")
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            path = os.path.join(self.export_dir, "mhf.prom")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def prometheus_text(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            api = {ep: dict(a, buckets=list(a['buckets'])) for ep, a in self._api.items()}
+            stages = {name: dict(s) for name, s in self._stages.items()}
+            refreshes = dict(self._refresh_totals)
+        metric("mhf_api_calls_total", "counter", "接口调用次数", [({'endpoint': ep}, a['calls']) for ep, a in api.items()])
+        metric("mhf_api_errors_total", "counter", "接口调用失败次数", [({'endpoint': ep}, a['errors']) for ep, a in api.items()])
+        metric("mhf_api_rows_total", "counter", "接口返回行数", [({'endpoint': ep}, a['rows']) for ep, a in api.items()])
+        # 直方图：一个指标族下依次给出 _bucket / _sum / _count
+        lines.append("# HELP mhf_api_latency_seconds 接口耗时分布")
+        lines.append("# TYPE mhf_api_latency_seconds histogram")
+        for ep, a in api.items():
+            label = f'endpoint="{_escape(ep)}"'
+            for le, n in zip(LATENCY_BUCKETS, a['buckets']):
+                lines.append(f'mhf_api_latency_seconds_bucket{{{label},le="{le:g}"}} {n}')
+            lines.append(f'mhf_api_latency_seconds_bucket{{{label},le="+Inf"}} {a["calls"]}')
+            lines.append(f"mhf_api_latency_seconds_sum{{{label}}} {a['seconds']:.6f}")
+            lines.append(f"mhf_api_latency_seconds_count{{{label}}} {a['calls']}")
+        metric("mhf_stage_seconds_total", "counter", "阶段累计耗时", [({'stage': n}, f"{s['seconds']:.6f}") for n, s in stages.items()])
+        metric("mhf_stage_runs_total", "counter", "阶段执行次数", [({'stage': n}, s['count']) for n, s in stages.items()])
+        metric("mhf_stage_last_seconds", "gauge", "阶段最近一次耗时", [({'stage': n}, f"{s['last']:.6f}") for n, s in stages.items()])
+        metric("mhf_stage_rows_total", "counter", "阶段累计处理行数", [({'stage': n}, s['rows']) for n, s in stages.items()])
+        metric("mhf_refresh_total", "counter", "刷新次数", [({'kind': k}, n) for k, n in refreshes.items()])
+        last = {}
+        for record in self.refreshes:
+            last[record['kind']] = record['seconds']
+        metric("mhf_refresh_last_seconds", "gauge", "最近一次刷新耗时", [({'kind': k}, f"{v:.6f}") for k, v in last.items()])
+        if self.cache_stats is not None:
+            stats = self.cache_stats()
+            for field in ('hits', 'misses', 'coalesced', 'expired', 'evicted', 'fallbacks'):
+                metric(f"mhf_cache_{field}_total", "counter", f"共享缓存 {field}",
+                       [({'namespace': ns}, s[field]) for ns, s in stats.items()])
+            metric("mhf_cache_entries", "gauge", "共享缓存条目数", [({'namespace': ns}, s['entries']) for ns, s in stats.items()])
+            metric("mhf_cache_bytes", "gauge", "共享缓存占用字节（仅有预算的命名空间）",
+                   [({'namespace': ns}, s['bytes']) for ns, s in stats.items() if s.get('bytes') is not None])
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ===============================
+# pro 包装
+# ===============================
+class InstrumentedPro:
+    """透明包装 pro 对象：每次接口调用都计入 Metrics（按接口名统计）"""
+
+    def __init__(self, pro, metrics):
+        self._pro = pro
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._pro, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                self._metrics.record_api(name, time.perf_counter() - t0, error=True)
+                raise
+            rows = len(result) if hasattr(result, '__len__') else 0
+            self._metrics.record_api(name, time.perf_counter() - t0, rows=rows)
+            return result
+
+        return call
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+盘中分钟环形缓冲（股票 × 240 分钟 × 字段，预分配数组）
+===================================================================
+✅ 核心逻辑：
+   - 一个交易日 240 个分钟槽（09:30-11:30 对应 0-119，13:00-15:00 对应 120-239），
+     每次轮询把全市场快照按「股票行 × 当前分钟槽」整列写入，同一分钟多次轮询覆盖为最新值
+   - 数组在创建时按 capacity 只数一次性分配（float32），全市场 6000 只 × 240 × 4 字段 ≈ 23MB，
+     全天不再增长；换日时原地清空复用
+   - 增量因子只依赖每只股票上一分钟的状态，每次写入 O(1)（对股票向量化，不回扫分钟）：
+     分钟量（相邻两个分钟槽累计成交量之差 / 间隔分钟数）、量能加速度（本分钟量 - 上一分钟量）、
+     日内 VWAP（累计成交额 / 累计成交量）、偏离 VWAP、距日内高点回撤
+   - 每只股票当日首个样本只记录基准状态，分钟量为 NaN（没有上一分钟可比，不能拿全天累计量充当分钟量）
+✅ 用法：
+   buf = IntradayBuffer()
+   buf.record(snapshot_df, datetime.now(tz))     # 每次轮询后调用
+   buf.factors()                                 # 以代码为索引的因子表
+   buf.series('600000.SH', 'price')              # 某只股票当日分钟序列（未写入的分钟为 NaN）
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+MINUTES = 240
+FIELDS = ('price', 'volume', 'amount', 'high')
+# 快照列名（fetch_from_tushare 输出）→ 缓冲字段；成交量、成交额均为当日累计值
+SNAPSHOT_COLUMNS = {'price': '最新价', 'volume': '成交量', 'amount': '成交额', 'high': '最高价'}
+FACTOR_COLUMNS = ['最新价', '分钟量', '量能加速度', 'VWAP', '偏离VWAP', '高点回撤']
+
+
+def session_minute(ts):
+    """交易时刻 → 分钟槽 0-239；开盘前记为 0，午休记为 119，收盘后记为 239"""
+    m = ts.hour * 60 + ts.minute
+    if m < 570:            # 09:30 前
+        return 0
+    if m < 690:            # 09:30-11:29
+        return m - 570
+    if m < 780:            # 11:30-12:59 午休
+        return 119
+    return min(m - 780 + 120, MINUTES - 1)
+
+
+class IntradayBuffer:
+    def __init__(self, capacity=6000, columns=None, code_column='代码', minutes=MINUTES, vwap_scale=1.0):
+        """
+        capacity：最多容纳的股票数，超出的新代码忽略；columns：快照列名映射，默认 SNAPSHOT_COLUMNS；
+        vwap_scale：VWAP = 成交额 / 成交量 × vwap_scale，用于统一单位（如 元/手 → 元/股 取 0.01）
+        """
+        self.capacity = capacity
+        self.minutes = minutes
+        self.columns = dict(SNAPSHOT_COLUMNS if columns is None else columns)
+        self.code_column = code_column
+        self.vwap_scale = vwap_scale
+        self._lock = threading.Lock()
+        self.data = np.full((capacity, minutes, len(FIELDS)), np.nan, dtype=np.float32)
+        # 每只股票的增量状态（均为长度 capacity 的向量）
+        self.last_slot = np.full(capacity, -1, dtype=np.int16)
+        # 成交量基准初始为 NaN：首个样本算出的分钟量自然为 NaN
+        self.last_volume = np.full(capacity, np.nan)
+        self.base_slot = np.full(capacity, -1, dtype=np.int16)
+        self.base_volume = np.full(capacity, np.nan)
+        self.delta = np.full(capacity, np.nan)
+        self.prev_delta = np.full(capacity, np.nan)
+        self.high = np.full(capacity, np.nan)
+        self.index = {}
+        self.trade_date = None
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return len(self.index)
+
+    def reset(self, trade_date=None):
+        """换日：原地清空，保留已分配的数组与代码行号"""
+        with self._lock:
+            self.data.fill(np.nan)
+            self.last_slot.fill(-1)
+            self.last_volume.fill(np.nan)
+            self.base_slot.fill(-1)
+            self.base_volume.fill(np.nan)
+            self.delta.fill(np.nan)
+            self.prev_delta.fill(np.nan)
+            self.high.fill(np.nan)
+            self.trade_date = trade_date
+
+    def _rows(self, codes):
+        rows = np.empty(len(codes), dtype=np.int64)
+        for i, code in enumerate(codes):
+            row = self.index.get(code)
+            if row is None:
+                row = len(self.index) if len(self.index) < self.capacity else -1
+                if row >= 0:
+                    self.index[code] = row
+            rows[i] = row
+        return rows
+
+    def record(self, df, ts):
+        """写入一帧快照（当日累计成交量/额），返回写入的分钟槽"""
+        if df is None or df.empty:
+            return None
+        trade_date = ts.strftime('%Y%m%d')
+        if trade_date != self.trade_date:
+            self.reset(trade_date)
+        slot = session_minute(ts)
+        values = np.column_stack([
+            pd.to_numeric(df[self.columns[f]], errors='coerce').to_numpy(dtype=float)
+            if self.columns.get(f) in df.columns else np.full(len(df), np.nan)
+            for f in FIELDS
+        ])
+        with self._lock:
+            rows = self._rows(df[self.code_column].tolist())
+            keep = rows >= 0
+            rows, values = rows[keep], values[keep]
+            self.data[rows, slot, :] = values
+
+            # 进入新的分钟槽：上一分钟的最终状态成为计算分钟量的基准
+            advance = self.last_slot[rows] < slot
+            moved = rows[advance]
+            self.prev_delta[moved] = self.delta[moved]
+            self.base_slot[moved] = self.last_slot[moved]
+            self.base_volume[moved] = self.last_volume[moved]
+
+            volume = values[:, 1]
+            has_volume = ~np.isnan(volume)
+            vrows = rows[has_volume]
+            gap = np.maximum(slot - self.base_slot[vrows], 1)
+            self.delta[vrows] = (volume[has_volume] - self.base_volume[vrows]) / gap
+            self.last_volume[vrows] = volume[has_volume]
+            self.last_slot[rows] = slot
+            self.high[rows] = np.fmax(self.high[rows], np.fmax(values[:, 0], values[:, 3]))
+        return slot
+
+    def factors(self, codes=None):
+        """以代码为索引的增量因子表；codes 为 None 时返回全部已记录的股票"""
+        with self._lock:
+            codes = list(self.index) if codes is None else [c for c in codes if c in self.index]
+            rows = np.array([self.index[c] for c in codes], dtype=np.int64)
+            slots = self.last_slot[rows]
+            latest = self.data[rows, np.maximum(slots, 0), :].astype(float)
+            latest[slots < 0] = np.nan
+            delta, prev_delta, high = self.delta[rows], self.prev_delta[rows], self.high[rows]
+        price, volume, amount = latest[:, 0], latest[:, 1], latest[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.where(volume > 0, amount / volume * self.vwap_scale, np.nan)
+            return pd.DataFrame({
+                '最新价': price,
+                '分钟量': delta,
+                '量能加速度': delta - prev_delta,
+                'VWAP': vwap,
+                '偏离VWAP': (price / vwap - 1) * 100,
+                '高点回撤': np.where(high > 0, (high - price) / high * 100, np.nan),
+            }, index=pd.Index(codes, name='代码'))
+
+    def series(self, code, field='price'):
+        """某只股票当日分钟序列（长度 240，未写入的分钟为 NaN）"""
+        row = self.index.get(code)
+        if row is None:
+            return None
+        with self._lock:
+            return self.data[row, :, FIELDS.index(field)].astype(float)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+全市场日线历史加载（按交易日拉取）
+===================================================================
+✅ 核心思路：
+   - 不再逐只股票调用 pro.daily(ts_code=...)，而是按交易日调用
+     pro.daily(trade_date=...)，一次拿到全市场当日日线
+   - 120个交易日 ≈ 120次调用；已收盘的交易日数据永不变化，可永久缓存
+   - 拼成「股票 × 日期」面板，孕线识别、突破判断、板块动量都从面板切片
+"""
+import numpy as np
+import pandas as pd
+
+DAILY_FIELDS = ['ts_code', 'trade_date', 'open', 'high', 'low', 'close',
+                'pre_close', 'change', 'pct_chg', 'vol', 'amount']
+PANEL_FIELDS = ['open', 'high', 'low', 'close', 'vol', 'amount']
+
+
+# ===============================
+# 交易日列表
+# ===============================
+def recent_trade_dates(pro, end_date, n, calendar=None):
+    """
+    返回截至 end_date（含）的最近 n 个开市日，升序 'YYYYMMDD' 列表。
+    传入 calendar（trade_calendar.TradeCalendar）时直接查本地日历，不调用接口
+    """
+    if calendar is not None:
+        dates = calendar.recent(end_date, n)
+        if dates:
+            return dates
+    start = (pd.Timestamp(end_date) - pd.Timedelta(days=n * 2 + 30)).strftime('%Y%m%d')
+    cal = pro.trade_cal(exchange='SSE', start_date=start, end_date=end_date, is_open='1')
+    if cal is None or cal.empty:
+        return []
+    dates = sorted(cal['cal_date'].astype(str).unique())
+    return dates[-n:]
+
+
+# ===============================
+# 按交易日拉取全市场日线
+# ===============================
+def fetch_daily_by_trade_date(pro, trade_date):
+    """拉取某交易日全市场日线，失败或无数据返回空 DataFrame"""
+    df = pro.daily(trade_date=trade_date)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=DAILY_FIELDS)
+    cols = [c for c in DAILY_FIELDS if c in df.columns]
+    return df[cols]
+
+
+def load_market_daily(pro, trade_dates, cache, log=None, store=None, fetcher=None):
+    """
+    按交易日逐日拉取并拼接，cache 为 {trade_date: DataFrame}。
+    查找顺序：内存 cache → 本地仓库 store（可选）→ pro.daily(trade_date=...)，
+    新下载的交易日会追加写入 store；传入 fetcher 时缺失交易日并发下载。
+    只缓存非空结果：盘中当日日线尚未生成，返回空时不写缓存，收盘后会重新拉取。
+    结果从本次收集的局部字典拼接，不再回读 cache（按字节预算淘汰的缓存可能中途移除条目）
+    """
+    found, missing = {}, []
+    for d in trade_dates:
+        df = cache.get(d)
+        if df is not None:
+            found[d] = df
+            continue
+        if store is not None:
+            df = store.read_date(d)
+            if df is not None and not df.empty:
+                found[d] = cache[d] = df
+                continue
+        missing.append(d)
+
+    if missing:
+        if fetcher is not None:
+            results, errors = fetcher.run({d: (lambda d=d: fetch_daily_by_trade_date(pro, d)) for d in missing})
+        else:
+            results, errors = {}, {}
+            for d in missing:
+                try:
+                    results[d] = fetch_daily_by_trade_date(pro, d)
+                except Exception as e:
+                    errors[d] = e
+        if log:
+            for d, e in errors.items():
+                log("历史数据", f"{d} 全市场日线获取失败: {str(e)[:50]}")
+        for d in missing:
+            df = results.get(d)
+            if df is None or df.empty:
+                continue
+            found[d] = cache[d] = df
+            if store is not None:
+                try:
+                    store.write_date(d, df)
+                except Exception as e:
+                    if log:
+                        log("历史数据", f"{d} 写入本地仓库失败: {str(e)[:50]}")
+
+    frames = [found[d] for d in trade_dates if d in found]
+    if not frames:
+        return pd.DataFrame(columns=DAILY_FIELDS)
+    return pd.concat(frames, ignore_index=True)
+
+
+# ===============================
+# 股票 × 日期 面板
+# ===============================
+class HistoryPanel:
+    """
+    全市场日线面板。
+    - bars：按 (ts_code, trade_date) 排序的长表，单只股票切片与 pro.daily 返回格式一致
+    - aligned(field)：右对齐的 (股票 × 日期) 数组，每只股票的有效K线靠右排列，
+      停牌日不占位，左侧不足部分为 NaN，便于整表向量化计算
+    """
+
+    def __init__(self, bars):
+        bars = bars.drop_duplicates(subset=['ts_code', 'trade_date'])
+        bars = bars.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+        self.bars = bars
+        self.dates = sorted(bars['trade_date'].unique()) if not bars.empty else []
+        codes = bars['ts_code'].values
+        if len(codes):
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            stops = np.r_[starts[1:], len(codes)]
+            self.codes = codes[starts]
+        else:
+            starts = stops = np.array([], dtype=int)
+            self.codes = np.array([], dtype=object)
+        self._starts = starts
+        self._stops = stops
+        self._pos = {c: i for i, c in enumerate(self.codes)}
+        self._aligned = {}
+        self.missing = []  # 由 load 填写：请求了但没有数据的交易日
+
+    @classmethod
+    def load(cls, pro, trade_dates, cache, log=None, store=None, fetcher=None):
+        """
+        按交易日加载面板；下载失败或无数据的交易日记入 panel.missing。
+        面板按股票右对齐，缺失交易日会让不相邻的K线看起来相邻，调用方需用 missing_before 检查
+        """
+        panel = cls(load_market_daily(pro, trade_dates, cache, log=log, store=store, fetcher=fetcher))
+        have = set(panel.dates)
+        panel.missing = [d for d in trade_dates if d not in have]
+        return panel
+
+    def missing_before(self, date):
+        """date 之前（不含）缺失的已收盘交易日；盘中当日日线尚未生成不算缺失"""
+        return [d for d in self.missing if d < date]
+
+    def __contains__(self, ts_code):
+        return ts_code in self._pos
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def frame(self, ts_code, limit=120):
+        """单只股票最近 limit 根日线，升序；不存在时返回空 DataFrame"""
+        i = self._pos.get(ts_code)
+        if i is None:
+            return pd.DataFrame()
+        start = max(self._starts[i], self._stops[i] - limit)
+        return self.bars.iloc[start:self._stops[i]].reset_index(drop=True)
+
+    def lengths(self, codes=None):
+        """每只股票的有效K线根数"""
+        n = self._stops - self._starts
+        if codes is None:
+            return n
+        return np.array([n[self._pos[c]] if c in self._pos else 0 for c in codes])
+
+    def aligned(self, field, codes=None, limit=None):
+        """
+        右对齐数组 (股票 × 日期)。codes 指定行顺序（不在面板中的行全为 NaN），
+        limit 只保留每只股票最近 limit 根K线。
+        """
+        if field not in self._aligned:
+            width = len(self.dates)
+            out = np.full((len(self.codes), width), np.nan)
+            if width:
+                n = self._stops - self._starts
+                rows = np.repeat(np.arange(len(self.codes)), n)
+                within = np.arange(len(self.bars)) - np.repeat(self._starts, n)
+                cols = width - np.repeat(n, n) + within
+                out[rows, cols] = self.bars[field].to_numpy(dtype=float)
+            self._aligned[field] = out
+        arr = self._aligned[field]
+        if codes is not None:
+            idx = np.array([self._pos.get(c, -1) for c in codes], dtype=int)
+            arr = np.vstack([arr, np.full((1, arr.shape[1]), np.nan)])[idx]
+        if limit is not None and arr.shape[1] > limit:
+            arr = arr[:, -limit:]
+        return arr
+
+
+# ===============================
+# 单只股票日线区间（逐只回退获取时使用）
+# ===============================
+def _shift_day(date, days):
+    return (pd.Timestamp(date) + pd.Timedelta(days=days)).strftime('%Y%m%d')
+
+
+class HistoryRange:
+    """
+    单只股票已获取的连续日线 [start, end]（区间内全部K线，停牌日自然缺失），升序。
+    任意 end_date ≤ end 且回看足够的 (end_date, limit) 请求直接切片；
+    更宽的请求由 extend 只补缺失的一侧。对象不可变，可在多个会话间共享
+    """
+
+    def __init__(self, ts_code, frame, start, end, exhausted=False):
+        self.ts_code = ts_code
+        self.frame = frame
+        self.start = start
+        self.end = end
+        self.exhausted = exhausted  # start 之前已没有更早的K线（次新股 / 上市首日）
+
+    @classmethod
+    def fetch(cls, pro, ts_code, end_date, limit, fetcher=None):
+        """传入 fetcher（fetcher.ConcurrentFetcher）时经其限流与重试调用接口"""
+        df = _sorted_daily(_call(fetcher, pro.daily, ts_code=ts_code, end_date=end_date, limit=limit))
+        start = df['trade_date'].iloc[0] if not df.empty else end_date
+        return cls(ts_code, df, start, end_date, exhausted=len(df) < limit)
+
+    def _rows_until(self, end_date):
+        return int(np.searchsorted(self.frame['trade_date'].to_numpy(dtype=str), end_date, side='right'))
+
+    def covers(self, end_date, limit):
+        if end_date > self.end or (end_date < self.start and not self.exhausted):
+            return False
+        return self.exhausted or self._rows_until(end_date) >= limit
+
+    def slice(self, end_date, limit):
+        n = self._rows_until(end_date)
+        return self.frame.iloc[max(0, n - limit):n].reset_index(drop=True)
+
+    def extend(self, pro, end_date, limit, fetcher=None):
+        """补齐右侧（end 之后至 end_date）与左侧（回看不足的K线）后返回新的区间"""
+        frame, start, end, exhausted = self.frame, self.start, self.end, self.exhausted
+        if end_date > end:
+            right = _sorted_daily(_call(fetcher, pro.daily, ts_code=self.ts_code,
+                                        start_date=_shift_day(end, 1), end_date=end_date))
+            frame = _concat_bars(frame, right)
+            end = end_date
+        need = limit - int(np.searchsorted(frame['trade_date'].to_numpy(dtype=str), end_date, side='right'))
+        if need > 0 and not exhausted:
+            left = _sorted_daily(_call(fetcher, pro.daily, ts_code=self.ts_code,
+                                       end_date=_shift_day(start, -1), limit=need))
+            exhausted = len(left) < need
+            if not left.empty:
+                frame = _concat_bars(left, frame)
+                start = left['trade_date'].iloc[0]
+        return HistoryRange(self.ts_code, frame, start, end, exhausted)
+
+    def __sizeof__(self):
+        # 供共享缓存按字节预算估算占用
+        return int(self.frame.memory_usage(index=True, deep=True).sum())
+
+
+def _call(fetcher, fn, **kwargs):
+    return fetcher.call(fn, **kwargs) if fetcher is not None else fn(**kwargs)
+
+
+def _concat_bars(*frames):
+    frames = [f for f in frames if not f.empty]
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else (frames[0] if frames else _sorted_daily(None))
+
+
+def _sorted_daily(df):
+    if df is None or df.empty:
+        return pd.DataFrame(columns=DAILY_FIELDS)
+    return df.drop_duplicates('trade_date').sort_values('trade_date').reset_index(drop=True)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+后台行情工作线程（与 Streamlit 重跑解耦）
+===================================================================
+✅ 核心逻辑：
+   - 进程内常驻一个后台线程，交易时段内每隔 interval 秒拉取一次全市场快照
+   - 拉取结果发布到线程安全的 SnapshotStore，每次发布版本号 +1
+   - UI 只读取最新快照：点按钮、拖滑块、页面重跑都不会触发任何网络请求
+   - 休市时段线程空转等待，不发请求
+"""
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+Snapshot = namedtuple("Snapshot", ["version", "data", "fetched_at", "source"])
+
+
+class SnapshotStore:
+    """版本化快照仓库：publish 写入新版本，latest 读取最新版本"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest = None
+        self.attempts = 0
+        self.last_error = None
+        self.last_attempt = None
+
+    def publish(self, data, fetched_at, source="real_data"):
+        with self._cond:
+            version = self._latest.version + 1 if self._latest else 1
+            self._latest = Snapshot(version, data, fetched_at, source)
+            self.attempts += 1
+            self.last_error = None
+            self.last_attempt = fetched_at
+            self._cond.notify_all()
+            return version
+
+    def mark_failed(self, fetched_at, error):
+        with self._cond:
+            self.attempts += 1
+            self.last_error = error
+            self.last_attempt = fetched_at
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._latest
+
+    def wait_for_attempt(self, after_attempts=0, timeout=None):
+        """等待后台完成第 after_attempts 次之后的一轮拉取（成功或失败），超时返回当前最新快照"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.attempts > after_attempts, timeout)
+            return self._latest
+
+
+class MarketDataWorker(threading.Thread):
+    """
+    后台轮询线程。
+    fetch_fn(log) 返回快照 DataFrame（失败返回 None），只能做网络 I/O 和纯计算，
+    不能访问 st.session_state；is_trading_fn(now) 与 is_trading_day_and_time 签名一致。
+    """
+
+    def __init__(self, fetch_fn, is_trading_fn, store=None, interval=60, clock=None, max_logs=200):
+        super().__init__(name="market-data-worker", daemon=True)
+        self.fetch_fn = fetch_fn
+        self.is_trading_fn = is_trading_fn
+        self.store = store or SnapshotStore()
+        self.interval = interval
+        self.clock = clock or datetime.now
+        self.logs = deque(maxlen=max_logs)
+        self._wake = threading.Event()
+        self._halt = threading.Event()
+
+    def log(self, event, details):
+        self.logs.append({'timestamp': self.clock().strftime("%H:%M:%S"), 'event': event, 'details': details})
+
+    def trigger(self):
+        """不等下一个节拍，立即检查并拉取一次，用于『强制刷新数据』"""
+        self._wake.set()
+
+    def stop(self):
+        self._halt.set()
+        self._wake.set()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self._halt.is_set():
+            now = self.clock()
+            is_trading, _ = self.is_trading_fn(now)
+            if is_trading:
+                self._poll(now)
+            # 按固定节拍对齐，拉取耗时不会累积成漂移
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            if self._wake.wait(delay):
+                self._wake.clear()
+                next_tick = time.monotonic()
+
+    def _poll(self, now):
+        try:
+            df = self.fetch_fn(self.log)
+        except Exception as e:
+            df = None
+            self.log("后台行情", f"拉取异常: {str(e)[:100]}")
+        if df is not None and not df.empty:
+            version = self.store.publish(df, now)
+            self.log("后台行情", f"发布快照 v{version}，{len(df)} 条")
+        else:
+            self.store.mark_failed(now, "empty")
+            self.log("后台行情", "本轮拉取失败，保留上一版快照")
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+盘前孕线形态预计算
+===================================================================
+✅ 核心逻辑：
+   - 孕线形态只依赖已收盘的日线，开盘前用昨日及以前的K线扫描全市场一次即可
+   - 只保存「存在有效孕线」的股票：母线高低点、母线涨幅、子线量、5日均量、MA120 等
+   - 盘中每次刷新只需把实时快照与这张小表做一次连接，再列式评分，
+     开销与形态股数量成正比，不再逐只拉取历史
+✅ 用法：
+   TUSHARE_TOKEN=xxx python premarket.py [--date 20260105] [--min-gain 5] [--vol-ratio 1.5]
+   也可由 streamlit_app.py 在启动时（09:30前）自动触发
+"""
+import argparse
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+from bar_store import DailyBarStore
+from market_history import HistoryPanel, recent_trade_dates
+from providers import make_pro
+from strategy import DISPLAY_COLUMNS, FEATURE_COLUMNS, find_latest_pregnancy_batch, pregnancy_features
+from trade_calendar import TradeCalendar
+
+SETUP_DATASET = "setups"
+# 孕线识别用到的面板字段（market_history.PANEL_FIELDS 的子集）
+SETUP_FIELDS = ['open', 'high', 'low', 'close', 'vol']
+
+
+# ===============================
+# 形态表计算
+# ===============================
+def compute_setups(panel, min_gain=5, vol_ratio=1.5, lookback=10, limit=120, min_hist_len=25):
+    """
+    扫描面板中全部股票，返回以 ts_code 为索引的形态表（只含找到孕线的股票）。
+    列：FEATURE_COLUMNS + DISPLAY_COLUMNS + asof（所用最后一根K线日期）/ min_gain / vol_ratio
+    """
+    codes = list(panel.codes)
+    bars = {f: panel.aligned(f, codes=codes, limit=limit) for f in SETUP_FIELDS}
+    batch = find_latest_pregnancy_batch(
+        bars['open'], bars['high'], bars['low'], bars['close'], bars['vol'],
+        lookback=lookback, min_gain=min_gain, vol_ratio=vol_ratio
+    )
+    feats = pregnancy_features(batch, bars['close'], bars['vol'])
+    feats.index = pd.Index(codes, name='ts_code')
+    feats['mother_low'] = batch['mother_low'].to_numpy()
+    feats['child_body'] = ((batch['child_close'] - batch['child_open']) / batch['child_open'] * 100).to_numpy()
+    keep = (feats['mother_idx'] >= 0) & (feats['hist_len'] >= min_hist_len)
+    setups = feats[keep].copy()
+
+    # 日期只对命中的少数股票读取
+    mother_dates, child_dates = [], []
+    for code, k in setups['mother_idx'].items():
+        hist = panel.frame(code, limit)
+        mother_dates.append(hist['trade_date'].iloc[int(k)])
+        child_dates.append(hist['trade_date'].iloc[int(k) + 1])
+    setups['mother_date'] = mother_dates
+    setups['child_date'] = child_dates
+    setups['asof'] = panel.last_date
+    setups['min_gain'] = float(min_gain)
+    setups['vol_ratio'] = float(vol_ratio)
+    return setups[FEATURE_COLUMNS + DISPLAY_COLUMNS + ['asof', 'min_gain', 'vol_ratio']]
+
+
+# ===============================
+# 形态表读写（按交易日存入本地仓库）
+# ===============================
+def save_setups(store, trade_date, setups, min_gain=5, vol_ratio=1.5):
+    """
+    空表也要落盘，代表「今日无形态」而不是「尚未计算」；此时写入一行 ts_code 为空的占位行，
+    只用来记录计算参数，load_setups 读取时去掉
+    """
+    table = setups.reset_index()
+    if table.empty:
+        table = pd.DataFrame({'ts_code': [None], 'min_gain': [float(min_gain)], 'vol_ratio': [float(vol_ratio)]},
+                             columns=table.columns)
+    store.write_date(trade_date, table, dataset=SETUP_DATASET)
+
+
+def load_setups(store, trade_date, min_gain=5, vol_ratio=1.5):
+    """读取某交易日的形态表；不存在、参数不一致或未记录参数时返回 None"""
+    df = store.read_date(trade_date, dataset=SETUP_DATASET)
+    if df is None or df.empty or 'min_gain' not in df.columns:
+        return None
+    if df['min_gain'].iloc[0] != float(min_gain) or df['vol_ratio'].iloc[0] != float(vol_ratio):
+        return None
+    return df[df['ts_code'].notna()].set_index('ts_code')
+
+
+def build_premarket_setups(pro, store, trade_date, min_gain=5, vol_ratio=1.5, limit=120, fetcher=None, log=None,
+                           calendar=None):
+    """
+    为 trade_date 开盘前生成形态表：只使用 trade_date 之前的已收盘日线。
+    日线面板为空或缺少交易日时不落盘并返回 None（缺日会让不相邻的K线被当作相邻）
+    """
+    calendar = calendar or TradeCalendar(pro, store)
+    trade_dates = [d for d in recent_trade_dates(pro, trade_date, limit + 21, calendar=calendar) if d < trade_date]
+    panel = HistoryPanel.load(pro, trade_dates, {}, log=log, store=store, fetcher=fetcher)
+    if len(panel) == 0 or panel.missing:
+        if log:
+            log("盘前形态", f"{trade_date} 日线面板不完整（缺 {len(panel.missing)} 个交易日），形态表不落盘")
+        return None
+    setups = compute_setups(panel, min_gain=min_gain, vol_ratio=vol_ratio, limit=limit)
+    save_setups(store, trade_date, setups, min_gain, vol_ratio)
+    return setups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="盘前孕线形态预计算")
+    parser.add_argument("--date", default=datetime.now().strftime('%Y%m%d'), help="目标交易日 YYYYMMDD，默认今天")
+    parser.add_argument("--min-gain", type=float, default=5, help="母线最小涨幅(%%)")
+    parser.add_argument("--vol-ratio", type=float, default=1.5, help="母线放量倍数")
+    args = parser.parse_args(argv)
+
+    try:
+        pro = make_pro()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    def log(event, details):
+        print(f"[{event}] {details}")
+
+    setups = build_premarket_setups(pro, DailyBarStore(), args.date, args.min_gain, args.vol_ratio, log=log)
+    if setups is None:
+        print(f"❌ {args.date} 形态表未生成：历史日线不完整，请稍后重试", file=sys.stderr)
+        return 1
+    print(f"✅ {args.date} 形态表：{len(setups)} 只股票存在有效孕线（截至 {setups['asof'].iloc[0] if len(setups) else '-'}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
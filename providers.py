@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+可替换的行情数据源（Tushare / 本地离线替身）
+===================================================================
+✅ 核心逻辑：
+   - 应用与离线任务只通过 make_pro() 取得 pro 对象，接口与 ts.pro_api() 一致：
+     rt_k / daily / daily_basic / moneyflow_dc / stock_basic / index_daily / trade_cal
+   - MHF_DATA_PROVIDER=local 时返回 LocalPro：从夹具目录（每个接口一个 parquet/csv）
+     或合成行情生成器提供数据，无需网络和 token，结果可复现
+   - LocalPro 可配置人工延迟（模拟远端耗时）与按接口的每分钟调用上限
+     （超限时抛出与 Tushare 相同文案的异常），用于离线压测缓存、限流与并发逻辑
+✅ 环境变量：
+   MHF_DATA_PROVIDER   tushare（默认）/ local；local 时本地仓库、回放、指标默认落在 data_cache/local
+   MHF_FIXTURE_DIR     夹具目录；不设置时用合成行情
+   MHF_FAKE_STOCKS / MHF_FAKE_DAYS / MHF_FAKE_SEED   合成行情规模与随机种子（默认 5000 / 250 / 0）
+   MHF_FAKE_LATENCY    每次调用的平均延迟（秒，默认 0.2），MHF_FAKE_JITTER 随机抖动（秒，默认 0.1）
+   MHF_FAKE_RATE_LIMIT 每个接口每分钟调用上限（默认 500，0 表示不限）
+✅ 用法：
+   python providers.py --make-fixtures ./fixtures [--stocks 5000 --days 250 --seed 0]   把合成行情固化为夹具
+"""
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ENDPOINTS = ['rt_k', 'daily', 'daily_basic', 'moneyflow_dc', 'stock_basic', 'index_daily', 'trade_cal']
+INDEX_CODE = '000001.SH'
+
+
+def make_pro(token=None):
+    """按 MHF_DATA_PROVIDER 返回 pro 对象；Tushare 模式缺少 token 时抛出 ValueError"""
+    if os.environ.get("MHF_DATA_PROVIDER", "tushare") == "local":
+        return LocalPro.from_env()
+    token = token or os.environ.get("TUSHARE_TOKEN")
+    if not token:
+        raise ValueError("缺少 Tushare token：请设置环境变量 TUSHARE_TOKEN，或设置 MHF_DATA_PROVIDER=local 使用本地数据源")
+    import tushare as ts
+    ts.set_token(token)
+    return ts.pro_api()
+
+
+# ===============================
+# 本地替身
+# ===============================
+class LocalPro:
+    """
+    ts.pro_api() 的本地替身。tables 为 {接口名: DataFrame}，缺失的接口返回空表。
+    latency 可为秒数或 {接口名: 秒数}；rate_limit 为每个接口每分钟调用上限（0/None 不限）
+    """
+
+    def __init__(self, tables, latency=0.0, jitter=0.0, rate_limit=None, seed=0):
+        self.tables = {name: tables.get(name, pd.DataFrame()) for name in ENDPOINTS}
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.calls = Counter()
+        self.rejected = Counter()
+        self._recent = {name: deque() for name in ENDPOINTS}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    # ---------- 构造 ----------
+    @classmethod
+    def from_dir(cls, path, **kwargs):
+        tables = {}
+        for name in ENDPOINTS:
+            for ext, reader in (('.parquet', pd.read_parquet), ('.csv', lambda p: pd.read_csv(p, dtype=str))):
+                file = os.path.join(path, name + ext)
+                if os.path.exists(file):
+                    tables[name] = _normalize(reader(file))
+                    break
+        return cls(tables, **kwargs)
+
+    @classmethod
+    def synthetic(cls, n_stocks=5000, n_days=250, seed=0, end_date=None, **kwargs):
+        """用合成行情构造：最后一个交易日（默认今天）为盘中，只有 rt_k 快照，没有当日日线"""
+        from synthetic import synthetic_market
+        end_date = end_date or datetime.now().strftime('%Y%m%d')
+        bars, snap = synthetic_market(n_stocks, n_days, seed=seed, end_date=end_date)
+        today = pd.bdate_range(end=end_date, periods=1)[0].strftime('%Y%m%d')
+        return cls(synthetic_tables(bars, snap, today), seed=seed, **kwargs)
+
+    @classmethod
+    def from_env(cls):
+        kwargs = dict(
+            latency=float(os.environ.get("MHF_FAKE_LATENCY", "0.2")),
+            jitter=float(os.environ.get("MHF_FAKE_JITTER", "0.1")),
+            rate_limit=int(os.environ.get("MHF_FAKE_RATE_LIMIT", "500")),
+        )
+        fixture_dir = os.environ.get("MHF_FIXTURE_DIR")
+        if fixture_dir:
+            return cls.from_dir(fixture_dir, **kwargs)
+        return cls.synthetic(int(os.environ.get("MHF_FAKE_STOCKS", "5000")),
+                             int(os.environ.get("MHF_FAKE_DAYS", "250")),
+                             seed=int(os.environ.get("MHF_FAKE_SEED", "0")), **kwargs)
+
+    def save(self, path):
+        """把当前数据写成夹具目录，之后可用 from_dir 原样加载"""
+        os.makedirs(path, exist_ok=True)
+        for name, df in self.tables.items():
+            if not df.empty:
+                df.to_parquet(os.path.join(path, f"{name}.parquet"), index=False)
+
+    # ---------- 调用模拟 ----------
+    def _enter(self, endpoint):
+        """计数、限流与人工延迟；延迟在锁外执行，并发调用可以重叠"""
+        with self._lock:
+            self.calls[endpoint] += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                recent = self._recent[endpoint]
+                while recent and now - recent[0] >= 60:
+                    recent.popleft()
+                if len(recent) >= self.rate_limit:
+                    self.rejected[endpoint] += 1
+                    raise Exception(f"抱歉，您每分钟最多访问该接口{self.rate_limit}次")
+                recent.append(now)
+            base = self.latency.get(endpoint, 0.0) if isinstance(self.latency, dict) else self.latency
+            delay = max(0.0, base + self._rng.uniform(-self.jitter, self.jitter)) if base else 0.0
+        if delay:
+            time.sleep(delay)
+
+    @staticmethod
+    def _codes(df, ts_code):
+        if not ts_code or df.empty:
+            return df
+        return df[df['ts_code'].isin(ts_code.split(','))]
+
+    @staticmethod
+    def _dates(df, column, trade_date=None, start_date=None, end_date=None):
+        if df.empty:
+            return df
+        if trade_date:
+            df = df[df[column] == trade_date]
+        if start_date:
+            df = df[df[column] >= start_date]
+        if end_date:
+            df = df[df[column] <= end_date]
+        return df
+
+    @staticmethod
+    def _fields(df, fields):
+        if not fields or df.empty:
+            return df.reset_index(drop=True)
+        cols = [c for c in fields.split(',') if c in df.columns]
+        return df[cols].reset_index(drop=True)
+
+    # ---------- 接口 ----------
+    def rt_k(self, ts_code=None, **kwargs):
+        self._enter('rt_k')
+        df = self.tables['rt_k']
+        if ts_code and not df.empty:
+            patterns = ts_code.split(',')
+            df = df[df['ts_code'].map(lambda c: any(fnmatch.fnmatchcase(c, p) for p in patterns))]
+        return df.reset_index(drop=True)
+
+    def daily(self, ts_code=None, trade_date=None, start_date=None, end_date=None, limit=None, fields=None, **kwargs):
+        self._enter('daily')
+        df = self._dates(self._codes(self.tables['daily'], ts_code), 'trade_date', trade_date, start_date, end_date)
+        # 与 Tushare 一致：按日期倒序返回
+        df = df.sort_values(['trade_date', 'ts_code'], ascending=[False, True]) if not df.empty else df
+        if limit:
+            df = df.head(int(limit))
+        return self._fields(df, fields)
+
+    def daily_basic(self, ts_code=None, trade_date=None, fields=None, **kwargs):
+        self._enter('daily_basic')
+        df = self._dates(self._codes(self.tables['daily_basic'], ts_code), 'trade_date', trade_date)
+        return self._fields(df, fields)
+
+    def moneyflow_dc(self, ts_code=None, trade_date=None, start_date=None, end_date=None, **kwargs):
+        self._enter('moneyflow_dc')
+        df = self._dates(self._codes(self.tables['moneyflow_dc'], ts_code), 'trade_date',
+                         trade_date, start_date, end_date)
+        return df.reset_index(drop=True)
+
+    def stock_basic(self, fields=None, **kwargs):
+        self._enter('stock_basic')
+        return self._fields(self.tables['stock_basic'], fields)
+
+    def index_daily(self, ts_code=None, start_date=None, end_date=None, **kwargs):
+        self._enter('index_daily')
+        df = self._dates(self._codes(self.tables['index_daily'], ts_code), 'trade_date',
+                         None, start_date, end_date)
+        return (df.sort_values('trade_date', ascending=False) if not df.empty else df).reset_index(drop=True)
+
+    def trade_cal(self, exchange=None, start_date=None, end_date=None, is_open=None, **kwargs):
+        self._enter('trade_cal')
+        df = self._dates(self.tables['trade_cal'], 'cal_date', None, start_date, end_date)
+        if is_open is not None and not df.empty:
+            df = df[df['is_open'].astype(str) == str(is_open)]
+        return df.reset_index(drop=True)
+
+
+def _normalize(df):
+    """csv 夹具读入的是字符串，数值列转回数字；代码、日期、名称、行业保持字符串"""
+    text = {'ts_code', 'trade_date', 'cal_date', 'pretrade_date', 'name', 'industry', 'exchange', 'is_open'}
+    for col in df.columns:
+        if col not in text and df[col].dtype == object:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def synthetic_tables(bars, snap, today):
+    """把 synthetic_market 的 (日线, 快照) 展开成各接口的表"""
+    pre_close = (snap['最新价'] / (1 + snap['涨跌幅'] / 100)).round(2)
+    rt_k = pd.DataFrame({
+        'ts_code': snap['代码'], 'name': snap['名称'], 'pre_close': pre_close,
+        'open': pre_close, 'high': snap['最高价'], 'low': np.minimum(snap['最新价'], pre_close),
+        'close': snap['最新价'], 'vol': snap['成交量'], 'amount': snap['成交额'],
+    })
+    daily_basic = pd.DataFrame({
+        'ts_code': snap['代码'], 'trade_date': today,
+        'circ_mv': snap['流通市值'], 'turnover_rate': snap['换手率'],
+    })
+    moneyflow = pd.DataFrame({
+        'ts_code': snap['代码'], 'trade_date': today,
+        'net_amount_rate': snap['主力净流入占比'],
+        # 应用按 net_inflow_pct 读取主力净流入占比
+        'net_inflow_pct': snap['主力净流入占比'],
+    })
+    stock_basic = pd.DataFrame({'ts_code': snap['代码'], 'name': snap['名称'], 'industry': snap['所属行业']})
+    index = bars.groupby('trade_date')['pct_chg'].mean().reset_index()
+    index['close'] = (3000 * (1 + index['pct_chg'] / 100).cumprod()).round(2)
+    index.insert(0, 'ts_code', INDEX_CODE)
+    days = pd.date_range(pd.Timestamp(bars['trade_date'].min()) - pd.Timedelta(days=30),
+                         pd.Timestamp(today) + pd.Timedelta(days=30))
+    cal = pd.DataFrame({'exchange': 'SSE', 'cal_date': days.strftime('%Y%m%d'),
+                        'is_open': (days.weekday < 5).astype(int).astype(str)})
+    opened = cal['cal_date'].where(cal['is_open'] == '1')
+    cal['pretrade_date'] = opened.ffill().shift(1)
+    return {
+        'rt_k': rt_k, 'daily': bars.reset_index(drop=True), 'daily_basic': daily_basic,
+        'moneyflow_dc': moneyflow, 'stock_basic': stock_basic, 'index_daily': index, 'trade_cal': cal,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地离线数据源")
+    parser.add_argument("--make-fixtures", required=True, help="把合成行情写入该夹具目录")
+    parser.add_argument("--stocks", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end-date", default=None, help="盘中交易日 YYYYMMDD，默认今天")
+    args = parser.parse_args(argv)
+    pro = LocalPro.synthetic(args.stocks, args.days, seed=args.seed, end_date=args.end_date)
+    pro.save(args.make_fixtures)
+    print(f"已写入 {args.make_fixtures}：" + "，".join(f"{k} {len(v)} 行" for k, v in pro.tables.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+盘中快照录制与回放
+===================================================================
+✅ 录制：后台线程每发布一次快照（fetch_from_tushare 的输出），就追加写入
+   data_cache/replay/YYYYMMDD/HHMMSS.parquet（zstd 压缩，只追加不修改）
+✅ 回放：SnapshotReplayer 按 1×~100× 倍速把录制的快照重新喂给 get_stable_realtime_data，
+   同时提供回放时钟，整个 13:30-15:00 推荐流程可在夜间离线重现并计时
+✅ 用法：python replay.py --list                 列出已录制的交易日
+        python replay.py --date 20260105        查看某日录制的帧
+"""
+import argparse
+import bisect
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from bar_store import DEFAULT_ROOT
+
+REPLAY_ROOT = os.path.join(DEFAULT_ROOT, "replay")
+
+
+# ===============================
+# 录制
+# ===============================
+class SnapshotRecorder:
+    def __init__(self, root=REPLAY_ROOT):
+        self.root = root
+
+    def record(self, df, ts):
+        """追加一帧；同一秒重复录制时保留先写入的一帧"""
+        if df is None or df.empty:
+            return None
+        folder = os.path.join(self.root, ts.strftime('%Y%m%d'))
+        path = os.path.join(folder, f"{ts.strftime('%H%M%S')}.parquet")
+        if os.path.exists(path):
+            return path
+        os.makedirs(folder, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.reset_index(drop=True).to_parquet(tmp, index=False, compression="zstd")
+        os.replace(tmp, path)
+        return path
+
+
+def list_sessions(root=REPLAY_ROOT):
+    """已录制的交易日列表（升序）"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+
+def list_frames(trade_date, root=REPLAY_ROOT):
+    """某交易日录制的帧时间（'HHMMSS'，升序）"""
+    folder = os.path.join(root, trade_date)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f[:-len(".parquet")] for f in os.listdir(folder) if f.endswith(".parquet"))
+
+
+# ===============================
+# 回放
+# ===============================
+class SnapshotReplayer:
+    """
+    按倍速回放某交易日的录制快照。
+    clock() 返回回放时间（从 start 开始，按 speed 倍速推进）；
+    current() 返回回放时间点上最近的一帧 (帧时间, DataFrame)。
+    """
+
+    def __init__(self, trade_date, speed=1.0, start="133000", root=REPLAY_ROOT, tzinfo=None):
+        self.trade_date = trade_date
+        self.speed = float(speed)
+        self.root = root
+        self.tzinfo = tzinfo
+        self.frames = list_frames(trade_date, root)
+        self.start = self._to_datetime(start)
+        self._t0 = time.monotonic()
+        self._loaded = (None, None)    # 只保留当前帧 (帧名, DataFrame)，不随回放进度累积
+        self._lock = threading.Lock()
+
+    def _to_datetime(self, hhmmss):
+        dt = datetime.strptime(self.trade_date + hhmmss, '%Y%m%d%H%M%S')
+        return dt.replace(tzinfo=self.tzinfo) if self.tzinfo else dt
+
+    def restart(self, start=None, speed=None):
+        if start is not None:
+            self.start = self._to_datetime(start)
+        if speed is not None:
+            self.speed = float(speed)
+        self._t0 = time.monotonic()
+
+    def clock(self):
+        return self.start + timedelta(seconds=(time.monotonic() - self._t0) * self.speed)
+
+    @property
+    def finished(self):
+        return not self.frames or self.clock().strftime('%H%M%S') > self.frames[-1]
+
+    def frame_at(self, hhmmss):
+        """回放时间 hhmmss 时可见的最新一帧名，尚无帧时返回 None"""
+        i = bisect.bisect_right(self.frames, hhmmss)
+        return self.frames[i - 1] if i else None
+
+    def load(self, name):
+        with self._lock:
+            if self._loaded[0] != name:
+                df = pd.read_parquet(os.path.join(self.root, self.trade_date, f"{name}.parquet"))
+                self._loaded = (name, df)
+            return self._loaded[1]
+
+    def current(self):
+        name = self.frame_at(self.clock().strftime('%H%M%S'))
+        if name is None:
+            return None, None
+        return self._to_datetime(name), self.load(name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="盘中快照录制查看")
+    parser.add_argument("--list", action="store_true", help="列出已录制的交易日")
+    parser.add_argument("--date", help="查看某交易日录制的帧")
+    args = parser.parse_args(argv)
+    if args.date:
+        frames = list_frames(args.date)
+        print(f"{args.date}: {len(frames)} 帧" + (f"，{frames[0]} ~ {frames[-1]}" if frames else ""))
+    else:
+        for d in list_sessions():
+            print(f"{d}: {len(list_frames(d))} 帧")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
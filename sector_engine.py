@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+板块强度引擎（行业整数编码 + bincount 聚合 + 分钟级强度序列）
+===================================================================
+✅ 核心逻辑：
+   - 每个交易日只建一次「代码 → 行业编号」映射（只追加：新代码、新行业直接登记），
+     快照代码顺序不变时直接复用行号，不再每次 groupby
+   - 板块平均涨跌幅、成交额占比、涨停占比、成交额前 top_n 股票的 5 日动量，
+     全部是对行业编号的 np.bincount 加权求和，结果与 sector_strength_momentum 原口径一致
+   - 个股 5 日涨幅按代码保存当日有效（取自 T-1 及以前收盘价，盘中不变），
+     prepare() 只返回尚未计算过的前 top_n 代码，调用方只需补这几只
+   - 每次 compute(ts=...) 把各板块强度得分写入「分钟 × 板块」数组（240 行，float32），
+     同一分钟多次计算覆盖为最新值，换日原地清空
+✅ 用法：
+   engine = SectorEngine()
+   missing = engine.prepare(snapshot_df, '20261016')        # 需要补 5 日涨幅的代码
+   engine.set_momentum({code: pct_5d for ...})
+   strength = engine.compute(snapshot_df, ts=datetime.now(tz))
+   engine.history()                                          # 分钟 × 板块 强度得分
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from intraday_buffer import MINUTES, session_minute
+
+LIMIT_UP_PCT = 9.5
+STRENGTH_COLUMNS = ['涨跌幅', '成交额', '涨停家数', '股票数量', '资金占比', '涨停占比', '当日强度', '强度得分']
+
+
+def _pct_rank(x):
+    """等同 pd.Series.rank(pct=True)：并列取平均名次，NaN 保持 NaN"""
+    out = np.full(len(x), np.nan)
+    ok = ~np.isnan(x)
+    if ok.any():
+        _, inverse, counts = np.unique(x[ok], return_inverse=True, return_counts=True)
+        avg_rank = np.cumsum(counts) - (counts - 1) / 2
+        out[ok] = avg_rank[inverse] / ok.sum()
+    return out
+
+
+def _slot_label(slot):
+    """分钟槽 → 'HH:MM'（session_minute 的逆映射）"""
+    m = 570 + slot if slot < 120 else 780 + slot - 120
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+class SectorEngine:
+    def __init__(self, top_n=100, limit_up=LIMIT_UP_PCT, minutes=MINUTES):
+        """top_n：参与 5 日动量的成交额前 N 只；limit_up：涨跌幅 ≥ 该值计为涨停"""
+        self.top_n = top_n
+        self.limit_up = limit_up
+        self.minutes = minutes
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, trade_date=None):
+        with self._lock:
+            self.trade_date = trade_date
+            self.codes = pd.Index([], dtype=object)
+            self.sectors = pd.Index([], dtype=object)
+            self.name_rank = np.empty(0, dtype=np.int64)    # 按行业编号，行业名排序后的名次
+            self.sector_ids = np.empty(0, dtype=np.int64)   # 按代码行号，-1 表示无行业
+            self.pct_5d = np.empty(0)                       # 个股 5 日涨幅（%），NaN 表示无数据
+            self.known = np.empty(0, dtype=bool)            # 5 日涨幅是否已计算（含无数据）
+            self.strength = np.full((self.minutes, 0), np.nan, dtype=np.float32)
+            self._last_codes = self._last_rows = None
+
+    # ---------- 映射 ----------
+    def _register(self, codes, industries):
+        """登记新代码（及其新行业），调用方需持有锁"""
+        new = pd.Series(industries, index=codes)
+        new = new[~new.index.duplicated()]
+        names = pd.Index(pd.unique(new.dropna()), dtype=object)
+        extra = names[~names.isin(self.sectors)]
+        if len(extra):
+            self.sectors = self.sectors.append(extra)
+            self.name_rank = np.argsort(np.argsort(self.sectors.to_numpy(), kind='stable'), kind='stable')
+            pad = np.full((self.minutes, len(extra)), np.nan, dtype=np.float32)
+            self.strength = np.hstack([self.strength, pad])
+        self.codes = self.codes.append(pd.Index(new.index, dtype=object))
+        self.sector_ids = np.concatenate([self.sector_ids, self.sectors.get_indexer(new.to_numpy())])
+        self.pct_5d = np.concatenate([self.pct_5d, np.full(len(new), np.nan)])
+        self.known = np.concatenate([self.known, np.zeros(len(new), dtype=bool)])
+
+    def _rows(self, snap):
+        """快照行 → 映射行号；代码顺序与上次相同时直接复用。调用方需持有锁"""
+        codes = snap['代码'].to_numpy(dtype=object)
+        last = self._last_codes
+        if last is not None and len(last) == len(codes) and (last == codes).all():
+            return self._last_rows
+        rows = self.codes.get_indexer(codes)
+        new = rows < 0
+        if new.any():
+            self._register(codes[new], snap['所属行业'].to_numpy(dtype=object)[new])
+            rows = self.codes.get_indexer(codes)
+        self._last_codes, self._last_rows = codes, rows
+        return rows
+
+    def _top(self, amount):
+        """成交额前 top_n 的快照行位置（与 DataFrame.nlargest 相同：NaN 不参与，并列取靠前的行）"""
+        pos = np.flatnonzero(~np.isnan(amount))
+        return pos[np.argsort(-amount[pos], kind='stable')[:self.top_n]]
+
+    # ---------- 5 日动量 ----------
+    def prepare(self, snap, trade_date=None):
+        """换日时重建映射并登记快照代码，返回成交额前 top_n 中尚未计算 5 日涨幅的代码"""
+        if trade_date is not None and trade_date != self.trade_date:
+            self.reset(trade_date)
+        if snap.empty:
+            return []
+        amount = pd.to_numeric(snap['成交额'], errors='coerce').to_numpy(dtype=float)
+        with self._lock:
+            rows = self._rows(snap)[self._top(amount)]
+            return self.codes[rows[~self.known[rows]]].tolist()
+
+    def set_momentum(self, stock_5d):
+        """stock_5d：{代码: 5 日涨幅%}，NaN 表示无数据（同样记为已计算）"""
+        if not stock_5d:
+            return
+        with self._lock:
+            rows = self.codes.get_indexer(list(stock_5d))
+            ok = rows >= 0
+            self.pct_5d[rows[ok]] = np.asarray(list(stock_5d.values()), dtype=float)[ok]
+            self.known[rows[ok]] = True
+
+    # ---------- 聚合 ----------
+    def compute(self, snap, stock_5d=None, ts=None):
+        """
+        返回以 所属行业 为索引、按强度得分降序的板块表（列同 STRENGTH_COLUMNS）；
+        stock_5d 给出时先登记；ts 给出时把强度得分写入该分钟
+        """
+        if snap.empty or '所属行业' not in snap.columns:
+            return pd.DataFrame()
+        if ts is not None and ts.strftime('%Y%m%d') != self.trade_date:
+            self.reset(ts.strftime('%Y%m%d'))
+        with self._lock:
+            rows = self._rows(snap)
+        self.set_momentum(stock_5d)
+        with self._lock:
+            n = len(self.sectors)
+            sid = self.sector_ids[rows]
+            pct_5d = self.pct_5d[rows]
+            sectors, name_rank = self.sectors, self.name_rank
+        change = pd.to_numeric(snap['涨跌幅'], errors='coerce').to_numpy(dtype=float)
+        amount = pd.to_numeric(snap['成交额'], errors='coerce').to_numpy(dtype=float)
+
+        valid = sid >= 0
+        s = sid[valid]
+        count = np.bincount(s, minlength=n)
+        has_change = valid & ~np.isnan(change)
+        change_n = np.bincount(sid[has_change], minlength=n)
+        change_sum = np.bincount(sid[has_change], weights=change[has_change], minlength=n)
+        amount_sum = np.bincount(s, weights=np.nan_to_num(amount[valid]), minlength=n)
+        limit_n = np.bincount(s, weights=(change[valid] >= self.limit_up), minlength=n).astype(np.int64)
+
+        present = np.flatnonzero(count)
+        # 与 groupby 一致：板块按名称排序后再按强度得分排序，并列时次序相同
+        present = present[np.argsort(name_rank[present])]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_change = np.where(change_n[present] > 0, change_sum[present] / change_n[present], np.nan)
+        amount_share = amount_sum[present] / amount_sum[present].sum()
+        limit_share = limit_n[present] / max(1, limit_n[present].sum())
+        today = _pct_rank(mean_change) * 40 + _pct_rank(amount_share) * 40 + _pct_rank(limit_share) * 20
+
+        # 5 日动量：成交额前 top_n 中有 5 日涨幅的股票，按板块取平均后做百分位排名
+        top = self._top(amount)
+        top_sid, top_pct = sid[top], pct_5d[top]
+        has_pct = (top_sid >= 0) & ~np.isnan(top_pct)
+        mom_n = np.bincount(top_sid[has_pct], minlength=n)
+        mom_sum = np.bincount(top_sid[has_pct], weights=top_pct[has_pct], minlength=n)
+        has_mom = mom_n > 0
+        momentum = np.full(n, np.nan)
+        momentum[has_mom] = _pct_rank(mom_sum[has_mom] / mom_n[has_mom]) * 100
+        score = 0.4 * today + 0.6 * np.where(has_mom[present], momentum[present], today)
+
+        if ts is not None:
+            with self._lock:
+                self.strength[session_minute(ts), present] = score
+        table = pd.DataFrame({
+            '涨跌幅': mean_change,
+            '成交额': amount_sum[present],
+            '涨停家数': limit_n[present],
+            '股票数量': count[present],
+            '资金占比': amount_share,
+            '涨停占比': limit_share,
+            '当日强度': today,
+            '强度得分': score,
+        }, index=pd.Index(sectors[present], name='所属行业'))
+        return table.sort_values('强度得分', ascending=False)
+
+    # ---------- 分钟序列 ----------
+    def history(self, sectors=None):
+        """当日已记录分钟的强度得分（行：'HH:MM'，列：板块）；sectors 指定列"""
+        with self._lock:
+            strength = self.strength.astype(float)
+            names = self.sectors
+        written = np.flatnonzero(~np.isnan(strength).all(axis=1))
+        frame = pd.DataFrame(strength[written], columns=names,
+                             index=pd.Index([_slot_label(s) for s in written], name='时间'))
+        return frame if sectors is None else frame.reindex(columns=sectors)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+进程级共享缓存（跨浏览器会话 + 请求合并）
+===================================================================
+✅ 核心逻辑：
+   - 一个进程只有一份缓存，所有 Streamlit 会话共用（通过 st.cache_resource 创建）
+   - 键为元组，第一个元素是命名空间，如 ('panel', '20260105', 120)、('index', '20260105')
+   - get_or_fetch：同一个键同时只会有一次在途请求，其余会话等待同一结果（请求合并）
+   - 按命名空间统计 命中 / 未命中 / 合并等待 / 过期 / 等待超时自取 次数
+   - 按命名空间设置失效规则 (ttl 秒, 是否按交易日失效)：行业按周、已收盘日线永久、
+     市值换手/资金流/面板/形态表等按交易日；读取时遇到过期条目视为未命中，
+     换日时 evict_stale() 只清理真正过期的条目
+   - 按命名空间设置内存预算（字节，近似值）：超出后按最近最少使用（LRU）淘汰，
+     个股日线 hist、全市场日线 daily 默认有上限，长时间运行内存保持平稳
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+DAY = 86400
+# 行业（stock_basic）有效天数：内存缓存与本地整表快照共用，两处过期时间一致
+INDUSTRY_TTL_DAYS = 7
+# 命名空间 → (ttl 秒，None 表示不按时间过期；是否跨交易日失效)。未列出的命名空间永不过期
+DEFAULT_POLICIES = {
+    'daily': (None, False),        # 已收盘交易日的全市场日线，永不变化
+    'industry': (INDUSTRY_TTL_DAYS * DAY, False),  # stock_basic 行业，按周刷新
+    'basic': (None, True),         # daily_basic 市值/换手，当日有效
+    'moneyflow': (None, True),     # 资金流，当日有效
+    'panel': (None, True),
+    'hist': (None, True),
+    'index': (None, True),
+    'setups': (None, True),
+}
+
+MB = 1024 * 1024
+# 命名空间 → 内存预算（字节）。未列出的命名空间不限大小，也不统计占用
+DEFAULT_BUDGETS = {
+    'hist': 64 * MB,     # 逐只回退获取的个股日线
+    'daily': 512 * MB,   # 按交易日的全市场日线（约 1MB/日）
+}
+
+
+def estimate_bytes(value):
+    """近似估算对象占用内存（DataFrame 含字符串列的实际占用）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+# 等待在途请求的最长秒数：超时后等待者自行获取（如全市场面板首次构建需要较长时间）
+WAIT_TIMEOUT = 180
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished = False  # fetch_fn 正常返回或抛出 Exception；被 BaseException 中断时保持 False
+        self.value = None
+        self.error = None
+
+
+class SharedCache:
+    def __init__(self, policies=None, trade_date_fn=None, clock=time.time, budgets=None, wait_timeout=WAIT_TIMEOUT):
+        """
+        policies：覆盖 DEFAULT_POLICIES；trade_date_fn：返回当前交易日 'YYYYMMDD'，
+        为 None 时「按交易日失效」不生效；budgets：覆盖 DEFAULT_BUDGETS；
+        wait_timeout：等待在途请求的最长秒数，超时后自行获取
+        """
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.budgets = dict(DEFAULT_BUDGETS if budgets is None else budgets)
+        self.trade_date_fn = trade_date_fn
+        self.clock = clock
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._data = {}  # key → (value, 写入时间, 写入时的交易日)
+        self._inflight = {}
+        self._lru = defaultdict(OrderedDict)  # 有预算的命名空间：key → 字节数，按最近使用排序
+        self._bytes = defaultdict(int)
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'coalesced': 0, 'expired': 0, 'evicted': 0,
+                                           'fallbacks': 0})
+
+    @staticmethod
+    def _ns(key):
+        return key[0] if isinstance(key, tuple) else key
+
+    def _trade_date(self):
+        return self.trade_date_fn() if self.trade_date_fn is not None else None
+
+    def _is_stale(self, key, entry, now, trade_date):
+        ttl, per_trade_date = self.policies.get(self._ns(key), (None, False))
+        if ttl is not None and now - entry[1] > ttl:
+            return True
+        return per_trade_date and trade_date is not None and entry[2] != trade_date
+
+    def _lookup(self, key, trade_date, count=True):
+        """返回 (是否命中, 值)；过期条目顺带删除。调用方需持有锁，trade_date 在锁外取得"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        if self._is_stale(key, entry, self.clock(), trade_date):
+            self._remove(key)
+            if count:
+                self._stats[self._ns(key)]['expired'] += 1
+            return False, None
+        lru = self._lru.get(self._ns(key))
+        if lru is not None:
+            lru.move_to_end(key)
+        return True, entry[0]
+
+    def _size(self, key, value):
+        """有预算的命名空间才估算大小（在锁外调用）"""
+        return estimate_bytes(value) if self._ns(key) in self.budgets else None
+
+    def _store(self, key, value, trade_date, size=None):
+        self._remove(key)
+        self._data[key] = (value, self.clock(), trade_date)
+        if size is None:
+            return
+        ns = self._ns(key)
+        lru = self._lru[ns]
+        lru[key] = size
+        self._bytes[ns] += size
+        # 超出预算时淘汰最久未用的条目，至少保留刚写入的这一条
+        while self._bytes[ns] > self.budgets[ns] and len(lru) > 1:
+            oldest = next(iter(lru))
+            self._remove(oldest)
+            self._stats[ns]['evicted'] += 1
+
+    def _remove(self, key):
+        if self._data.pop(key, None) is None:
+            return
+        lru = self._lru.get(self._ns(key))
+        if lru is not None and key in lru:
+            self._bytes[self._ns(key)] -= lru.pop(key)
+
+    def get(self, key, default=None):
+        trade_date = self._trade_date()
+        with self._lock:
+            found, value = self._lookup(key, trade_date)
+            if found:
+                self._stats[self._ns(key)]['hits'] += 1
+                return value
+            self._stats[self._ns(key)]['misses'] += 1
+            return default
+
+    def peek(self, key, default=None):
+        """读取但不计入统计"""
+        trade_date = self._trade_date()
+        with self._lock:
+            found, value = self._lookup(key, trade_date, count=False)
+            return value if found else default
+
+    def set(self, key, value):
+        trade_date, size = self._trade_date(), self._size(key, value)
+        with self._lock:
+            self._store(key, value, trade_date, size)
+
+    def get_or_fetch(self, key, fetch_fn, cache_none=False):
+        """
+        命中直接返回；未命中时只有第一个调用者执行 fetch_fn，并发的其他调用者等待同一结果。
+        fetch_fn 抛出的异常会传给所有等待者，且不写入缓存；返回 None 时默认也不缓存。
+        等待超时，或发起者被 BaseException 中断（如 Streamlit 停止/重跑会话）时，等待者自行调用 fetch_fn。
+        """
+        ns = self._ns(key)
+        trade_date = self._trade_date()
+        with self._lock:
+            found, value = self._lookup(key, trade_date)
+            if found:
+                self._stats[ns]['hits'] += 1
+                return value
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _InFlight()
+                owner = True
+                self._stats[ns]['misses'] += 1
+            else:
+                owner = False
+                self._stats[ns]['coalesced'] += 1
+
+        if not owner:
+            if not flight.done.wait(self.wait_timeout) or not flight.finished:
+                with self._lock:
+                    self._stats[ns]['fallbacks'] += 1
+                return fetch_fn()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        size = None
+        try:
+            try:
+                flight.value = fetch_fn()
+                size = self._size(key, flight.value)
+            except Exception as e:
+                flight.error = e
+            flight.finished = True
+        finally:
+            # 无论如何都要移除在途标记并唤醒等待者，否则后续同键请求会永久阻塞
+            with self._lock:
+                if flight.finished and flight.error is None and (flight.value is not None or cache_none):
+                    self._store(key, flight.value, trade_date, size)
+                self._inflight.pop(key, None)
+            flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self, namespaces=None):
+        """清空指定命名空间（None 表示全部）"""
+        with self._lock:
+            for key in [k for k in self._data if namespaces is None or self._ns(k) in namespaces]:
+                self._remove(key)
+
+    def evict_stale(self):
+        """清理全部过期条目（换日时调用），返回各命名空间清理条数"""
+        now, trade_date = self.clock(), self._trade_date()
+        evicted = defaultdict(int)
+        with self._lock:
+            for key in [k for k, e in self._data.items() if self._is_stale(k, e, now, trade_date)]:
+                self._remove(key)
+                evicted[self._ns(key)] += 1
+                self._stats[self._ns(key)]['expired'] += 1
+        return dict(evicted)
+
+    def namespace(self, name):
+        """以 dict 方式访问某个命名空间，供 load_market_daily 等接受 cache 字典的函数使用"""
+        return _NamespaceView(self, name)
+
+    def stats(self):
+        with self._lock:
+            counts = defaultdict(int)
+            for key in self._data:
+                counts[self._ns(key)] += 1
+            names = set(self._stats) | set(counts)
+            return {
+                ns: dict(self._stats[ns], entries=counts[ns],
+                         bytes=self._bytes[ns] if ns in self.budgets else None,
+                         budget=self.budgets.get(ns),
+                         hit_rate=(self._stats[ns]['hits'] + self._stats[ns]['coalesced'])
+                         / max(1, self._stats[ns]['hits'] + self._stats[ns]['misses'] + self._stats[ns]['coalesced']))
+                for ns in sorted(names)
+            }
+
+
+class _NamespaceView:
+    def __init__(self, cache, name):
+        self._cache = cache
+        self._name = name
+
+    def __contains__(self, key):
+        return self._cache.peek((self._name, key)) is not None
+
+    def __getitem__(self, key):
+        value = self._cache.get((self._name, key))
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._cache.set((self._name, key), value)
+
+    def get(self, key, default=None):
+        return self._cache.get((self._name, key), default)
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+孕线突破策略核心函数（与 UI 无关，可被回测/预计算等离线任务复用）
+===================================================================
+✅ 单只股票版本：is_strong_mother / find_latest_pregnancy 等，逐根K线判断
+✅ 全市场批量版本：find_latest_pregnancy_batch，对 (股票 × 日期) 数组一次性向量化判断，
+   结果与单只版本逐只调用完全一致
+✅ 选股过滤 filter_stocks_by_rule、板块强度 sector_strength_momentum（SectorEngine 一次性计算）
+   同样不依赖 UI，盘中选股与历史回测共用同一套规则
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from sector_engine import SectorEngine
+
+
+# ===============================
+# 【新增】孕线选股辅助函数
+# ===============================
+def is_strong_mother(day, hist_df, lookback=20):
+    """
+    判断母线是否为标志性K线：
+    条件1：当日涨幅为近lookback日最大涨幅
+    条件2：当日成交量为近lookback日最大成交量
+    满足任一即可
+    """
+    if len(hist_df) < lookback + 1:
+        return False
+    # 取前lookback日（不含当日）数据
+    prev_data = hist_df.iloc[:-1].tail(lookback)
+    if len(prev_data) < lookback:
+        return False
+    # 涨幅比较
+    gain = (day['close'] - day['open']) / day['open'] * 100
+    max_gain = ((prev_data['close'] - prev_data['open']) / prev_data['open'] * 100).max()
+    # 成交量比较
+    max_vol = prev_data['vol'].max()
+    if gain >= max_gain or day['vol'] >= max_vol:
+        return True
+    return False
+
+def is_bullish(day, min_gain=5):
+    if day['close'] <= day['open']:
+        return False
+    gain = (day['close'] - day['open']) / day['open'] * 100
+    if gain < min_gain:
+        return False
+    return True
+
+def is_doji_or_bearish(day):
+    body = abs(day['close'] - day['open'])
+    range_ = day['high'] - day['low']
+    if range_ == 0:
+        return True
+    if day['close'] < day['open']:
+        return True
+    if body / range_ < 0.2:
+        return True
+    return False
+
+def find_latest_pregnancy(hist_df, lookback=10, min_gain=5, vol_ratio=1.5):
+    """
+    查找最近孕线组合，且母线为标志性K线（近20日最大涨幅或最大成交量）
+    """
+    if hist_df.empty or len(hist_df) < 20:  # 至少需要20日数据判断标志性
+        return None
+    hist_df = hist_df.copy()
+    hist_df['avg_vol_5'] = hist_df['vol'].rolling(5, min_periods=1).mean()
+    start = max(0, len(hist_df) - lookback - 2)
+    for i in range(len(hist_df)-1, start, -1):
+        day1 = hist_df.iloc[i-1]
+        day2 = hist_df.iloc[i]
+        # 母线：阳线且涨幅达标且放量
+        if day1['close'] <= day1['open']:
+            continue
+        gain1 = (day1['close'] - day1['open']) / day1['open'] * 100
+        if gain1 < min_gain:
+            continue
+        if day1['vol'] < day1['avg_vol_5'] * vol_ratio:
+            continue
+        # 【新增】母线必须为标志性K线
+        if not is_strong_mother(day1, hist_df.iloc[:i]):  # 只用之前的数据判断
+            continue
+        # 子线：阴线或十字星，且完全被母线包容
+        if not is_doji_or_bearish(day2):
+            continue
+        if day2['high'] > day1['high'] or day2['low'] < day1['low']:
+            continue
+        return {'mother_idx': i-1, 'mother': day1, 'child': day2}
+    return None
+
+# ===============================
+# 突破判断
+# ===============================
+def check_breakout(today_row, pregnancy_info, hist_df, 
+                   index_change=None, 
+                   max_deviation_from_ma120=0.30,
+                   breakout_threshold=1.01,
+                   vol_ratio_break=1.5,
+                   max_breakthrough_gain=8.0):
+    """
+    突破判断（仅技术面，大盘仅做提醒，不做拦截）
+    """
+    # ========== 已移除大盘强制拦截逻辑，改为UI提醒 ==========
+    
+    mother_high = pregnancy_info['mother']['high']
+    # 2. 价格突破
+    if today_row['最新价'] <= mother_high * breakout_threshold:
+        return False, None, None, "未突破"
+    breakthrough_gain = (today_row['最新价'] - mother_high) / mother_high * 100
+    if breakthrough_gain > max_breakthrough_gain:
+        return False, None, None, "追高风险"
+    
+    # 3. 放量确认
+    if len(hist_df) < 5:
+        return False, None, None, "历史数据不足"
+    avg_vol_5 = hist_df['vol'].tail(5).mean()
+    if avg_vol_5 == 0 or today_row['成交量'] < avg_vol_5 * vol_ratio_break:
+        return False, None, None, "量能不足"
+    vol_ratio = today_row['成交量'] / avg_vol_5
+    
+    # 4. 【新增】相对位置过滤：股价偏离120日均线不超过30%
+    if len(hist_df) >= 120:
+        ma120 = hist_df['close'].tail(120).mean()
+        if ma120 > 0:
+            deviation = (today_row['最新价'] - ma120) / ma120
+            if deviation > max_deviation_from_ma120:
+                return False, None, None, "位置过高"
+            # 低于均线过多也谨慎（可选，这里不拒绝）
+    return True, breakthrough_gain, vol_ratio, "突破有效"
+
+# ===============================
+# 【新增】全市场批量孕线识别（向量化）
+# ===============================
+def find_latest_pregnancy_batch(open_, high, low, close, vol,
+                                lookback=10, min_gain=5, vol_ratio=1.5, strong_lookback=20):
+    """
+    批量版 find_latest_pregnancy。
+    输入为右对齐的 (股票 × 日期) 数组（见 HistoryPanel.aligned）：每行的有效K线靠右，
+    左侧不足部分为 NaN。逐行结果与对同一段K线调用 find_latest_pregnancy 完全一致。
+    返回 DataFrame（行序与输入一致）：
+      mother_idx  母线在该股有效K线中的位置（与单只版本的 mother_idx 相同），无则 -1
+      mother_col  母线在输入数组中的列号，无则 -1
+      mother_open/high/low/close/vol、mother_gain、child_open/high/low/close/vol
+    """
+    S, T = close.shape
+    n = (~np.isnan(close)).sum(axis=1)
+    mother_col = np.full(S, -1, dtype=int)
+
+    # 候选母线只在最近 lookback+1 根内，右对齐后所有股票的候选列相同
+    first = max(strong_lookback, T - lookback - 2)
+    if S and T - 1 > first:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gain = (close - open_) / open_ * 100
+            cols = np.arange(first, T - 1)
+            c_cols = cols + 1
+            m_local = cols[None, :] - (T - n)[:, None]
+
+            # 先做逐根即可判断的廉价条件：母线阳线且涨幅达标，子线为阴线/十字星且被包容
+            g = gain[:, cols]
+            ok = (n[:, None] >= 20) & (m_local >= strong_lookback)
+            ok &= close[:, cols] > open_[:, cols]
+            ok &= ~(g < min_gain)
+            body = np.abs(close[:, c_cols] - open_[:, c_cols])
+            range_ = high[:, c_cols] - low[:, c_cols]
+            ok &= (range_ == 0) | (close[:, c_cols] < open_[:, c_cols]) | (body / range_ < 0.2)
+            ok &= ~(high[:, c_cols] > high[:, cols]) & ~(low[:, c_cols] < low[:, cols])
+
+            # 放量与标志性K线只对仍有候选的股票计算
+            sel = np.flatnonzero(ok.any(axis=1))
+            if len(sel):
+                v = vol[sel]
+                # 与单只版本相同的 rolling 实现，保证浮点结果逐位一致
+                avg_vol_5 = pd.DataFrame(v.T).rolling(5, min_periods=1).mean().to_numpy().T
+                sub = ok[sel]
+                sub &= ~(v[:, cols] < avg_vol_5[:, cols] * vol_ratio)
+
+                # 标志性K线：涨幅或成交量不低于之前 strong_lookback 日的最大值
+                win = np.lib.stride_tricks.sliding_window_view
+                prev_gain = win(gain[sel], strong_lookback, axis=1)[:, cols - strong_lookback]
+                prev_vol = win(v, strong_lookback, axis=1)[:, cols - strong_lookback]
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    max_gain = np.nanmax(prev_gain, axis=2)
+                    max_vol = np.nanmax(prev_vol, axis=2)
+                sub &= (g[sel] >= max_gain) | (v[:, cols] >= max_vol)
+                ok[sel] = sub
+
+        # 取最近的一组（列号最大者）
+        has = ok.any(axis=1)
+        last = ok.shape[1] - 1 - np.argmax(ok[:, ::-1], axis=1)
+        mother_col[has] = cols[last[has]]
+
+    found = mother_col >= 0
+    rows = np.arange(S)
+    mc = np.where(found, mother_col, 0)
+    cc = np.where(found, mother_col + 1, 0)
+    out = pd.DataFrame({
+        'mother_idx': np.where(found, mother_col - (T - n), -1),
+        'mother_col': mother_col,
+    })
+    for name, arr in (('open', open_), ('high', high), ('low', low), ('close', close), ('vol', vol)):
+        if S and T:
+            out[f'mother_{name}'] = np.where(found, arr[rows, mc], np.nan)
+            out[f'child_{name}'] = np.where(found, arr[rows, cc], np.nan)
+        else:
+            out[f'mother_{name}'] = np.nan
+            out[f'child_{name}'] = np.nan
+    out['mother_gain'] = (out['mother_close'] - out['mother_open']) / out['mother_open'] * 100
+    return out
+
+
+# ===============================
+# 【新增】突破判断所需的每股特征
+# ===============================
+FEATURE_COLUMNS = ['hist_len', 'mother_idx', 'mother_high', 'mother_gain', 'child_vol', 'avg_vol_5', 'ma120']
+# 候选展示用的附加字段（批量版由调用方按需补充）
+DISPLAY_COLUMNS = ['mother_low', 'mother_date', 'child_date', 'child_body']
+
+
+def pregnancy_features(batch, close, vol):
+    """
+    由 find_latest_pregnancy_batch 的结果和同一组右对齐 close/vol 数组，
+    计算 score_breakouts 需要的每股特征（行序与输入一致）
+    """
+    n = (~np.isnan(close)).sum(axis=1)
+    last5 = vol[:, -5:] if vol.shape[1] >= 5 else np.full((len(vol), 5), np.nan)
+    last120 = close[:, -120:] if close.shape[1] >= 120 else np.full((len(close), 120), np.nan)
+    return pd.DataFrame({
+        'hist_len': n,
+        'mother_idx': batch['mother_idx'].to_numpy(),
+        'mother_high': batch['mother_high'].to_numpy(),
+        'mother_gain': batch['mother_gain'].to_numpy(),
+        'child_vol': batch['child_vol'].to_numpy(),
+        # 与 tail(5).mean() / tail(120).mean() 相同的求和顺序
+        'avg_vol_5': np.where(n >= 5, last5.sum(axis=1) / 5, np.nan),
+        'ma120': np.where(n >= 120, last120.sum(axis=1) / 120, np.nan),
+    })
+
+
+def pregnancy_features_from_hist(hist_df, pregnancy_info):
+    """单只股票版本：由历史K线和 find_latest_pregnancy 结果生成一行特征"""
+    n = len(hist_df)
+    row = dict.fromkeys(FEATURE_COLUMNS + DISPLAY_COLUMNS, np.nan)
+    row['hist_len'] = n
+    row['mother_idx'] = -1
+    if n >= 5:
+        row['avg_vol_5'] = hist_df['vol'].tail(5).mean()
+    if n >= 120:
+        row['ma120'] = hist_df['close'].tail(120).mean()
+    if pregnancy_info is not None:
+        mother = pregnancy_info['mother']
+        child = pregnancy_info['child']
+        row['mother_idx'] = pregnancy_info['mother_idx']
+        row['mother_high'] = mother['high']
+        row['mother_low'] = mother['low']
+        row['mother_gain'] = (mother['close'] - mother['open']) / mother['open'] * 100
+        row['mother_date'] = mother['trade_date']
+        row['child_vol'] = child['vol']
+        row['child_date'] = child['trade_date']
+        row['child_body'] = (child['close'] - child['open']) / child['open'] * 100
+    return row
+
+
+# ===============================
+# 【新增】向量化突破判断与综合评分
+# ===============================
+def sector_scores(snap, sector_strength):
+    """板块强度得分（0~30分）：按所属行业映射强度得分，并以最强板块为满分归一"""
+    score = np.zeros(len(snap))
+    if sector_strength is not None and not sector_strength.empty:
+        max_raw = sector_strength['强度得分'].max()
+        if max_raw > 0:
+            raw = snap['所属行业'].map(sector_strength['强度得分']).to_numpy(dtype=float)
+            with np.errstate(invalid='ignore'):
+                score = np.nan_to_num(raw / max_raw * 30)
+    return score
+
+
+def score_breakouts(snap, feats, sector_strength=None, index_change=None, late_session=False,
+                    max_deviation_from_ma120=0.30,
+                    breakout_threshold=1.01,
+                    vol_ratio_break=1.5,
+                    max_breakthrough_gain=8.0,
+                    min_hist_len=25,
+                    sector_score=None):
+    """
+    check_breakout + 增强评分的列式版本，一次处理全部候选股。
+    snap：实时快照（需含 最新价/成交量/最高价/涨跌幅/所属行业，可选 主力净流入占比）
+    feats：与 snap 行序一致的特征表（pregnancy_features / pregnancy_features_from_hist）
+    index_change：大盘涨跌幅，可为标量或与 snap 行序一致的数组（多日数据一次评分）
+    late_session：是否处于尾盘加分时段（14:30后）
+    sector_score：预先算好的板块强度得分（sector_scores 的结果），给出时忽略 sector_strength
+    返回与 snap 同索引的 DataFrame：突破有效、拒绝原因、突破幅度、放量倍数、
+    偏离120日均线、板块强度得分、额外加分、综合得分
+    """
+    price = snap['最新价'].to_numpy(dtype=float)
+    volume = snap['成交量'].to_numpy(dtype=float)
+    hist_len = feats['hist_len'].to_numpy()
+    mother_high = feats['mother_high'].to_numpy(dtype=float)
+    mother_gain = feats['mother_gain'].to_numpy(dtype=float)
+    avg_vol_5 = feats['avg_vol_5'].to_numpy(dtype=float)
+    ma120 = feats['ma120'].to_numpy(dtype=float)
+    child_vol = feats['child_vol'].to_numpy(dtype=float)
+    has_pregnancy = feats['mother_idx'].to_numpy() >= 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        break_gain = (price - mother_high) / mother_high * 100
+        vol_ratio = volume / avg_vol_5
+        deviation = (price - ma120) / ma120
+
+        # 拒绝原因按 check_breakout 的判断顺序排列，取第一个命中的
+        conditions = [
+            hist_len < min_hist_len,
+            ~has_pregnancy,
+            price <= mother_high * breakout_threshold,
+            break_gain > max_breakthrough_gain,
+            hist_len < 5,
+            (avg_vol_5 == 0) | (volume < avg_vol_5 * vol_ratio_break),
+            (hist_len >= 120) & (ma120 > 0) & (deviation > max_deviation_from_ma120),
+        ]
+        reasons = ['历史数据不足', '无孕线', '未突破', '追高风险', '历史数据不足', '量能不足', '位置过高']
+        rejected = np.logical_or.reduce(conditions)
+        reject_reason = np.select(conditions, reasons, default='突破有效')
+
+        # 板块强度得分（0~30分）
+        if sector_score is None:
+            sector_score = sector_scores(snap, sector_strength)
+        else:
+            sector_score = np.asarray(sector_score, dtype=float)
+
+        # 四大加分因子
+        extra_score = np.zeros(len(snap))
+        if '主力净流入占比' in snap.columns:
+            moneyflow = snap['主力净流入占比'].to_numpy(dtype=float)
+            extra_score += np.where(moneyflow > 2.0, 10, np.where(moneyflow > 1.0, 5, 0))
+        shrink_ok = (hist_len >= 5) & (avg_vol_5 > 0)
+        extra_score += np.where(shrink_ok & (child_vol < avg_vol_5 * 0.5), 8,
+                                np.where(shrink_ok & (child_vol < avg_vol_5 * 0.7), 4, 0))
+        if index_change is not None:
+            relative_strength = snap['涨跌幅'].to_numpy(dtype=float) - index_change
+            extra_score += np.where(relative_strength > 1.0, 6, np.where(relative_strength > 0.5, 3, 0))
+        if late_session:
+            extra_score += np.where(price > snap['最高价'].to_numpy(dtype=float) * 0.98, 5, 0)
+
+        base_score = break_gain * 25 + vol_ratio * 25 + mother_gain * 20 + sector_score
+        dev_ma120 = np.where((hist_len >= 120) & (ma120 > 0), deviation * 100, np.nan)
+
+    return pd.DataFrame({
+        '突破有效': ~rejected,
+        '拒绝原因': reject_reason,
+        '突破幅度': np.where(rejected, np.nan, break_gain),
+        '放量倍数': np.where(rejected, np.nan, vol_ratio),
+        '偏离120日均线': dev_ma120,
+        '板块强度得分': sector_score,
+        '额外加分': extra_score,
+        '综合得分': np.where(rejected, np.nan, base_score + extra_score),
+    }, index=snap.index)
+
+
+# ===============================
+# 过滤ST和异常
+# ===============================
+def filter_stocks_by_rule(df):
+    if df.empty:
+        return df
+    filtered = df.copy()
+    if '名称' in filtered.columns:
+        filtered = filtered[~filtered['名称'].str.contains('ST', na=False)]
+    if '涨跌幅' in filtered.columns:
+        filtered = filtered[filtered['涨跌幅'] <= 9.5]
+    if '最高涨幅' in filtered.columns and '涨跌幅' in filtered.columns:
+        filtered = filtered[~((filtered['最高涨幅'] > 9.5) & (filtered['涨跌幅'] < 7))]
+    if not filtered.empty and '成交额' in filtered.columns:
+        threshold = max(filtered['成交额'].quantile(0.1), 2e7)
+        filtered = filtered[filtered['成交额'] > threshold]
+    return filtered
+
+
+# ===============================
+# 板块强度（当日强度 40% + 5日动量 60%）
+# ===============================
+def sector_strength_momentum(df_today, stock_5d):
+    """
+    df_today：全市场快照（需含 代码/所属行业/涨跌幅/成交额）
+    stock_5d：{代码: 近5日涨幅%}，只需覆盖成交额前100的股票，由调用方从历史K线计算
+    一次性计算（回测逐日调用）；盘中连续刷新请复用 SectorEngine，映射与 5 日涨幅按日保留
+    """
+    return SectorEngine(top_n=100).compute(df_today, stock_5d)
@@ -10,7 +10,7 @@
        ① 大盘环境：若上证跌幅<-1%，给出红色预警，但**不拦截**选股
        ② 相对位置：当前股价偏离120日均线不超过30%（防止高位接盘）
    - 全市场选股，不再强制板块过滤，改为板块强度加分（0~30分）
-   - 交易时段内每1分钟自动刷新选股，动态更新候选列表
+   - 交易时段内每1分钟自动刷新选股（st.fragment 定时器只重跑行情与选股区域），动态更新候选列表
    - 每日推荐3-5只，按综合得分排序，并在UI醒目提示风险
 ✅ 增强因子：
    ① 主力资金净流入加分（>2%+10分，>1%+5分）
@@ -18,6 +18,7 @@
    ③ 相对大盘强度加分（跑赢大盘>1%+6分，>0.5%+3分）
    ④ 尾盘突破加分（14:30后且接近最高价+5分）
 """
+import os
 import sys
 import streamlit as st
 
@@ -26,16 +27,33 @@ try:
     import tushare as ts
     st.success("✅ tushare 导入成功")
 except ImportError as e:
-    st.error(f"❌ 导入失败: {e}")
-    st.stop()
+    # 本地离线数据源（MHF_DATA_PROVIDER=local）不需要 tushare
+    if os.environ.get("MHF_DATA_PROVIDER", "tushare") != "local":
+        st.error(f"❌ 导入失败: {e}")
+        st.stop()
 import streamlit as st
 import pandas as pd
 import numpy as np
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 import pytz
 import warnings
-import tushare as ts
+from market_history import HistoryPanel, HistoryRange, recent_trade_dates
+from bar_store import DailyBarStore
+from fetcher import ConcurrentFetcher, RateLimiter
+from market_worker import MarketDataWorker
+from shared_cache import INDUSTRY_TTL_DAYS, SharedCache
+from trade_calendar import TradeCalendar
+from instrumentation import InstrumentedPro, Metrics
+from incremental_scan import IncrementalScorer
+from intraday_buffer import IntradayBuffer
+from sector_engine import SectorEngine
+from strategy import filter_stocks_by_rule, find_latest_pregnancy, pregnancy_features_from_hist
+from providers import make_pro
+from premarket import compute_setups, load_setups, save_setups
+from backtest import BACKTEST_TABLE, summarize as summarize_backtest
+from replay import SnapshotRecorder, SnapshotReplayer, list_sessions
 
 warnings.filterwarnings('ignore')
 st.set_page_config(page_title="尾盘博弈 6.3 · 孕线突破增强版（1分钟刷新）", layout="wide")
@@ -49,8 +67,63 @@ except KeyError:
     st.error("未找到 Tushare Token，请在 Secrets 中设置 `tushare_token`")
     st.stop()
 
-ts.set_token(TUSHARE_TOKEN)
-pro = ts.pro_api()
+# 本地列式仓库：已收盘日线、行业表落盘，重启/跨日/强制刷新后无需重新下载
+bar_store = DailyBarStore()
+
+# 全市场模式单次选股（过滤+形态连接+评分）的耗时预算，单位秒
+FULL_SCAN_BUDGET_SEC = 2.0
+
+# 形态表不可用时逐只获取历史的股票数上限（按成交额取前N只），避免全市场逐只调用接口
+FALLBACK_SCAN_LIMIT = 200
+
+# 自动刷新间隔（秒）：定时器只重跑行情与选股区域
+SCAN_REFRESH_SECONDS = 60
+
+# 当日首个快照尚未就绪时：脚本线程最多等待的秒数，以及行情区域的轮询间隔（秒）
+SNAPSHOT_WAIT_SEC = 3
+SNAPSHOT_POLL_SECONDS = 5
+
+# 所有 Tushare 请求共用的每分钟调用预算（与账户权限一致，可用环境变量覆盖）
+TUSHARE_CALLS_PER_MINUTE = int(os.environ.get("TUSHARE_CALLS_PER_MINUTE", "500"))
+
+@st.cache_resource
+def get_fetcher():
+    """进程内唯一的并发请求器，所有会话共用同一个限流预算"""
+    return ConcurrentFetcher(RateLimiter(TUSHARE_CALLS_PER_MINUTE), max_workers=8)
+
+fetcher = get_fetcher()
+
+@st.cache_resource
+def get_shared_cache():
+    """
+    进程内唯一的共享缓存：多个浏览器会话共用历史面板、个股日线、指数、行业/市值/资金流等数据。
+    各命名空间按 shared_cache.DEFAULT_POLICIES 过期（行业按月、已收盘日线永久、其余按交易日）
+    """
+    return SharedCache(trade_date_fn=lambda: datetime.now(tz).strftime('%Y%m%d'))
+
+shared_cache = get_shared_cache()
+
+@st.cache_resource
+def get_metrics():
+    """进程内唯一的运行指标：阶段耗时、接口调用、缓存命中，导出到 data_cache/metrics"""
+    return Metrics(cache_stats=shared_cache.stats)
+
+metrics = get_metrics()
+
+# 数据源：默认 Tushare；MHF_DATA_PROVIDER=local 时使用本地离线替身（无需网络，可配置延迟与限流）
+# 包装后每次接口调用都按接口名计入调用次数与耗时
+@st.cache_resource
+def get_pro():
+    return InstrumentedPro(make_pro(TUSHARE_TOKEN), metrics)
+
+pro = get_pro()
+
+@st.cache_resource
+def get_trade_calendar():
+    """进程内唯一的交易日历：落盘缓存，节假日判断与前后交易日推算不再调用接口"""
+    return TradeCalendar(pro, bar_store)
+
+trade_calendar = get_trade_calendar()
 
 try:
     from tushare import __version__ as ts_version
@@ -77,18 +150,19 @@ default_session_vars = {
     "last_data_fetch_time": None,
     "data_fetch_attempts": 0,
     "a_code_list": None,
-    "hist_data_cache": {},
-    "stock_industry_cache": {},
     "convergence_records": [],
     "backup_picks": [],
     "candidate_df": pd.DataFrame(),
     "final_locked": False,
-    "stock_basic_cache": {},
-    "moneyflow_cache": {},
-    "index_cache": {},
     "top_candidate": None,
     "last_refresh_time": None,
     "force_refresh": False,
+    "snapshot_version": None,
+    "scan_inputs": None,
+    "scan_score_params": None,
+    "scan_timing": None,
+    "scorer": None,
+    "sector_engine": None,
 }
 
 for key, default in default_session_vars.items():
@@ -105,6 +179,31 @@ def add_log(event, details):
     if len(st.session_state.logs) > 30:
         st.session_state.logs = st.session_state.logs[-30:]
 
+# 回放期间的推荐只属于被回放的交易日：开始回放时暂存实盘推荐并清空，结束回放时恢复
+PICK_STATE_KEYS = ("morning_pick", "final_pick", "locked", "final_locked", "backup_picks")
+# 选股结果同样区分实盘与回放，切换时清空并重新选股，避免回放的候选被实盘自动推荐使用
+SCAN_STATE_KEYS = ("candidate_df", "top_candidate", "scan_inputs", "last_refresh_time")
+
+def _reset_keys(keys):
+    for key in keys:
+        default = default_session_vars[key]
+        st.session_state[key] = default.copy() if hasattr(default, 'copy') else default
+
+def start_replay(replayer):
+    if "live_picks" not in st.session_state:
+        st.session_state.live_picks = {k: st.session_state[k] for k in PICK_STATE_KEYS}
+    _reset_keys(PICK_STATE_KEYS + SCAN_STATE_KEYS)
+    st.session_state.replayer = replayer
+    st.session_state.replay_frame = None
+
+def stop_replay():
+    st.session_state.replayer = None
+    live_picks = st.session_state.pop("live_picks", None)
+    if live_picks is not None:
+        for key, value in live_picks.items():
+            st.session_state[key] = value
+    _reset_keys(SCAN_STATE_KEYS)
+
 def is_trading_day_and_time(now=None):
     if now is None:
         now = datetime.now(tz)
@@ -113,6 +212,8 @@ def is_trading_day_and_time(now=None):
     minute = now.minute
     if weekday >= 5:
         return False, "周末休市"
+    if not trade_calendar.is_open(now.strftime('%Y%m%d')):
+        return False, "节假日休市"
     if (hour == 9 and minute >= 30) or (10 <= hour < 11) or (hour == 11 and minute <= 30):
         return True, "交易时间"
     if (13 <= hour < 15) or (hour == 15 and minute == 0):
@@ -126,24 +227,24 @@ def get_index_change(trade_date=None):
     """获取上证指数当日涨跌幅，若获取失败返回None"""
     if trade_date is None:
         trade_date = datetime.now(tz).strftime('%Y%m%d')
-    cache_key = f"index_{trade_date}"
-    if cache_key in st.session_state.index_cache:
-        return st.session_state.index_cache[cache_key]
-    try:
-        df = pro.index_daily(ts_code='000001.SH', start_date=trade_date, end_date=trade_date)
-        if df is not None and not df.empty:
-            change = df.iloc[0]['pct_chg']  # 涨跌幅百分比
-            st.session_state.index_cache[cache_key] = change
-            return change
-        else:
-            # 若当日无数据，尝试前一日
-            prev_date = (datetime.strptime(trade_date, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
-            df = pro.index_daily(ts_code='000001.SH', start_date=prev_date, end_date=prev_date)
+
+    def fetch():
+        if trade_calendar.is_open(trade_date):
+            df = fetcher.call(pro.index_daily, ts_code='000001.SH', start_date=trade_date, end_date=trade_date)
             if df is not None and not df.empty:
-                change = df.iloc[0]['pct_chg']
-                st.session_state.index_cache[cache_key] = change
-                return change
+                return df.iloc[0]['pct_chg']  # 涨跌幅百分比
+        # 若当日无数据（盘中尚未收盘或休市），取前一交易日
+        prev_date = trade_calendar.prev(trade_date)
+        if prev_date is None:
             return None
+        df = fetcher.call(pro.index_daily, ts_code='000001.SH', start_date=prev_date, end_date=prev_date)
+        if df is not None and not df.empty:
+            return df.iloc[0]['pct_chg']
+        return None
+
+    try:
+        # 获取失败（None）不写缓存，下次重试
+        return shared_cache.get_or_fetch(('index', trade_date), fetch)
     except Exception as e:
         add_log("大盘指数", f"获取失败: {str(e)[:50]}")
         return None
@@ -151,90 +252,108 @@ def get_index_change(trade_date=None):
 # ===============================
 # 获取流通市值、换手率（保留原功能，用于显示）
 # ===============================
-def batch_get_stock_basic_info(ts_codes, trade_date):
-    cache = st.session_state.stock_basic_cache
-    need = [c for c in ts_codes if c not in cache]
-    if need:
-        try:
-            for i in range(0, len(need), 100):
-                batch = need[i:i+100]
-                df = pro.daily_basic(ts_code=','.join(batch), trade_date=trade_date, fields='ts_code,circ_mv,turnover_rate')
-                if df is not None and not df.empty:
-                    for _, row in df.iterrows():
-                        code = row['ts_code']
-                        cache[code] = {
-                            'circ_mv': row['circ_mv'] if pd.notna(row['circ_mv']) else 0,
-                            'turnover_rate': row['turnover_rate'] if pd.notna(row['turnover_rate']) else 0
-                        }
-                time.sleep(0.2)
-        except Exception as e:
-            add_log("市值数据", f"获取失败: {str(e)[:50]}")
-    return [cache.get(c, {'circ_mv': 0, 'turnover_rate': 0}) for c in ts_codes]
+def batch_get_stock_basic_info(trade_date, log=add_log):
+    """
+    全市场市值/换手：按交易日一次调用 daily_basic，返回以 ts_code 为索引的
+    DataFrame（circ_mv, turnover_rate）；当日数据尚未发布时返回空表，下一轮重试
+    """
+    def fetch():
+        df = fetcher.call(pro.daily_basic, trade_date=trade_date, fields='ts_code,circ_mv,turnover_rate')
+        if df is None or df.empty:
+            return None
+        log("市值数据", f"{trade_date} 全市场 {len(df)} 条")
+        return df.drop_duplicates('ts_code').set_index('ts_code')[['circ_mv', 'turnover_rate']]
+
+    try:
+        basic = shared_cache.get_or_fetch(('basic', trade_date), fetch)
+    except Exception as e:
+        log("市值数据", f"获取失败: {str(e)[:50]}")
+        basic = None
+    return basic if basic is not None else pd.DataFrame(columns=['circ_mv', 'turnover_rate'])
 
 # ===============================
 # 获取主力资金流向（保留，但不用于选股，仅显示）
 # ===============================
-def batch_get_moneyflow(ts_codes, trade_date):
-    cache = st.session_state.moneyflow_cache
-    need = [c for c in ts_codes if c not in cache]
-    if need:
-        try:
-            for i in range(0, len(need), 50):
-                batch = need[i:i+50]
-                df = pro.moneyflow_dc(ts_code=','.join(batch), trade_date=trade_date)
-                if df is not None and not df.empty:
-                    for _, row in df.iterrows():
-                        code = row['ts_code']
-                        cache[code] = {
-                            'net_inflow_pct': row.get('net_inflow_pct', 0) if pd.notna(row.get('net_inflow_pct')) else 0
-                        }
-                time.sleep(0.5)
-        except Exception as e:
-            add_log("资金流向", f"获取失败: {str(e)[:50]}")
-    return [cache.get(c, {'net_inflow_pct': 0}) for c in ts_codes]
+def batch_get_moneyflow(trade_date, log=add_log):
+    """全市场主力净流入占比：按交易日一次调用 moneyflow_dc，返回以 ts_code 为索引的 Series"""
+    def fetch():
+        df = fetcher.call(pro.moneyflow_dc, trade_date=trade_date)
+        if df is None or df.empty:
+            return None
+        # moneyflow_dc 的主力净流入占比字段为 net_amount_rate，兼容旧字段名 net_inflow_pct
+        col = 'net_inflow_pct' if 'net_inflow_pct' in df.columns else 'net_amount_rate'
+        if col not in df.columns:
+            return None
+        log("资金流向", f"{trade_date} 全市场 {len(df)} 条")
+        return df.drop_duplicates('ts_code').set_index('ts_code')[col].rename('net_inflow_pct')
+
+    try:
+        moneyflow = shared_cache.get_or_fetch(('moneyflow', trade_date), fetch)
+    except Exception as e:
+        log("资金流向", f"获取失败: {str(e)[:50]}")
+        moneyflow = None
+    return moneyflow if moneyflow is not None else pd.Series(dtype=float, name='net_inflow_pct')
 
 # ===============================
 # 个股行业信息获取（保留）
 # ===============================
-def batch_get_stock_industry(ts_codes):
-    cache = st.session_state.stock_industry_cache
-    need = [c for c in ts_codes if c not in cache]
-    if need:
-        try:
-            df = pro.stock_basic(fields='ts_code,industry')
-            if df is not None and not df.empty:
-                for _, row in df.iterrows():
-                    code = row['ts_code']
-                    ind = row['industry'] if pd.notna(row['industry']) else '未知'
-                    cache[code] = ind
-                add_log("行业数据", f"成功获取 {len(df)} 只股票的行业信息")
-            else:
-                add_log("行业数据", "stock_basic 返回空")
-        except Exception as e:
-            add_log("行业数据", f"获取行业失败: {str(e)[:50]}")
-    return [cache.get(c, '未知') for c in ts_codes]
+INDUSTRY_REFRESH_KEY = ('industry', 'force_refresh')
+
+def batch_get_stock_industry(log=add_log):
+    """
+    全市场行业：以 ts_code 为索引的 Series，与本地 stock_basic 整表快照共用。
+    强制刷新后（共享缓存中有 INDUSTRY_REFRESH_KEY 标记）跳过本地快照，重新下载一次
+    """
+    def fetch():
+        # 行业属于低频数据，本地快照与内存缓存同为 INDUSTRY_TTL_DAYS 天有效
+        refresh = shared_cache.peek(INDUSTRY_REFRESH_KEY) is not None
+        df = bar_store.read_table('stock_basic', max_age_days=0 if refresh else INDUSTRY_TTL_DAYS)
+        if df is None or df.empty:
+            df = fetcher.call(pro.stock_basic, fields='ts_code,name,industry')
+            bar_store.write_table('stock_basic', df)
+        if df is None or df.empty:
+            log("行业数据", "stock_basic 返回空")
+            return None
+        shared_cache.invalidate(INDUSTRY_REFRESH_KEY)
+        log("行业数据", f"成功获取 {len(df)} 只股票的行业信息")
+        return df.drop_duplicates('ts_code').set_index('ts_code')['industry'].fillna('未知')
+
+    try:
+        industry = shared_cache.get_or_fetch(('industry', 'stock_basic'), fetch)
+    except Exception as e:
+        log("行业数据", f"获取行业失败: {str(e)[:50]}")
+        industry = None
+    return industry if industry is not None else pd.Series(dtype=object, name='industry')
 
 # ===============================
 # 数据获取（增加市值/换手/资金流，保留原有字段）
 # ===============================
-def fetch_from_tushare():
+def fetch_from_tushare(log=add_log):
+    """
+    拉取全市场快照并补充行业/市值/换手/资金流。
+    三项补充数据均为按交易日的全市场整表（存于共享缓存，过期由其策略负责），与快照一次连接；
+    本函数不访问 st.session_state，可在后台线程中运行。
+    """
     try:
-        add_log("数据源", "尝试 Tushare rt_k 接口")
+        log("数据源", "尝试 Tushare rt_k 接口")
         board_patterns = ["6*.SH", "0*.SZ", "3*.SZ", "688*.SH", "8*.BJ", "4*.BJ"]
+        # 六个板块并发请求，总耗时约等于最慢的一次
+        with metrics.stage('rt_k') as stage:
+            results, errors = fetcher.run({p: partial(pro.rt_k, ts_code=p) for p in board_patterns})
+            stage['rows'] = sum(len(r) for r in results.values() if r is not None)
         all_dfs = []
         for pattern in board_patterns:
-            try:
-                df_part = pro.rt_k(ts_code=pattern)
-                if df_part is not None and not df_part.empty:
-                    all_dfs.append(df_part)
-                    add_log("数据源", f"板块 {pattern} 获取到 {len(df_part)} 条")
-                else:
-                    add_log("数据源", f"板块 {pattern} 返回空数据")
-            except Exception as e:
-                add_log("数据源", f"板块 {pattern} 异常: {str(e)[:50]}")
+            if pattern in errors:
+                log("数据源", f"板块 {pattern} 异常: {str(errors[pattern])[:50]}")
                 continue
+            df_part = results.get(pattern)
+            if df_part is not None and not df_part.empty:
+                all_dfs.append(df_part)
+                log("数据源", f"板块 {pattern} 获取到 {len(df_part)} 条")
+            else:
+                log("数据源", f"板块 {pattern} 返回空数据")
         if not all_dfs:
-            add_log("数据源", "所有板块均失败，无数据")
+            log("数据源", "所有板块均失败，无数据")
             return None
         df = pd.concat(all_dfs, ignore_index=True)
         df = df.drop_duplicates(subset=['ts_code'])
@@ -244,9 +363,9 @@ def fetch_from_tushare():
         df = df[~df['ts_code'].str.startswith(('688', '300', '301'))]
         after = len(df)
         if before > after:
-            add_log("数据源", f"已剔除科创板和创业板股票 {before - after} 只，剩余 {after} 只")
+            log("数据源", f"已剔除科创板和创业板股票 {before - after} 只，剩余 {after} 只")
         
-        add_log("数据源", f"合并后共 {len(df)} 条股票数据")
+        log("数据源", f"合并后共 {len(df)} 条股票数据")
 
         df['涨跌幅'] = (df['close'] - df['pre_close']) / df['pre_close'] * 100
         if 'high' in df.columns:
@@ -265,22 +384,31 @@ def fetch_from_tushare():
         rename_cols = {k: v for k, v in rename_map.items() if k in df.columns}
         df = df.rename(columns=rename_cols)
 
-        codes = df['代码'].tolist()
-        industries = batch_get_stock_industry(codes)
-        df['所属行业'] = industries
-        
         today_str = datetime.now(tz).strftime('%Y%m%d')
-        basic_infos = batch_get_stock_basic_info(codes, today_str)
-        df['流通市值'] = [b['circ_mv'] for b in basic_infos]
-        df['换手率'] = [b['turnover_rate'] for b in basic_infos]
-        
-        moneyflows = batch_get_moneyflow(codes, today_str)
-        df['主力净流入占比'] = [m['net_inflow_pct'] for m in moneyflows]
+        with metrics.stage('industry') as stage:
+            industry = batch_get_stock_industry(log=log)
+            stage['rows'] = len(industry)
+        with metrics.stage('basic_info') as stage:
+            basic = batch_get_stock_basic_info(today_str, log=log)
+            stage['rows'] = len(basic)
+        with metrics.stage('moneyflow') as stage:
+            moneyflow = batch_get_moneyflow(today_str, log=log)
+            stage['rows'] = len(moneyflow)
+
+        # 一次连接补齐全部字段；缺失的行业记为「未知」，缺失的市值/换手/资金流记为 0
+        with metrics.stage('enrich', rows=len(df)):
+            enrich = pd.concat([industry.rename('所属行业'),
+                                basic.rename(columns={'circ_mv': '流通市值', 'turnover_rate': '换手率'}),
+                                moneyflow.rename('主力净流入占比')], axis=1)
+            df = df.join(enrich, on='代码')
+            df['所属行业'] = df['所属行业'].fillna('未知')
+            for col in ['流通市值', '换手率', '主力净流入占比']:
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
 
         required = ['代码', '名称', '涨跌幅', '成交额', '所属行业']
         missing = [c for c in required if c not in df.columns]
         if missing:
-            add_log("数据源", f"字段缺失: {missing}")
+            log("数据源", f"字段缺失: {missing}")
             return None
 
         keep_cols = ['代码', '名称', '涨跌幅', '成交额', '所属行业', '最新价', '成交量', '最高价', '最高涨幅',
@@ -288,14 +416,55 @@ def fetch_from_tushare():
         keep_cols = [c for c in keep_cols if c in df.columns]
         df = df[keep_cols]
 
-        add_log("数据源", f"✅ 成功获取 {len(df)} 条（含行业、市值、换手、资金流）")
+        log("数据源", f"✅ 成功获取 {len(df)} 条（含行业、市值、换手、资金流）")
         return df
     except Exception as e:
-        add_log("数据源", f"整体异常: {str(e)[:100]}")
+        log("数据源", f"整体异常: {str(e)[:100]}")
         return None
 
-def get_stable_realtime_data():
+# ===============================
+# 【新增】后台行情线程（进程内唯一，所有会话共用）
+# ===============================
+@st.cache_resource
+def get_market_worker():
+    # 每个成功快照追加录制到本地，供夜间回放（MHF_RECORD_SNAPSHOTS=0 关闭）
+    recorder = SnapshotRecorder() if os.environ.get("MHF_RECORD_SNAPSHOTS", "1") == "1" else None
+    # 每个快照同时写入分钟环形缓冲，提供分钟量、量能加速度、VWAP 等盘中因子
+    intraday = IntradayBuffer()
+
+    def fetch(log):
+        with metrics.refresh('worker'):
+            df = fetch_from_tushare(log=log)
+        if df is not None and not df.empty:
+            with metrics.stage('intraday_record', rows=len(df)):
+                intraday.record(df, datetime.now(tz))
+        if recorder is not None and df is not None and not df.empty:
+            try:
+                recorder.record(df, datetime.now(tz))
+            except Exception as e:
+                log("录制", f"快照写入失败: {str(e)[:50]}")
+        return df
+
+    worker = MarketDataWorker(fetch, is_trading_day_and_time, interval=60, clock=lambda: datetime.now(tz))
+    worker.intraday = intraday
+    worker.start()
+    return worker
+
+market_worker = get_market_worker()
+
+def get_stable_realtime_data(replayer=None):
+    """只读取后台线程发布的最新快照，本函数不发起任何网络请求；回放模式下读取回放时钟对应的录制帧"""
     now = datetime.now(tz)
+    if replayer is not None:
+        frame_time, df = replayer.current()
+        st.session_state.data_source = "replay"
+        st.session_state.last_data_fetch_time = now
+        if df is None:
+            add_log("回放", f"{replayer.clock().strftime('%H:%M:%S')} 之前没有录制帧")
+            return pd.DataFrame(columns=['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比'])
+        st.session_state.today_real_data = df
+        return df.copy()
+
     is_trading, msg = is_trading_day_and_time(now)
     if not is_trading:
         st.session_state.data_source = "non_trading"
@@ -303,12 +472,30 @@ def get_stable_realtime_data():
         add_log("数据", f"{msg}，返回空数据")
         return pd.DataFrame(columns=['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比'])
 
-    df = fetch_from_tushare()
-    if df is not None and not df.empty:
-        st.session_state.today_real_data = df.copy()
-        st.session_state.data_source = "real_data"
-        st.session_state.last_data_fetch_time = now
-        add_log("数据源", "成功获取实时数据并更新缓存")
+    store = market_worker.store
+    snap = store.latest()
+    if snap is None or snap.fetched_at.date() != now.date():
+        # 当日首个快照尚未就绪（刚开盘或刚启动）：触发后台拉取，只短暂等待，
+        # 仍未就绪时显示「加载中」，由行情区域的定时重跑取新版本，不阻塞脚本线程
+        attempts = store.attempts
+        # 已在等待或上一轮已失败时不再催促后台（失败按后台节拍重试），短间隔轮询只读取
+        if st.session_state.data_source not in ("loading", "failed"):
+            market_worker.trigger()
+        snap = store.wait_for_attempt(attempts, timeout=SNAPSHOT_WAIT_SEC)
+        if (snap is None or snap.fetched_at.date() != now.date()) and store.attempts == attempts:
+            st.session_state.data_source = "loading"
+            st.session_state.last_data_fetch_time = now
+            return pd.DataFrame(columns=['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比'])
+
+    if snap is not None and snap.fetched_at.date() == now.date():
+        df = snap.data.copy()
+        st.session_state.today_real_data = df
+        # 最近一轮拉取失败时沿用上一版快照
+        st.session_state.data_source = "cached_real_data" if store.last_error else "real_data"
+        st.session_state.last_data_fetch_time = snap.fetched_at
+        if st.session_state.get("snapshot_version") != snap.version:
+            st.session_state.snapshot_version = snap.version
+            add_log("数据源", f"读取后台快照 v{snap.version}（{snap.fetched_at.strftime('%H:%M:%S')}）")
         return df
     else:
         st.session_state.data_source = "failed"
@@ -317,206 +504,190 @@ def get_stable_realtime_data():
         return pd.DataFrame(columns=['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比'])
 
 # ===============================
-# 【修改】获取历史数据（增加limit参数，默认120，用于计算120日均线）
+# 【新增】全市场历史面板（按交易日拉取，替代逐只 pro.daily）
 # ===============================
-def get_historical_data(ts_code, end_date=None, limit=120):
-    cache = st.session_state.hist_data_cache
-    cache_key = f"{ts_code}_{limit}"
-    if cache_key in cache:
-        return cache[cache_key]
+def get_market_panel(limit=120, trade_date=None):
+    """
+    加载截至今日的全市场日线面板。已收盘交易日优先从本地仓库读取，
+    只对仓库中缺失的交易日调用 pro.daily(trade_date=...) 并追加落盘；
+    trade_date 为历史交易日（回放）时只加载该日之前的日线，不读取回放日及以后的数据
+    """
+    today_str = datetime.now(tz).strftime('%Y%m%d')
+    trade_date = trade_date or today_str
+
+    def build():
+        # 多取若干交易日：盘中当日日线尚未生成会被跳过；停牌股也能凑满 limit 根K线
+        trade_dates = recent_trade_dates(pro, trade_date, limit + 21, calendar=trade_calendar)
+        if trade_date != today_str:
+            trade_dates = [d for d in trade_dates if d < trade_date]
+        else:
+            trade_dates = trade_dates[1:]
+        panel = HistoryPanel.load(pro, trade_dates, shared_cache.namespace('daily'),
+                                  log=add_log, store=bar_store, fetcher=fetcher)
+        if len(panel) == 0:
+            add_log("历史数据", "全市场面板为空，回退逐只获取")
+            return None
+        gaps = panel.missing_before(trade_date)
+        if gaps:
+            # 缺日的面板会把不相邻的K线当作相邻，不缓存，下次刷新重试
+            add_log("历史数据", f"全市场面板缺少 {len(gaps)} 个交易日（{', '.join(gaps[:3])}…），本次回退逐只获取")
+            return None
+        add_log("历史数据", f"全市场面板: {len(panel)} 只 × {len(panel.dates)} 日（截至 {panel.last_date}）")
+        return panel
+
     try:
+        # 多个会话同时加载时只会构建一次，其余会话等待同一结果
+        return shared_cache.get_or_fetch(('panel', trade_date, limit), build)
+    except Exception as e:
+        add_log("历史数据", f"全市场面板加载失败: {str(e)[:50]}")
+        return None
+
+# ===============================
+# 【修改】获取历史数据（增加limit参数，默认120，用于计算120日均线）
+# ===============================
+def get_historical_data(ts_code, end_date=None, limit=120, trade_date=None):
+    # 优先从全市场面板切片，面板不可用时回退逐只获取；
+    # trade_date 为历史交易日（回放）时只返回该日之前的K线
+    today_str = datetime.now(tz).strftime('%Y%m%d')
+    trade_date = trade_date or today_str
+    panel = shared_cache.peek(('panel', trade_date, 120))
+    if end_date is None and panel is not None and limit <= len(panel.dates):
+        return panel.frame(ts_code, limit)
+    if end_date is None and trade_date != today_str:
+        end_date = trade_calendar.prev(trade_date)
         if end_date is None:
-            end_date = datetime.now(tz).strftime('%Y%m%d')
-        df = pro.daily(ts_code=ts_code, end_date=end_date, limit=limit)
-        if df is not None and not df.empty:
-            df = df.sort_values('trade_date')
-            cache[cache_key] = df
-            return df
-        else:
-            cache[cache_key] = pd.DataFrame()
             return pd.DataFrame()
-    except Exception as e:
-        cache[cache_key] = pd.DataFrame()
+
+    # 每只股票只缓存一段已获取的最宽连续区间，更窄的 (end_date, limit) 直接切片，更宽的只补缺失一侧
+    end_date = end_date or today_str
+    key = ('hist', ts_code)
+    try:
+        hist = shared_cache.get_or_fetch(key, lambda: HistoryRange.fetch(pro, ts_code, end_date, limit, fetcher))
+        if not hist.covers(end_date, limit):
+            if end_date < hist.start:
+                # 早于已缓存区间的请求无法与之连成一段，单独获取且不写缓存
+                return HistoryRange.fetch(pro, ts_code, end_date, limit, fetcher).slice(end_date, limit)
+            hist = hist.extend(pro, end_date, limit, fetcher)
+            shared_cache.set(key, hist)
+        return hist.slice(end_date, limit)
+    except Exception:
         return pd.DataFrame()
 
 # ===============================
-# 【新增】孕线选股辅助函数
+# 【新增】孕线特征构建（面板批量识别，面板不可用时逐只回退）
 # ===============================
-def is_strong_mother(day, hist_df, lookback=20):
-    """
-    判断母线是否为标志性K线：
-    条件1：当日涨幅为近lookback日最大涨幅
-    条件2：当日成交量为近lookback日最大成交量
-    满足任一即可
-    """
-    if len(hist_df) < lookback + 1:
-        return False
-    # 取前lookback日（不含当日）数据
-    prev_data = hist_df.iloc[:-1].tail(lookback)
-    if len(prev_data) < lookback:
-        return False
-    # 涨幅比较
-    gain = (day['close'] - day['open']) / day['open'] * 100
-    max_gain = ((prev_data['close'] - prev_data['open']) / prev_data['open'] * 100).max()
-    # 成交量比较
-    max_vol = prev_data['vol'].max()
-    if gain >= max_gain or day['vol'] >= max_vol:
-        return True
-    return False
-
-def is_bullish(day, min_gain=5):
-    if day['close'] <= day['open']:
-        return False
-    gain = (day['close'] - day['open']) / day['open'] * 100
-    if gain < min_gain:
-        return False
-    return True
-
-def is_doji_or_bearish(day):
-    body = abs(day['close'] - day['open'])
-    range_ = day['high'] - day['low']
-    if range_ == 0:
-        return True
-    if day['close'] < day['open']:
-        return True
-    if body / range_ < 0.2:
-        return True
-    return False
-
-def find_latest_pregnancy(hist_df, lookback=10, min_gain=5, vol_ratio=1.5):
+def get_setup_table(min_gain=5, vol_ratio=1.5, trade_date=None):
     """
-    查找最近孕线组合，且母线为标志性K线（近20日最大涨幅或最大成交量）
+    当日孕线形态表（只含存在有效孕线的股票，以 ts_code 为索引）。
+    优先读取盘前任务（premarket.py）落盘的结果，没有时用全市场面板现场计算；
+    trade_date 为历史交易日（回放）时按该日之前的K线生成
     """
-    if hist_df.empty or len(hist_df) < 20:  # 至少需要20日数据判断标志性
+    today_str = datetime.now(tz).strftime('%Y%m%d')
+    trade_date = trade_date or today_str
+
+    def build():
+        setups = load_setups(bar_store, trade_date, min_gain, vol_ratio)
+        if setups is not None:
+            add_log("盘前形态", f"读取形态表：{len(setups)} 只")
+            return setups
+        # 历史交易日（回放）的面板只含该日之前的日线，同一面板供板块5日动量复用
+        panel = get_market_panel(limit=120, trade_date=trade_date)
+        if panel is None:
+            return None
+        setups = compute_setups(panel, min_gain=min_gain, vol_ratio=vol_ratio)
+        # 只有完全基于 trade_date 之前K线的结果才能作为该日盘前表落盘
+        if panel.last_date < trade_date:
+            save_setups(bar_store, trade_date, setups, min_gain, vol_ratio)
+        add_log("盘前形态", f"{trade_date} 全市场扫描 {len(panel)} 只，{len(setups)} 只存在有效孕线")
+        return setups
+
+    try:
+        return shared_cache.get_or_fetch(('setups', trade_date, float(min_gain), float(vol_ratio)), build)
+    except Exception as e:
+        add_log("盘前形态", f"形态表生成失败: {str(e)[:50]}")
         return None
-    hist_df = hist_df.copy()
-    hist_df['avg_vol_5'] = hist_df['vol'].rolling(5, min_periods=1).mean()
-    start = max(0, len(hist_df) - lookback - 2)
-    for i in range(len(hist_df)-1, start, -1):
-        day1 = hist_df.iloc[i-1]
-        day2 = hist_df.iloc[i]
-        # 母线：阳线且涨幅达标且放量
-        if day1['close'] <= day1['open']:
-            continue
-        gain1 = (day1['close'] - day1['open']) / day1['open'] * 100
-        if gain1 < min_gain:
-            continue
-        if day1['vol'] < day1['avg_vol_5'] * vol_ratio:
-            continue
-        # 【新增】母线必须为标志性K线
-        if not is_strong_mother(day1, hist_df.iloc[:i]):  # 只用之前的数据判断
-            continue
-        # 子线：阴线或十字星，且完全被母线包容
-        if not is_doji_or_bearish(day2):
-            continue
-        if day2['high'] > day1['high'] or day2['low'] < day1['low']:
-            continue
-        return {'mother_idx': i-1, 'mother': day1, 'child': day2}
-    return None
-
-def check_breakout(today_row, pregnancy_info, hist_df, 
-                   index_change=None, 
-                   max_deviation_from_ma120=0.30,
-                   breakout_threshold=1.01,
-                   vol_ratio_break=1.5,
-                   max_breakthrough_gain=8.0):
+
+def build_pregnancy_features(to_check, min_gain=5, vol_ratio=1.5, limit=120, trade_date=None):
     """
-    突破判断（仅技术面，大盘仅做提醒，不做拦截）
+    返回 (待评分股票, 特征表)，两者行序一致。
+    形态表可用时只保留有形态的股票（开销与形态股数量成正比），否则逐只获取历史回退，
+    回退只覆盖成交额前 FALLBACK_SCAN_LIMIT 只（to_check 需已按成交额降序）
     """
-    # ========== 已移除大盘强制拦截逻辑，改为UI提醒 ==========
-    
-    mother_high = pregnancy_info['mother']['high']
-    # 2. 价格突破
-    if today_row['最新价'] <= mother_high * breakout_threshold:
-        return False, None, None, "未突破"
-    breakthrough_gain = (today_row['最新价'] - mother_high) / mother_high * 100
-    if breakthrough_gain > max_breakthrough_gain:
-        return False, None, None, "追高风险"
-    
-    # 3. 放量确认
-    if len(hist_df) < 5:
-        return False, None, None, "历史数据不足"
-    avg_vol_5 = hist_df['vol'].tail(5).mean()
-    if avg_vol_5 == 0 or today_row['成交量'] < avg_vol_5 * vol_ratio_break:
-        return False, None, None, "量能不足"
-    vol_ratio = today_row['成交量'] / avg_vol_5
-    
-    # 4. 【新增】相对位置过滤：股价偏离120日均线不超过30%
-    if len(hist_df) >= 120:
-        ma120 = hist_df['close'].tail(120).mean()
-        if ma120 > 0:
-            deviation = (today_row['最新价'] - ma120) / ma120
-            if deviation > max_deviation_from_ma120:
-                return False, None, None, "位置过高"
-            # 低于均线过多也谨慎（可选，这里不拒绝）
-    return True, breakthrough_gain, vol_ratio, "突破有效"
+    setups = get_setup_table(min_gain, vol_ratio, trade_date)
+    if setups is not None:
+        to_check = to_check[to_check['代码'].isin(setups.index)]
+        return to_check, setups.loc[to_check['代码']].reset_index(drop=True)
+    if len(to_check) > FALLBACK_SCAN_LIMIT:
+        st.warning(f"⚠️ 全市场日线面板不完整（有交易日未取到），本次只逐只检测成交额前 {FALLBACK_SCAN_LIMIT} 只；"
+                   "面板补齐后自动恢复全市场扫描")
+        add_log("孕线特征", f"形态表不可用，逐只回退限于前 {FALLBACK_SCAN_LIMIT} 只（共 {len(to_check)} 只）")
+        to_check = to_check.head(FALLBACK_SCAN_LIMIT)
+    rows = []
+    for code in to_check['代码']:
+        hist = get_historical_data(code, limit=limit, trade_date=trade_date)
+        pregnancy = find_latest_pregnancy(hist, lookback=10, min_gain=min_gain, vol_ratio=vol_ratio)
+        rows.append(pregnancy_features_from_hist(hist, pregnancy))
+    return to_check, pd.DataFrame(rows)
+
+def build_candidates(to_check, feats, scores, is_index_risky):
+    """把突破有效的行整理成候选记录"""
+    hit = scores['突破有效'].to_numpy()
+    candidates = []
+    for (_, row), (_, f), (_, sc) in zip(to_check[hit].iterrows(), feats[hit].iterrows(), scores[hit].iterrows()):
+        candidates.append({
+            '代码': row['代码'],
+            '名称': row['名称'],
+            '最新价': row['最新价'],
+            '涨跌幅': row['涨跌幅'],
+            '成交额': row['成交额'],
+            '所属行业': row['所属行业'],
+            '母线日期': f['mother_date'],
+            '母线涨幅': f['mother_gain'],
+            '母线最高价': f['mother_high'],
+            '子线日期': f['child_date'],
+            '子线实体': f['child_body'],
+            '突破幅度': sc['突破幅度'],
+            '放量倍数': sc['放量倍数'],
+            '偏离120日均线': sc['偏离120日均线'],
+            '板块强度得分': sc['板块强度得分'],
+            '综合得分': sc['综合得分'],
+            '大盘风险': is_index_risky
+        })
+    return candidates
 
 # ===============================
 # 板块强度计算（用于板块加分）
 # ===============================
-def calculate_sector_strength_momentum(df_today):
+def calculate_sector_strength_momentum(df_today, snapshot_time):
     if df_today.empty or '所属行业' not in df_today.columns:
         return pd.DataFrame()
-    df_today['is_limit_up'] = df_today['涨跌幅'] >= 9.5
-    today_sector = df_today.groupby('所属行业').agg({
-        '涨跌幅': 'mean',
-        '成交额': 'sum',
-        'is_limit_up': 'sum',
-        '代码': 'count'
-    }).rename(columns={'代码': '股票数量', 'is_limit_up': '涨停家数'})
-    today_sector['资金占比'] = today_sector['成交额'] / today_sector['成交额'].sum()
-    today_sector['涨停占比'] = today_sector['涨停家数'] / max(1, today_sector['涨停家数'].sum())
-    today_sector['当日强度'] = (today_sector['涨跌幅'].rank(pct=True) * 40 +
-                                today_sector['资金占比'].rank(pct=True) * 40 +
-                                today_sector['涨停占比'].rank(pct=True) * 20)
-    top_stocks = df_today.nlargest(100, '成交额')
+    if st.session_state.sector_engine is None:
+        st.session_state.sector_engine = SectorEngine()
+    engine = st.session_state.sector_engine
+    # 个股5日涨幅当日不变：只补成交额前100中尚未计算过的股票，面板可用时整批切片
+    trade_date = snapshot_time.strftime('%Y%m%d')
+    missing = engine.prepare(df_today, trade_date)
     stock_5d = {}
-    for _, row in top_stocks.iterrows():
-        hist = get_historical_data(row['代码'], limit=30)  # 用30天即可
-        if hist is not None and not hist.empty and len(hist) >= 6:
-            close_vals = hist['close'].values
-            pct_5d = (close_vals[-1] - close_vals[-6]) / close_vals[-6] * 100
-            stock_5d[row['代码']] = pct_5d
-    sector_5d = {}
-    for _, row in top_stocks.iterrows():
-        ind = row['所属行业']
-        pct = stock_5d.get(row['代码'], np.nan)
-        if not np.isnan(pct):
-            sector_5d.setdefault(ind, []).append(pct)
-    sector_5d_avg = {ind: np.mean(vals) for ind, vals in sector_5d.items()}
-    if sector_5d_avg:
-        sectors = list(sector_5d_avg.keys())
-        values = list(sector_5d_avg.values())
-        ranks = pd.Series(values).rank(pct=True) * 100
-        momentum_score = {sectors[i]: ranks.iloc[i] for i in range(len(sectors))}
-    else:
-        momentum_score = {}
-    final_scores = []
-    for sector in today_sector.index:
-        today = today_sector.loc[sector, '当日强度']
-        momentum = momentum_score.get(sector, today)
-        weighted = 0.4 * today + 0.6 * momentum
-        final_scores.append(weighted)
-    today_sector['强度得分'] = final_scores
-    return today_sector.sort_values('强度得分', ascending=False)
-
-# ===============================
-# 过滤ST和异常（保留）
-# ===============================
-def filter_stocks_by_rule(df):
-    if df.empty:
-        return df
-    filtered = df.copy()
-    if '名称' in filtered.columns:
-        filtered = filtered[~filtered['名称'].str.contains('ST', na=False)]
-    if '涨跌幅' in filtered.columns:
-        filtered = filtered[filtered['涨跌幅'] <= 9.5]
-    if '最高涨幅' in filtered.columns and '涨跌幅' in filtered.columns:
-        filtered = filtered[~((filtered['最高涨幅'] > 9.5) & (filtered['涨跌幅'] < 7))]
-    if not filtered.empty and '成交额' in filtered.columns:
-        threshold = max(filtered['成交额'].quantile(0.1), 2e7)
-        filtered = filtered[filtered['成交额'] > threshold]
-    return filtered
+    with metrics.stage('sector_history', rows=len(missing)):
+        # 回放时按回放日取面板（只含该日之前的收盘价），不用今天的面板
+        panel = shared_cache.peek(('panel', trade_date, 120))
+        if missing and panel is None and trade_date != datetime.now(tz).strftime('%Y%m%d'):
+            panel = get_market_panel(limit=120, trade_date=trade_date)
+        if missing and panel is not None:
+            close = panel.aligned('close', codes=missing, limit=6)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                pct_5d = (close[:, -1] - close[:, 0]) / close[:, 0] * 100
+            stock_5d = dict(zip(missing, pct_5d if close.shape[1] == 6 else np.full(len(missing), np.nan)))
+        else:
+            for code in missing:
+                hist = get_historical_data(code, limit=30, trade_date=trade_date)  # 用30天即可
+                if hist is not None and not hist.empty and len(hist) >= 6:
+                    close_vals = hist['close'].values
+                    stock_5d[code] = (close_vals[-1] - close_vals[-6]) / close_vals[-6] * 100
+                else:
+                    stock_5d[code] = np.nan
+    with metrics.stage('sector_strength', rows=len(df_today)):
+        return engine.compute(df_today, stock_5d, ts=snapshot_time)
 
 # ===============================
 # 主程序
@@ -533,21 +704,22 @@ if st.session_state.today != now.date():
     st.session_state.data_source = "unknown"
     st.session_state.data_fetch_attempts = 0
     st.session_state.a_code_list = None
-    st.session_state.hist_data_cache = {}
-    st.session_state.stock_industry_cache = {}
     st.session_state.convergence_records = []
     st.session_state.backup_picks = []
     st.session_state.candidate_df = pd.DataFrame()
     st.session_state.final_locked = False
-    st.session_state.stock_basic_cache = {}
-    st.session_state.moneyflow_cache = {}
-    st.session_state.index_cache = {}
     st.session_state.top_candidate = None
     st.session_state.last_refresh_time = None
     st.session_state.force_refresh = False
-    add_log("系统", "新交易日开始，重置所有状态")
+    st.session_state.scorer = None
+    # 共享缓存只清理真正过期的条目：已收盘日线、行业表保留
+    evicted = shared_cache.evict_stale()
+    add_log("系统", f"新交易日开始，重置会话状态，清理过期缓存 {sum(evicted.values())} 条")
     st.rerun()
 
+# 本次页面运行计为一次刷新，各阶段耗时在脚本末尾汇总导出
+metrics.begin_refresh('page')
+
 # ===============================
 # 侧边栏
 # ===============================
@@ -557,8 +729,10 @@ with st.sidebar:
     data_source_display = {
         "real_data": "🟢 **实时数据（Tushare rt_k）**",
         "cached_real_data": "🟡 **缓存数据**",
+        "replay": "⏪ **历史回放**",
         "non_trading": "⚪ **非交易时间（无实时）**",
         "unknown": "⚪ **等待获取**",
+        "loading": "⏳ **正在获取首个快照**",
         "failed": "🔴 **获取失败**"
     }.get(st.session_state.data_source, "⚪ **等待获取**")
     st.markdown(data_source_display)
@@ -572,18 +746,57 @@ with st.sidebar:
         else:
             st.caption(f"最近更新: >5分钟前")
 
+    with st.expander("🧮 共享缓存统计"):
+        cache_stats = shared_cache.stats()
+        if cache_stats:
+            cache_df = pd.DataFrame(cache_stats).T
+            # 有内存预算的命名空间显示占用（MB），超出预算按 LRU 淘汰
+            cache_df['MB'] = pd.to_numeric(cache_df['bytes'], errors='coerce') / 2 ** 20
+            cache_df['预算MB'] = pd.to_numeric(cache_df['budget'], errors='coerce') / 2 ** 20
+            st.dataframe(cache_df[['entries', 'hits', 'misses', 'coalesced', 'expired', 'evicted', 'fallbacks', 'hit_rate',
+                                   'MB', '预算MB']].round(3))
+        else:
+            st.caption("暂无缓存记录")
+
+    with st.expander("🩺 运行诊断"):
+        for kind, label in (('page', "上次页面刷新"), ('scan', "上次定时刷新"), ('worker', "上次后台拉取")):
+            record = metrics.last_refresh(kind)
+            if record is None:
+                continue
+            st.caption(f"{label}：{record['started'][11:]}，共 {record['seconds']:.2f} 秒")
+            stage_df = pd.DataFrame({'耗时(秒)': pd.Series(record['stages']), '行数': pd.Series(record['rows'])})
+            st.dataframe(stage_df.sort_values('耗时(秒)', ascending=False).round(3))
+        api_stats = metrics.api_table()
+        if api_stats:
+            st.caption("接口调用（进程启动以来）")
+            st.dataframe(pd.DataFrame(api_stats).T[['calls', 'errors', 'rows', 'avg_ms', 'max_ms']].round(1))
+        else:
+            st.caption("暂无接口调用记录")
+        st.caption(f"明细导出：{metrics.export_dir}（refresh-*.jsonl、mhf.prom）")
+
+    with st.expander("📜 历史回测"):
+        if st.session_state.backtest_results is None:
+            st.session_state.backtest_results = bar_store.read_table(BACKTEST_TABLE)
+        bt_picks = st.session_state.backtest_results
+        if bt_picks is None or bt_picks.empty:
+            st.caption("暂无回测结果，运行 `python backtest.py --start YYYYMMDD --end YYYYMMDD` 生成")
+        else:
+            st.caption(f"回测区间 {bt_picks['trade_date'].min()} ~ {bt_picks['trade_date'].max()}")
+            st.dataframe(pd.Series(summarize_backtest(bt_picks)).to_frame("全部入选"))
+
     st.markdown("---")
     if st.button("🔄 强制刷新数据"):
         st.cache_data.clear()
         st.session_state.today_real_data = None
         st.session_state.data_source = "unknown"
-        st.session_state.hist_data_cache = {}
-        st.session_state.stock_industry_cache = {}
-        st.session_state.stock_basic_cache = {}
-        st.session_state.moneyflow_cache = {}
-        st.session_state.index_cache = {}
+        # 已收盘交易日的全市场日线不会变化，保留 daily 命名空间，其余（含行业/市值/资金流）全部重建
+        shared_cache.clear(['panel', 'hist', 'index', 'setups', 'industry', 'basic', 'moneyflow'])
+        # 行业表同时跳过本地快照，真正重新下载
+        shared_cache.set(INDUSTRY_REFRESH_KEY, True)
+        market_worker.trigger()
         st.session_state.candidate_df = pd.DataFrame()
         st.session_state.top_candidate = None
+        st.session_state.scorer = None
         st.session_state.force_refresh = True
         st.session_state.last_refresh_time = None
         add_log("手动操作", "清除缓存，强制刷新")
@@ -592,7 +805,11 @@ with st.sidebar:
 
     st.markdown("---")
     st.markdown("#### ⏰ 时间设置")
-    use_real_time = st.radio("时间模式", ["实时模式", "模拟测试"], index=0, key="time_mode")
+    use_real_time = st.radio("时间模式", ["实时模式", "模拟测试", "历史回放"], index=0, key="time_mode")
+    if use_real_time != "历史回放" and st.session_state.get("replayer") is not None:
+        # 切换时间模式即结束回放，恢复实盘推荐
+        stop_replay()
+        add_log("回放", "切换时间模式，结束回放")
     if use_real_time == "模拟测试":
         col1, col2 = st.columns(2)
         with col1:
@@ -603,12 +820,31 @@ with st.sidebar:
             add_log("模拟", f"设置时间: {test_hour:02d}:{test_minute:02d}")
             st.session_state.simulated_time = now.replace(hour=test_hour, minute=test_minute, second=0)
             st.rerun()
+    elif use_real_time == "历史回放":
+        replay_sessions = list_sessions()
+        if not replay_sessions:
+            st.caption("暂无录制数据（交易时段内后台会自动录制快照）")
+        else:
+            replay_date = st.selectbox("回放交易日", replay_sessions[::-1], key="replay_date")
+            replay_speed = st.select_slider("回放倍速", options=[1, 2, 5, 10, 20, 50, 100], value=10, key="replay_speed")
+            replay_start = st.selectbox("起始时间", ["09:30", "10:30", "13:00", "13:30", "14:00", "14:30"],
+                                        index=3, key="replay_start")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("▶️ 开始回放"):
+                    start_replay(SnapshotReplayer(
+                        replay_date, speed=replay_speed, start=replay_start.replace(":", "") + "00", tzinfo=tz))
+                    add_log("回放", f"{replay_date} 从 {replay_start} 开始，{replay_speed}× 倍速")
+                    st.rerun()
+            with col2:
+                if st.button("⏹️ 停止回放"):
+                    stop_replay()
+                    st.rerun()
 
     st.markdown("---")
     st.markdown("#### ⏱️ 自动刷新控制")
     auto_refresh = st.checkbox("开启自动刷新（交易时段有效）", value=True, key="auto_refresh")
-    refresh_interval = 1  # 固定为1分钟
-    st.caption("刷新间隔：1分钟")
+    st.caption(f"刷新间隔：{SCAN_REFRESH_SECONDS // 60}分钟（只重跑行情与选股区域）")
     if auto_refresh:
         if st.session_state.last_refresh_time:
             last = st.session_state.last_refresh_time
@@ -618,6 +854,14 @@ with st.sidebar:
     else:
         st.caption("手动刷新请点击『强制刷新数据』按钮")
 
+    st.markdown("---")
+    st.markdown("#### 🔭 选股范围")
+    scan_mode = st.radio("选股范围", ["活跃前200", "全市场"], index=0, key="scan_mode", horizontal=True)
+    if scan_mode == "全市场":
+        st.caption(f"评估全部过滤后股票（约3000只），数据预热后单次刷新耗时预算 {FULL_SCAN_BUDGET_SEC:.0f} 秒")
+    else:
+        st.caption("只评估成交额前200的活跃股")
+
     st.markdown("---")
     st.markdown("#### ⚙️ 孕线参数调节")
     min_mother_gain = st.slider("母线最小涨幅(%)", 3, 10, 5, 1, key="min_gain")
@@ -629,385 +873,447 @@ with st.sidebar:
     st.info("📌 增强版已集成：大盘环境提示、相对位置过滤、标志性K线识别、板块强度加分。")
 
 # ===============================
-# 时间处理
+# 定时局部刷新（行情 → 板块 → 选股 → 候选 → 自动推荐）
 # ===============================
-if use_real_time == "模拟测试" and "simulated_time" in st.session_state:
-    current_time = st.session_state.simulated_time
-    st.info(f"🔧 模拟时间: {current_time.strftime('%H:%M:%S')}")
+# 定时器只重跑 scan_section：侧边栏、推荐结果卡片、手动选择只在页面交互（整页重跑）时重算。
+# 回放模式按倍速折算的帧间隔推进（最快0.5秒一次）；自动刷新关闭时不启用定时器
+def resolve_current_time(use_real_time, now):
+    """按时间模式返回 (回放器, 当前时间)"""
+    replayer = st.session_state.get("replayer") if use_real_time == "历史回放" else None
+    if replayer is not None:
+        return replayer, replayer.clock()
+    if use_real_time == "模拟测试" and "simulated_time" in st.session_state:
+        return None, st.session_state.simulated_time
+    return None, now
+
+def recommendation_windows(current_time):
+    """(是否处于首次推荐时段 13:30-14:00, 是否已到最终锁定时间 14:40)"""
+    hm = (current_time.hour, current_time.minute)
+    return (13, 30) <= hm < (14, 0), hm >= (14, 40)
+
+replayer = st.session_state.get("replayer") if use_real_time == "历史回放" else None
+if replayer is not None and not replayer.finished:
+    scan_run_every = max(0.5, 60.0 / replayer.speed)
+elif auto_refresh:
+    scan_run_every = SCAN_REFRESH_SECONDS
 else:
-    current_time = now
-current_hour = current_time.hour
-current_minute = current_time.minute
-current_time_str = current_time.strftime("%H:%M:%S")
-
-# 交易时段监控
-st.markdown("### ⏰ 交易时段监控")
-is_trading, trading_msg = is_trading_day_and_time(current_time)
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    status_color = "🟢" if is_trading else "🔴"
-    st.metric("交易日状态", f"{status_color} {'交易日' if is_trading else '非交易日'}")
-with col2:
-    if 9 <= current_hour < 11 or (current_hour == 11 and current_minute <= 30):
-        period = "早盘"
-    elif 13 <= current_hour < 15 or (current_hour == 15 and current_minute <= 0):
-        period = "午盘"
-    else:
-        period = "休市"
-    st.metric("当前时段", period)
-with col3:
-    is_first_rec_time = (13, 30) <= (current_hour, current_minute) < (14, 0)
-    is_final_lock_time = (current_hour, current_minute) >= (14, 40)
-    if is_first_rec_time:
-        st.metric("推荐状态", "🟢 可推荐")
-    elif is_final_lock_time:
-        st.metric("推荐状态", "🔴 需锁定")
-    else:
-        st.metric("推荐状态", "🟡 观察中")
-with col4:
-    if period == "午盘" and current_hour >= 14:
-        close_time = current_time.replace(hour=15, minute=0, second=0, microsecond=0)
-        time_left = close_time - current_time
-        minutes_left = max(0, int(time_left.total_seconds() / 60))
-        st.metric("距离收盘", f"{minutes_left}分钟")
-    else:
-        st.metric("自动刷新", "1分钟")
-
-# 获取市场数据
-st.markdown("### 📊 数据获取状态")
-try:
-    with st.spinner("正在获取实时数据..."):
-        df = get_stable_realtime_data()
-    data_source_status = {
-        "real_data": ("✅", "Tushare rt_k 实时行情", "#e6f7ff"),
-        "cached_real_data": ("🔄", "缓存真实数据", "#fff7e6"),
-        "non_trading": ("⏸️", "非交易时间（无实时）", "#f0f0f0"),
-        "unknown": ("⚪", "等待获取数据", "#f0f0f0"),
-        "failed": ("🔴", "数据获取失败", "#ffe6e6")
-    }
-    status_emoji, status_text, bg_color = data_source_status.get(
-        st.session_state.data_source, data_source_status["unknown"]
-    )
-    st.markdown(f"""
-    <div style="background-color: {bg_color}; padding: 10px 15px; border-radius: 5px; border-left: 4px solid #1890ff; margin: 10px 0;">
-        <strong>{status_emoji} 数据源状态:</strong> {status_text}
-    </div>
-    """, unsafe_allow_html=True)
-    if not df.empty:
-        st.success(f"✅ 成功获取 {len(df)} 条真实股票数据（含行业、市值、换手、资金流）")
-        with st.expander("🔍 查看数据样本"):
-            display_cols = ['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比']
-            display_cols = [c for c in display_cols if c in df.columns]
-            st.dataframe(df[display_cols].head(10))
-            col_stat1, col_stat2, col_stat3 = st.columns(3)
-            with col_stat1:
-                st.metric("平均涨幅", f"{df['涨跌幅'].mean():.2f}%")
-            with col_stat2:
-                st.metric("最高涨幅", f"{df['涨跌幅'].max():.2f}%")
-            with col_stat3:
-                if '成交额' in df.columns:
-                    st.metric("总成交额", f"{df['成交额'].sum()/1e8:.1f}亿")
-    else:
-        if st.session_state.data_source == "non_trading":
-            st.info("⏸️ 当前非交易时间，无实时数据。如需测试，请使用左侧「模拟测试」模式。")
+    scan_run_every = None
+# 当日首个快照尚未就绪时短间隔轮询；就绪后整页重跑一次，恢复正常刷新间隔
+snapshot_pending = replayer is None and is_trading_day_and_time(now)[0] and (
+    market_worker.store.latest() is None or market_worker.store.latest().fetched_at.date() != now.date())
+if snapshot_pending:
+    scan_run_every = min(scan_run_every or SNAPSHOT_POLL_SECONDS, SNAPSHOT_POLL_SECONDS)
+
+@st.fragment(run_every=scan_run_every)
+def scan_section(use_real_time, scan_mode, auto_refresh):
+    now = datetime.now(tz)
+    if st.session_state.today != now.date():
+        st.rerun()  # 跨日：整页重跑，由页首逻辑重置会话状态
+    # 整页运行时计入 page 刷新；定时器单独重跑本区域时计为一次 scan 刷新
+    own_refresh = not metrics.in_refresh()
+    if own_refresh:
+        metrics.begin_refresh('scan')
+    # ===============================
+    # 时间处理
+    # ===============================
+    replayer, current_time = resolve_current_time(use_real_time, now)
+    if replayer is not None:
+        st.info(f"⏪ 回放 {replayer.trade_date} · {current_time.strftime('%H:%M:%S')} · {replayer.speed:g}× 倍速"
+                + ("（已结束）" if replayer.finished else ""))
+    elif use_real_time == "模拟测试" and "simulated_time" in st.session_state:
+        st.info(f"🔧 模拟时间: {current_time.strftime('%H:%M:%S')}")
+    current_hour = current_time.hour
+    current_minute = current_time.minute
+    current_time_str = current_time.strftime("%H:%M:%S")
+
+    # 交易时段监控
+    st.markdown("### ⏰ 交易时段监控")
+    is_trading, trading_msg = is_trading_day_and_time(current_time)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        status_color = "🟢" if is_trading else "🔴"
+        st.metric("交易日状态", f"{status_color} {'交易日' if is_trading else '非交易日'}")
+    with col2:
+        if 9 <= current_hour < 11 or (current_hour == 11 and current_minute <= 30):
+            period = "早盘"
+        elif 13 <= current_hour < 15 or (current_hour == 15 and current_minute <= 0):
+            period = "午盘"
         else:
-            st.warning("⚠️ 获取到的数据为空，可能原因：Tushare 权限不足、token错误或接口异常")
-except Exception as e:
-    st.error(f"❌ 数据获取失败: {str(e)}")
-    df = pd.DataFrame(columns=['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比'])
-
-# 板块强度（用于加分，但不再强制过滤）
-st.markdown("### 📊 板块热度分析（用于加分）")
-if df.empty or '所属行业' not in df.columns:
-    st.info("当前无有效板块数据，跳过板块分析。")
-    sector_strength = pd.DataFrame()
-else:
-    with st.spinner("计算板块5日动量..."):
-        sector_strength = calculate_sector_strength_momentum(df)
-    if not sector_strength.empty:
-        top5_sectors = sector_strength.head(5).index.tolist()
-        st.success(f"🏆 最强主线板块 Top5（动量加权）: {', '.join(top5_sectors)}")
-        st.dataframe(sector_strength[['涨跌幅', '成交额', '涨停家数', '强度得分']].head(5))
-    else:
-        st.warning("未识别主线板块，板块强度加分将为零")
+            period = "休市"
+        st.metric("当前时段", period)
+    with col3:
+        is_first_rec_time, is_final_lock_time = recommendation_windows(current_time)
+        if is_first_rec_time:
+            st.metric("推荐状态", "🟢 可推荐")
+        elif is_final_lock_time:
+            st.metric("推荐状态", "🔴 需锁定")
+        else:
+            st.metric("推荐状态", "🟡 观察中")
+    with col4:
+        if period == "午盘" and current_hour >= 14:
+            close_time = current_time.replace(hour=15, minute=0, second=0, microsecond=0)
+            time_left = close_time - current_time
+            minutes_left = max(0, int(time_left.total_seconds() / 60))
+            st.metric("距离收盘", f"{minutes_left}分钟")
+        else:
+            st.metric("自动刷新", f"{SCAN_REFRESH_SECONDS // 60}分钟")
 
-# ===============================
-# 选股流程（孕线突破法，全市场 + 板块加分，支持1分钟自动刷新）
-# ===============================
-st.markdown("### 🎯 孕线突破选股引擎（全市场 + 板块加分）")
+    # 盘前（09:30前）启动时预先生成当日孕线形态表，开盘后每次刷新只做连接与评分
+    if trade_calendar.is_open(now.strftime('%Y%m%d')) and (now.hour, now.minute) < (9, 30):
+        with st.spinner("盘前预计算孕线形态..."):
+            setups = get_setup_table(st.session_state.get('min_gain', 5), st.session_state.get('vol_mother', 1.5))
+        if setups is not None:
+            st.caption(f"🌅 盘前形态表已就绪：{len(setups)} 只股票存在有效孕线")
 
-# ---- 判断是否需要执行选股 ----
-do_refresh = False
-if st.session_state.get("force_refresh", False):
-    do_refresh = True
-    st.session_state.force_refresh = False
-else:
-    # 检查自动刷新条件
-    if auto_refresh and is_trading:
-        last = st.session_state.get("last_refresh_time")
-        if last is None:
-            do_refresh = True
+    # 获取市场数据
+    st.markdown("### 📊 数据获取状态")
+    try:
+        with st.spinner("正在获取实时数据..."), metrics.stage('snapshot') as stage:
+            df = get_stable_realtime_data(replayer)
+            stage['rows'] = len(df)
+        data_source_status = {
+            "real_data": ("✅", "Tushare rt_k 实时行情", "#e6f7ff"),
+            "cached_real_data": ("🔄", "缓存真实数据", "#fff7e6"),
+            "replay": ("⏪", "历史回放（录制快照）", "#f9f0ff"),
+            "non_trading": ("⏸️", "非交易时间（无实时）", "#f0f0f0"),
+            "unknown": ("⚪", "等待获取数据", "#f0f0f0"),
+            "loading": ("⏳", "后台正在获取当日首个快照", "#f0f0f0"),
+            "failed": ("🔴", "数据获取失败", "#ffe6e6")
+        }
+        status_emoji, status_text, bg_color = data_source_status.get(
+            st.session_state.data_source, data_source_status["unknown"]
+        )
+        st.markdown(f"""
+        <div style="background-color: {bg_color}; padding: 10px 15px; border-radius: 5px; border-left: 4px solid #1890ff; margin: 10px 0;">
+            <strong>{status_emoji} 数据源状态:</strong> {status_text}
+        </div>
+        """, unsafe_allow_html=True)
+        if not df.empty:
+            st.success(f"✅ 成功获取 {len(df)} 条真实股票数据（含行业、市值、换手、资金流）")
+            with st.expander("🔍 查看数据样本"):
+                display_cols = ['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比']
+                display_cols = [c for c in display_cols if c in df.columns]
+                st.dataframe(df[display_cols].head(10))
+                col_stat1, col_stat2, col_stat3 = st.columns(3)
+                with col_stat1:
+                    st.metric("平均涨幅", f"{df['涨跌幅'].mean():.2f}%")
+                with col_stat2:
+                    st.metric("最高涨幅", f"{df['涨跌幅'].max():.2f}%")
+                with col_stat3:
+                    if '成交额' in df.columns:
+                        st.metric("总成交额", f"{df['成交额'].sum()/1e8:.1f}亿")
         else:
-            delta = (now - last).total_seconds() / 60.0
-            if delta >= 1.0:  # 1分钟
-                do_refresh = True
+            if st.session_state.data_source == "non_trading":
+                st.info("⏸️ 当前非交易时间，无实时数据。如需测试，请使用左侧「模拟测试」模式。")
+            elif st.session_state.data_source == "loading":
+                st.info(f"⏳ 后台正在获取当日首个快照，每 {SNAPSHOT_POLL_SECONDS} 秒自动检查一次")
+            else:
+                st.warning("⚠️ 获取到的数据为空，可能原因：Tushare 权限不足、token错误或接口异常")
+    except Exception as e:
+        st.error(f"❌ 数据获取失败: {str(e)}")
+        df = pd.DataFrame(columns=['代码', '名称', '涨跌幅', '成交额', '所属行业', '流通市值', '换手率', '主力净流入占比'])
+    if snapshot_pending and st.session_state.data_source in ("real_data", "cached_real_data"):
+        st.rerun()
 
-# ---- 执行选股（如果需要） ----
-if do_refresh:
-    if df.empty:
-        st.info("当前无股票数据，无法进行选股。")
-        st.session_state.candidate_df = pd.DataFrame()
-        st.session_state.top_candidate = None
+    # 板块强度（用于加分，但不再强制过滤）
+    st.markdown("### 📊 板块热度分析（用于加分）")
+    if df.empty or '所属行业' not in df.columns:
+        st.info("当前无有效板块数据，跳过板块分析。")
+        sector_strength = pd.DataFrame()
     else:
-        # 获取大盘指数涨跌幅（仅用于风险提示）
-        today_str = datetime.now(tz).strftime('%Y%m%d')
-        index_change = get_index_change(today_str)
-        is_index_risky = False
-        if index_change is not None:
-            st.caption(f"📉 上证指数今日涨跌幅: {index_change:.2f}%")
-            if index_change < -1.0:
-                is_index_risky = True
-                st.error(
-                    "🚨 **高风险预警**：今日上证指数跌幅超过 -1%！\n\n"
-                    "市场系统性风险较大，当前孕线突破信号的**失败概率显著升高**。\n"
-                    "⚠️ 策略将继续为您选出标的，但建议 **仓位减半** 或 **严格设置-2%止损**！"
-                )
-            else:
-                st.success("✅ 大盘环境相对平稳，可正常参与")
+        with st.spinner("加载全市场历史日线..."), metrics.stage('market_panel'):
+            get_market_panel(limit=120)
+        with st.spinner("计算板块5日动量..."):
+            sector_strength = calculate_sector_strength_momentum(df, current_time)
+        if not sector_strength.empty:
+            top5_sectors = sector_strength.head(5).index.tolist()
+            st.success(f"🏆 最强主线板块 Top5（动量加权）: {', '.join(top5_sectors)}")
+            st.dataframe(sector_strength[['涨跌幅', '成交额', '涨停家数', '强度得分']].head(5))
+            sector_history = st.session_state.sector_engine.history(top5_sectors)
+            if len(sector_history) > 1:
+                with st.expander("📈 Top5 板块强度分钟走势"):
+                    st.line_chart(sector_history)
         else:
-            st.info("无法获取大盘指数，风险未知，请自行谨慎")
-
-        # 基础过滤
-        filtered = filter_stocks_by_rule(df)
-        st.caption(f"基础过滤后股票数: {len(filtered)}")
-
-        # ---- 【核心改动】不再强制板块过滤，全市场选股 ----
-        # 按成交额排序，优先活跃股
-        filtered = filtered.sort_values('成交额', ascending=False)
-        to_check = filtered.head(200)
-        st.caption(f"将对前 {len(to_check)} 只活跃股进行孕线突破检测...")
-
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        candidates = []
-
-        for i, (idx, row) in enumerate(to_check.iterrows()):
-            status_text.text(f"正在分析 {i+1}/{len(to_check)}: {row['名称']}")
-            # 获取历史数据（120天用于均线判断）
-            hist = get_historical_data(row['代码'], limit=120)
-            if hist.empty or len(hist) < 25:
-                progress_bar.progress((i+1)/len(to_check))
-                continue
-            # 查找最近孕线
-            pregnancy = find_latest_pregnancy(
-                hist,
-                lookback=10,
-                min_gain=st.session_state.get('min_gain', 5),
-                vol_ratio=st.session_state.get('vol_mother', 1.5)
-            )
-            if pregnancy is None:
-                progress_bar.progress((i+1)/len(to_check))
-                continue
-            # 突破判断
-            is_break, break_gain, vol_ratio, reject_reason = check_breakout(
-                row, pregnancy, hist,
-                index_change=index_change,
-                max_deviation_from_ma120=0.30,
-                breakout_threshold=1.01,
-                vol_ratio_break=st.session_state.get('vol_break', 1.5),
-                max_breakthrough_gain=st.session_state.get('max_break', 8.0)
-            )
-            if not is_break:
-                progress_bar.progress((i+1)/len(to_check))
-                continue
-
-            # ================= 增强评分 =================
-            mother = pregnancy['mother']
-            child = pregnancy['child']
-            mother_gain = (mother['close'] - mother['open']) / mother['open'] * 100
-
-            # 板块强度得分（0~30分）
-            sector_score = 0
-            if not sector_strength.empty and row['所属行业'] in sector_strength.index:
-                raw = sector_strength.loc[row['所属行业'], '强度得分']
-                max_raw = sector_strength['强度得分'].max()
-                if max_raw > 0:
-                    sector_score = (raw / max_raw) * 30
-
-            # ---- 新增四大加分因子 ----
-            extra_score = 0
-
-            # 1. 主力资金净流入加分
-            moneyflow = row.get('主力净流入占比', 0)
-            if moneyflow > 2.0:
-                extra_score += 10
-            elif moneyflow > 1.0:
-                extra_score += 5
-
-            # 2. 子线极度缩量加分（洗盘彻底）
-            child_vol = child['vol']
-            if len(hist) >= 5:
-                mother_avg_vol = hist['vol'].tail(5).mean()
-                if mother_avg_vol > 0:
-                    if child_vol < mother_avg_vol * 0.5:
-                        extra_score += 8
-                    elif child_vol < mother_avg_vol * 0.7:
-                        extra_score += 4
-
-            # 3. 相对大盘强度加分（逆势抗跌）
-            if index_change is not None:
-                relative_strength = row['涨跌幅'] - index_change
-                if relative_strength > 1.0:
-                    extra_score += 6
-                elif relative_strength > 0.5:
-                    extra_score += 3
-
-            # 4. 尾盘突破加分（14:30后且接近最高价）
-            if current_hour >= 14 and current_minute >= 30:
-                if row['最新价'] > row['最高价'] * 0.98:
-                    extra_score += 5
-
-            # 综合得分 = 基础分 + 额外加分
-            base_score = (break_gain * 25 + vol_ratio * 25 + mother_gain * 20 + sector_score)
-            score = base_score + extra_score
-            # ===========================================
-
-            # 计算偏离120日均线
-            if len(hist) >= 120:
-                ma120 = hist['close'].tail(120).mean()
-                dev_ma120 = (row['最新价'] - ma120) / ma120 * 100 if ma120 > 0 else np.nan
+            st.warning("未识别主线板块，板块强度加分将为零")
+
+    # ===============================
+    # 选股流程（孕线突破法，全市场 + 板块加分，支持1分钟自动刷新）
+    # ===============================
+    st.markdown("### 🎯 孕线突破选股引擎（全市场 + 板块加分）")
+
+    # ---- 判断是否需要执行选股 ----
+    do_refresh = False
+    if replayer is not None:
+        # 回放模式：每出现新的录制帧就按回放时钟重新选股
+        replay_frame = replayer.frame_at(current_time.strftime('%H%M%S'))
+        if replay_frame is not None and replay_frame != st.session_state.get("replay_frame"):
+            st.session_state.replay_frame = replay_frame
+            do_refresh = True
+    elif st.session_state.get("force_refresh", False):
+        do_refresh = True
+        st.session_state.force_refresh = False
+    elif st.session_state.get("scan_inputs") is not None and st.session_state.scan_inputs['scan_mode'] != scan_mode:
+        # 切换选股范围后立即按新范围重新选股
+        do_refresh = True
+    else:
+        # 检查自动刷新条件
+        if auto_refresh and is_trading:
+            last = st.session_state.get("last_refresh_time")
+            if last is None:
+                do_refresh = True
             else:
-                dev_ma120 = np.nan
-
-            candidates.append({
-                '代码': row['代码'],
-                '名称': row['名称'],
-                '最新价': row['最新价'],
-                '涨跌幅': row['涨跌幅'],
-                '成交额': row['成交额'],
-                '所属行业': row['所属行业'],
-                '母线日期': mother['trade_date'],
-                '母线涨幅': mother_gain,
-                '母线最高价': mother['high'],
-                '子线日期': child['trade_date'],
-                '子线实体': (child['close'] - child['open']) / child['open'] * 100,
-                '突破幅度': break_gain,
-                '放量倍数': vol_ratio,
-                '偏离120日均线': dev_ma120,
-                '板块强度得分': sector_score,
-                '综合得分': score,
-                '大盘风险': is_index_risky
-            })
-            progress_bar.progress((i+1)/len(to_check))
-
-        progress_bar.empty()
-        status_text.empty()
-
-        # 更新session_state中的候选
-        if not candidates:
-            st.warning("未发现任何符合孕线突破条件的股票。")
+                # 留出定时器触发时刻的抖动余量，避免恰好差几毫秒而错过一轮
+                if (now - last).total_seconds() >= SCAN_REFRESH_SECONDS - 2:
+                    do_refresh = True
+
+    # ---- 执行选股（如果需要） ----
+    if do_refresh:
+        if df.empty:
+            st.info("当前无股票数据，无法进行选股。")
             st.session_state.candidate_df = pd.DataFrame()
             st.session_state.top_candidate = None
+            st.session_state.scan_inputs = None
         else:
-            scored_df = pd.DataFrame(candidates)
-            scored_df = scored_df.sort_values('综合得分', ascending=False)
-            top_candidates = scored_df.head(10)
-            top_candidate = top_candidates.iloc[0].to_dict() if not top_candidates.empty else None
-            st.session_state.candidate_df = top_candidates.copy()
-            st.session_state.top_candidate = top_candidate
-            st.session_state.last_refresh_time = now
-        # ---- 选股结束 ----
-
-# ===============================
-# 显示候选结果（无论是否刷新，均从session读取）
-# ===============================
-if not st.session_state.candidate_df.empty:
-    top_candidate = st.session_state.top_candidate
-    st.markdown("#### 📈 优选股票综合分析")
-    if top_candidate:
-        col_info, col_factors = st.columns([1, 2])
-        with col_info:
-            st.metric("**选中股票**", f"{top_candidate.get('名称', 'N/A')}")
-            st.metric("**代码**", f"{top_candidate.get('代码', 'N/A')}")
-            st.metric("**综合得分**", f"{top_candidate.get('综合得分', 0):.1f}")
-            st.metric("**今日涨幅**", f"{top_candidate.get('涨跌幅', 0):.2f}%")
-            st.metric("**突破幅度**", f"{top_candidate.get('突破幅度', 0):.2f}%")
-            st.metric("**放量倍数**", f"{top_candidate.get('放量倍数', 0):.2f}x")
-            st.metric("**板块强度**", f"{top_candidate.get('板块强度得分', 0):.1f}")
-            if top_candidate.get('大盘风险', False):
-                st.error("⚠️ 当前处于**大盘高风险**状态，建议轻仓！")
+            # 获取大盘指数涨跌幅（仅用于风险提示）
+            today_str = replayer.trade_date if replayer is not None else datetime.now(tz).strftime('%Y%m%d')
+            with metrics.stage('index_change'):
+                index_change = get_index_change(today_str)
+            is_index_risky = False
+            if index_change is not None:
+                st.caption(f"📉 上证指数今日涨跌幅: {index_change:.2f}%")
+                if index_change < -1.0:
+                    is_index_risky = True
+                    st.error(
+                        "🚨 **高风险预警**：今日上证指数跌幅超过 -1%！\n\n"
+                        "市场系统性风险较大，当前孕线突破信号的**失败概率显著升高**。\n"
+                        "⚠️ 策略将继续为您选出标的，但建议 **仓位减半** 或 **严格设置-2%止损**！"
+                    )
+                else:
+                    st.success("✅ 大盘环境相对平稳，可正常参与")
             else:
-                st.success("✅ 大盘环境正常")
-        with col_factors:
-            st.write("**孕线参数**")
-            st.write(f"- 母线日期: {top_candidate.get('母线日期', '')}")
-            st.write(f"- 母线涨幅: {top_candidate.get('母线涨幅', 0):.2f}%")
-            st.write(f"- 母线最高价: {top_candidate.get('母线最高价', 0):.2f}")
-            st.write(f"- 子线日期: {top_candidate.get('子线日期', '')}")
-            st.write(f"- 子线实体: {top_candidate.get('子线实体', 0):.2f}%")
-            st.write(f"- 偏离120日均线: {top_candidate.get('偏离120日均线', 0):.1f}%")
-            st.write("**过滤条件**：标志性K线✓ 相对位置✓ 放量确认✓")
-
-    st.markdown("#### 🏆 候选股票排名 (按综合得分前5)")
-    display_df = st.session_state.candidate_df[['名称', '代码', '涨跌幅', '成交额', '母线涨幅', '突破幅度', '放量倍数', '板块强度得分', '综合得分']].head().copy()
-    display_df['涨跌幅'] = display_df['涨跌幅'].apply(lambda x: f"{x:.2f}%")
-    display_df['成交额'] = display_df['成交额'].apply(lambda x: f"{x/1e8:.2f}亿")
-    display_df['母线涨幅'] = display_df['母线涨幅'].apply(lambda x: f"{x:.2f}%")
-    display_df['突破幅度'] = display_df['突破幅度'].apply(lambda x: f"{x:.2f}%")
-    display_df['放量倍数'] = display_df['放量倍数'].apply(lambda x: f"{x:.2f}x")
-    display_df['板块强度得分'] = display_df['板块强度得分'].apply(lambda x: f"{x:.1f}")
-    display_df['综合得分'] = display_df['综合得分'].apply(lambda x: f"{x:.1f}")
-    st.dataframe(display_df, use_container_width=True)
-
-    # 保存用于自动推荐的候选
-    if top_candidate:
-        st.session_state.test_top_stock = {
-            'name': top_candidate.get('名称', ''),
-            'code': top_candidate.get('代码', ''),
-            '涨跌幅': float(top_candidate.get('涨跌幅', 0)),
-            '成交额': float(top_candidate.get('成交额', 0)),
-            '最终总分': float(top_candidate.get('综合得分', 0)),
-            'time': current_time_str,
-            'sector': top_candidate.get('所属行业', '全市场'),
-            'data_source': st.session_state.data_source,
-            '大盘风险': top_candidate.get('大盘风险', False)
-        }
-else:
-    if df.empty:
-        st.info("当前无股票数据，无法进行选股。")
-    elif do_refresh and not candidates:
-        st.warning("未发现任何符合孕线突破条件的股票。")
+                st.info("无法获取大盘指数，风险未知，请自行谨慎")
+
+            # 基础过滤
+            scan_start = time.perf_counter()
+            with metrics.stage('filter', rows=len(df)):
+                filtered = filter_stocks_by_rule(df)
+            st.caption(f"基础过滤后股票数: {len(filtered)}")
+
+            # ---- 【核心改动】不再强制板块过滤，全市场选股 ----
+            # 按成交额排序，优先活跃股
+            filtered = filtered.sort_values('成交额', ascending=False)
+            if scan_mode == "全市场":
+                to_check = filtered
+                st.caption(f"全市场模式：将对全部 {len(to_check)} 只股票进行孕线突破检测...")
+            else:
+                to_check = filtered.head(200)
+                st.caption(f"将对前 {len(to_check)} 只活跃股进行孕线突破检测...")
+
+            # 孕线特征：面板可用时一次向量化识别，否则逐只回退
+            pattern_params = (st.session_state.get('min_gain', 5), st.session_state.get('vol_mother', 1.5))
+            with metrics.stage('pregnancy_features', rows=len(to_check)):
+                scan_rows, feats = build_pregnancy_features(to_check, *pattern_params, trade_date=today_str)
+            st.caption(f"其中 {len(scan_rows)} 只存在有效孕线，进入突破评分")
+            st.session_state.scan_inputs = {
+                'universe': to_check,
+                'scan_mode': scan_mode,
+                'prep_seconds': time.perf_counter() - scan_start,
+                'to_check': scan_rows,
+                'feats': feats,
+                'pattern_params': pattern_params,
+                'index_change': index_change,
+                'is_index_risky': is_index_risky,
+                'trade_date': today_str,
+            }
+            st.session_state.scan_score_params = None
+
+    # ---- 突破判断与评分（列式、增量：只重算快照有变化的股票；调整滑块后整表重新评分，无需重新拉取数据） ----
+    candidates = []
+    scan_inputs = st.session_state.get("scan_inputs")
+    if scan_inputs is not None:
+        pattern_params = (st.session_state.get('min_gain', 5), st.session_state.get('vol_mother', 1.5))
+        if pattern_params != scan_inputs['pattern_params']:
+            with metrics.stage('pregnancy_features', rows=len(scan_inputs['universe'])):
+                scan_inputs['to_check'], scan_inputs['feats'] = build_pregnancy_features(
+                    scan_inputs['universe'], *pattern_params, trade_date=scan_inputs['trade_date'])
+            scan_inputs['pattern_params'] = pattern_params
+            st.session_state.scan_score_params = None
+        late_session = current_hour >= 14 and current_minute >= 30
+        score_params = (pattern_params, st.session_state.get('vol_break', 1.5),
+                        st.session_state.get('max_break', 8.0), late_session)
+        if score_params != st.session_state.get("scan_score_params"):
+            score_start = time.perf_counter()
+            to_check = scan_inputs['to_check']
+            if st.session_state.scorer is None:
+                st.session_state.scorer = IncrementalScorer()
+            scorer = st.session_state.scorer
+            with metrics.stage('score') as score_stage:
+                scores = scorer.score(
+                    to_check, scan_inputs['feats'],
+                    sector_strength=sector_strength,
+                    index_change=scan_inputs['index_change'],
+                    late_session=late_session,
+                    max_deviation_from_ma120=0.30,
+                    breakout_threshold=1.01,
+                    vol_ratio_break=st.session_state.get('vol_break', 1.5),
+                    max_breakthrough_gain=st.session_state.get('max_break', 8.0)
+                )
+                score_stage['rows'] = scorer.last_stats['recomputed']
+                candidates = build_candidates(to_check, scan_inputs['feats'], scores, scan_inputs['is_index_risky'])
+            st.session_state.scan_score_params = score_params
+            st.session_state.scan_timing = {
+                'mode': scan_inputs['scan_mode'],
+                'universe': len(scan_inputs['universe']),
+                'setups': len(to_check),
+                'recomputed': scorer.last_stats['recomputed'],
+                'reused': scorer.last_stats['reused'],
+                # 重新评分时只计评分耗时；完整选股计入过滤与形态连接
+                'seconds': (scan_inputs['prep_seconds'] if do_refresh else 0) + time.perf_counter() - score_start,
+            }
+
+            # 更新session_state中的候选
+            if not candidates:
+                st.warning("未发现任何符合孕线突破条件的股票。")
+                st.session_state.candidate_df = pd.DataFrame()
+                st.session_state.top_candidate = None
+            else:
+                scored_df = pd.DataFrame(candidates)
+                scored_df = scored_df.sort_values('综合得分', ascending=False)
+                top_candidates = scored_df.head(10)
+                top_candidate = top_candidates.iloc[0].to_dict() if not top_candidates.empty else None
+                st.session_state.candidate_df = top_candidates.copy()
+                st.session_state.top_candidate = top_candidate
+                st.session_state.last_refresh_time = current_time if replayer is not None else now
+
+    scan_timing = st.session_state.get("scan_timing")
+    if scan_timing is not None and scan_inputs is not None:
+        msg = (f"⏱️ 本次选股耗时 {scan_timing['seconds']:.2f} 秒："
+               f"评估 {scan_timing['universe']} 只，其中 {scan_timing['setups']} 只有孕线形态"
+               f"（重算 {scan_timing['recomputed']} 只，复用 {scan_timing['reused']} 只）")
+        if scan_timing['mode'] == "全市场":
+            msg += f"（预算 {FULL_SCAN_BUDGET_SEC:.1f} 秒）"
+            if scan_timing['seconds'] > FULL_SCAN_BUDGET_SEC:
+                st.warning(msg + " ⚠️ 已超出预算，可能是历史数据尚未预热")
+            else:
+                st.caption(msg)
+        else:
+            st.caption(msg)
+    # ---- 选股结束 ----
+
+    # ===============================
+    # 显示候选结果（无论是否刷新，均从session读取）
+    # ===============================
+    if not st.session_state.candidate_df.empty:
+        top_candidate = st.session_state.top_candidate
+        st.markdown("#### 📈 优选股票综合分析")
+        if top_candidate:
+            col_info, col_factors = st.columns([1, 2])
+            with col_info:
+                st.metric("**选中股票**", f"{top_candidate.get('名称', 'N/A')}")
+                st.metric("**代码**", f"{top_candidate.get('代码', 'N/A')}")
+                st.metric("**综合得分**", f"{top_candidate.get('综合得分', 0):.1f}")
+                st.metric("**今日涨幅**", f"{top_candidate.get('涨跌幅', 0):.2f}%")
+                st.metric("**突破幅度**", f"{top_candidate.get('突破幅度', 0):.2f}%")
+                st.metric("**放量倍数**", f"{top_candidate.get('放量倍数', 0):.2f}x")
+                st.metric("**板块强度**", f"{top_candidate.get('板块强度得分', 0):.1f}")
+                if top_candidate.get('大盘风险', False):
+                    st.error("⚠️ 当前处于**大盘高风险**状态，建议轻仓！")
+                else:
+                    st.success("✅ 大盘环境正常")
+            with col_factors:
+                st.write("**孕线参数**")
+                st.write(f"- 母线日期: {top_candidate.get('母线日期', '')}")
+                st.write(f"- 母线涨幅: {top_candidate.get('母线涨幅', 0):.2f}%")
+                st.write(f"- 母线最高价: {top_candidate.get('母线最高价', 0):.2f}")
+                st.write(f"- 子线日期: {top_candidate.get('子线日期', '')}")
+                st.write(f"- 子线实体: {top_candidate.get('子线实体', 0):.2f}%")
+                st.write(f"- 偏离120日均线: {top_candidate.get('偏离120日均线', 0):.1f}%")
+                st.write("**过滤条件**：标志性K线✓ 相对位置✓ 放量确认✓")
+
+        st.markdown("#### 🏆 候选股票排名 (按综合得分前5)")
+        display_df = st.session_state.candidate_df[['名称', '代码', '涨跌幅', '成交额', '母线涨幅', '突破幅度', '放量倍数', '板块强度得分', '综合得分']].head().copy()
+        display_df['涨跌幅'] = display_df['涨跌幅'].apply(lambda x: f"{x:.2f}%")
+        display_df['成交额'] = display_df['成交额'].apply(lambda x: f"{x/1e8:.2f}亿")
+        display_df['母线涨幅'] = display_df['母线涨幅'].apply(lambda x: f"{x:.2f}%")
+        display_df['突破幅度'] = display_df['突破幅度'].apply(lambda x: f"{x:.2f}%")
+        display_df['放量倍数'] = display_df['放量倍数'].apply(lambda x: f"{x:.2f}x")
+        display_df['板块强度得分'] = display_df['板块强度得分'].apply(lambda x: f"{x:.1f}")
+        display_df['综合得分'] = display_df['综合得分'].apply(lambda x: f"{x:.1f}")
+        st.dataframe(display_df, use_container_width=True)
+
+        # 盘中分钟因子（来自后台快照的环形缓冲；回放模式下不可用）
+        if replayer is None and len(market_worker.intraday):
+            intraday_df = market_worker.intraday.factors(st.session_state.candidate_df['代码'].head().tolist())
+            if not intraday_df.empty:
+                with st.expander("⏱️ 盘中量能（分钟级）"):
+                    st.dataframe(intraday_df.round(2), use_container_width=True)
+
+        # 保存用于自动推荐的候选
+        if top_candidate:
+            st.session_state.test_top_stock = {
+                'name': top_candidate.get('名称', ''),
+                'code': top_candidate.get('代码', ''),
+                '涨跌幅': float(top_candidate.get('涨跌幅', 0)),
+                '成交额': float(top_candidate.get('成交额', 0)),
+                '最终总分': float(top_candidate.get('综合得分', 0)),
+                'time': current_time_str,
+                'sector': top_candidate.get('所属行业', '全市场'),
+                'data_source': st.session_state.data_source,
+                '大盘风险': top_candidate.get('大盘风险', False)
+            }
+    else:
+        if df.empty:
+            st.info("当前无股票数据，无法进行选股。")
+        elif do_refresh and not candidates:
+            st.warning("未发现任何符合孕线突破条件的股票。")
+        else:
+            st.info("暂无符合条件的候选股，请等待下次刷新或调整参数。")
+
+    # ===============================
+    # 自动推荐（保留原有逻辑，适配新字段）
+    # ===============================
+    st.markdown("### 🤖 自动推荐系统")
+    use_real_data = st.session_state.data_source in ["real_data", "cached_real_data", "replay"]
+    if not use_real_data:
+        st.info("⏸️ 当前非交易时间或无实时数据，自动推荐已暂停")
     else:
-        st.info("暂无符合条件的候选股，请等待下次刷新或调整参数。")
+        top_candidate = st.session_state.get("top_candidate")
+        if is_first_rec_time and st.session_state.morning_pick is None and top_candidate is not None:
+            st.session_state.morning_pick = {
+                'name': top_candidate.get('名称', ''),
+                'code': top_candidate.get('代码', ''),
+                '涨跌幅': float(top_candidate.get('涨跌幅', 0)),
+                '成交额': float(top_candidate.get('成交额', 0)),
+                'time': current_time_str,
+                'auto': True,
+                'final_score': float(top_candidate.get('综合得分', 0)),
+                'sector': top_candidate.get('所属行业', '全市场'),
+                'data_source': st.session_state.data_source,
+                '突破幅度': top_candidate.get('突破幅度', 0),
+                '放量倍数': top_candidate.get('放量倍数', 0),
+                '大盘风险': top_candidate.get('大盘风险', False)
+            }
+            add_log("自动推荐", f"生成首次推荐: {top_candidate.get('名称', '')}")
+            st.success(f"🕐 **首次推荐已生成**: {top_candidate.get('名称', '')}")
+            st.rerun()
 
-# ===============================
-# 自动推荐（保留原有逻辑，适配新字段）
-# ===============================
-st.markdown("### 🤖 自动推荐系统")
-use_real_data = st.session_state.data_source in ["real_data", "cached_real_data"]
-if not use_real_data:
-    st.info("⏸️ 当前非交易时间或无实时数据，自动推荐已暂停")
-else:
-    top_candidate = st.session_state.get("top_candidate")
-    if is_first_rec_time and st.session_state.morning_pick is None and top_candidate is not None:
-        st.session_state.morning_pick = {
-            'name': top_candidate.get('名称', ''),
-            'code': top_candidate.get('代码', ''),
-            '涨跌幅': float(top_candidate.get('涨跌幅', 0)),
-            '成交额': float(top_candidate.get('成交额', 0)),
-            'time': current_time_str,
-            'auto': True,
-            'final_score': float(top_candidate.get('综合得分', 0)),
-            'sector': top_candidate.get('所属行业', '全市场'),
-            'data_source': st.session_state.data_source,
-            '突破幅度': top_candidate.get('突破幅度', 0),
-            '放量倍数': top_candidate.get('放量倍数', 0),
-            '大盘风险': top_candidate.get('大盘风险', False)
-        }
-        add_log("自动推荐", f"生成首次推荐: {top_candidate.get('名称', '')}")
-        st.success(f"🕐 **首次推荐已生成**: {top_candidate.get('名称', '')}")
+    scan_summary = {'scan': do_refresh, 'scan_mode': scan_mode, 'data_source': st.session_state.data_source,
+                    'candidates': len(st.session_state.candidate_df)}
+    st.session_state.scan_summary = scan_summary
+    if own_refresh:
+        metrics.end_refresh(**scan_summary)
+    # 回放结束：整页重跑一次以停止定时器
+    if replayer is not None and replayer.finished and scan_run_every is not None:
         st.rerun()
 
+scan_section(use_real_time, scan_mode, auto_refresh)
+
+# 推荐结果与手动选择只在整页运行时渲染，时间与时段按当前时刻重新计算
+replayer, current_time = resolve_current_time(use_real_time, datetime.now(tz))
+current_time_str = current_time.strftime("%H:%M:%S")
+is_first_rec_time, is_final_lock_time = recommendation_windows(current_time)
+use_real_data = st.session_state.data_source in ["real_data", "cached_real_data", "replay"]
+
 # 推荐显示区域（适配新字段）
 st.markdown("---")
 st.markdown("### 📋 推荐结果")
@@ -1016,7 +1322,7 @@ with col_rec1:
     st.subheader("🕐 首次推荐 (13:30-14:00)")
     if st.session_state.morning_pick is not None:
         pick = st.session_state.morning_pick
-        data_source_tag = {"real_data": "🟢 Tushare", "cached_real_data": "🟡 缓存"}.get(pick.get('data_source', ''), '')
+        data_source_tag = {"real_data": "🟢 Tushare", "cached_real_data": "🟡 缓存", "replay": "⏪ 回放"}.get(pick.get('data_source', ''), '')
         risk_html = ""
         if pick.get('大盘风险', False):
             risk_html = '<p style="color:red; font-weight:bold; background-color:#ffe6e6; padding:8px; border-radius:4px;">🚨 大盘高风险信号，请严控仓位！</p>'
@@ -1056,7 +1362,7 @@ with col_rec2:
         risk_html = ""
         if pick.get('大盘风险', False):
             risk_html = '<p style="color:red; font-weight:bold; background-color:#ffe6e6; padding:8px; border-radius:4px;">🚨 大盘高风险信号，请严控仓位！</p>'
-        data_source_tag = {"real_data": "🟢 Tushare", "cached_real_data": "🟡 缓存"}.get(pick.get('data_source', ''), '')
+        data_source_tag = {"real_data": "🟢 Tushare", "cached_real_data": "🟡 缓存", "replay": "⏪ 回放"}.get(pick.get('data_source', ''), '')
         st.markdown(f"""
         <div style="background-color: #fff3cd; padding: 20px; border-radius: 10px; border-left: 5px solid #f39c12;">
             <h3 style="margin-top: 0; color: #2c3e50;">{pick['name']} ({pick['code']}) {data_source_tag}</h3>
@@ -1130,3 +1436,6 @@ if not st.session_state.candidate_df.empty and not st.session_state.final_locked
         }
         st.session_state.final_locked = True
         st.rerun()
+
+metrics.end_refresh(**st.session_state.get("scan_summary", {}))
+
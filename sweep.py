@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+侧边栏阈值的并行参数扫描（网格 / 随机搜索）
+===================================================================
+✅ 核心逻辑：
+   - 参数分两类：形态参数（母线涨幅 min_gain、母线放量 vol_mother）决定孕线形态表；
+     评分参数（突破放量 vol_break、突破最大涨幅 max_break、突破阈值 breakout_threshold、
+     偏离120日均线上限 max_deviation）只影响 score_breakouts
+   - 第一步：按交易日分片多进程预计算一张共享特征面板——每个交易日 × 每组形态参数下
+     通过基础过滤且存在孕线的股票，连同快照字段、板块强度得分、大盘涨跌幅、次日收益，
+     落盘为 data_cache/sweep/*.parquet，同一区间重复扫描直接复用
+   - 第二步：进程池中每个进程只加载一次特征面板，每组参数对整个区间调用一次列式 score_breakouts，
+     按交易日取综合得分前 top_k，统计胜率、次日平均收益、入选次数
+✅ 用法：
+   python sweep.py --start 20210101 --end 20251231 [--min-gain 4,5,6] [--vol-break 1.2,1.5,2.0] [--random 200]
+   （需先用 backtest.py --sync 补齐本地日线，并设置 TUSHARE_TOKEN 读取名称/行业与大盘指数）
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import (HISTORY_LIMIT, backtest_trade_dates, complete_days, iter_shard_days, load_index_changes,
+                      load_stock_basic, report_skipped, shard_dates, snapshot_from_daily,
+                      sector_strength_from_panel, summarize)
+from bar_store import DailyBarStore
+from premarket import compute_setups
+from providers import make_pro
+from strategy import FEATURE_COLUMNS, filter_stocks_by_rule, score_breakouts, sector_scores
+
+SWEEP_DIR = "sweep"
+PATTERN_KEYS = ['min_gain', 'vol_mother']
+SCORE_KEYS = ['vol_break', 'max_break', 'breakout_threshold', 'max_deviation']
+DEFAULT_SPACE = {
+    'min_gain': [4, 5, 6],
+    'vol_mother': [1.3, 1.5, 1.8],
+    'vol_break': [1.2, 1.5, 1.8, 2.0],
+    'max_break': [6, 8, 10],
+    'breakout_threshold': [1.0, 1.01, 1.02],
+    'max_deviation': [0.2, 0.3, 0.4],
+}
+SNAP_COLUMNS = ['代码', '最新价', '成交量', '最高价', '涨跌幅', '所属行业']
+
+
+# ===============================
+# 第一步：共享特征面板
+# ===============================
+def _feature_shard(root, shard_dates, window_dates, basic, index_changes, patterns):
+    store = DailyBarStore(root)
+    frames = []
+    for d, panel, day, nxt in iter_shard_days(store, shard_dates, window_dates):
+        if len(panel) == 0 or day.empty:
+            continue
+        snap = snapshot_from_daily(day, basic)
+        filtered = filter_stocks_by_rule(snap).sort_values('成交额', ascending=False).reset_index(drop=True)
+        filtered['成交额排名'] = np.arange(1, len(filtered) + 1)
+        filtered['板块强度得分'] = sector_scores(filtered, sector_strength_from_panel(snap, panel))
+        if nxt is not None and not nxt.empty:
+            nxt = nxt.set_index('ts_code')
+            filtered['次日开盘收益'] = (filtered['代码'].map(nxt['open']) / filtered['最新价'] - 1) * 100
+            filtered['次日收盘收益'] = (filtered['代码'].map(nxt['close']) / filtered['最新价'] - 1) * 100
+        else:
+            filtered['次日开盘收益'] = np.nan
+            filtered['次日收盘收益'] = np.nan
+        for min_gain, vol_mother in patterns:
+            setups = compute_setups(panel, min_gain=min_gain, vol_ratio=vol_mother, limit=HISTORY_LIMIT)
+            rows = filtered[filtered['代码'].isin(setups.index)].reset_index(drop=True)
+            feats = setups.loc[rows['代码'], FEATURE_COLUMNS].reset_index(drop=True)
+            rows = pd.concat([rows[SNAP_COLUMNS + ['成交额排名', '板块强度得分', '次日开盘收益', '次日收盘收益']],
+                              feats], axis=1)
+            rows['trade_date'] = d
+            rows['指数涨跌幅'] = index_changes.get(d, np.nan)
+            rows['min_gain'] = float(min_gain)
+            rows['vol_mother'] = float(vol_mother)
+            frames.append(rows)
+    frames = [f for f in frames if not f.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _feature_shard_task(task):
+    return _feature_shard(**task)
+
+
+def feature_panel_path(store, start, end, patterns, n_days):
+    # 文件名带上可用交易日数：补齐本地日线后自动重建，不复用残缺区间的面板
+    key = "_".join(f"{g:g}x{v:g}" for g, v in sorted(patterns))
+    return os.path.join(store.root, SWEEP_DIR, f"features_{start}_{end}_{key}_{n_days}d.parquet")
+
+
+def build_feature_panel(start, end, basic, index_changes, patterns, trade_dates, store=None, workers=None,
+                        log=None):
+    """
+    预计算共享特征面板（已存在则直接返回路径）。
+    每行 = 某交易日某组形态参数下的一只孕线股票，score_breakouts 所需字段齐全；
+    trade_dates 为交易日历给出的开市日，回看窗口或次日缺少本地日线的交易日不进入面板
+    """
+    store = store or DailyBarStore()
+    all_dates = list(trade_dates)
+    dates, skipped = complete_days([d for d in all_dates if start <= d <= end], all_dates, store.stored_dates())
+    report_skipped(skipped, log, event="参数扫描")
+    if not dates:
+        raise ValueError(f"{start}~{end} 本地仓库没有回看窗口完整的交易日，请先运行 backtest.py --sync")
+    path = feature_panel_path(store, start, end, patterns, len(dates))
+    if os.path.exists(path):
+        return path
+    workers = workers or os.cpu_count() or 1
+    tasks = [dict(root=store.root, shard_dates=chunk, window_dates=window, basic=basic,
+                  index_changes=index_changes, patterns=patterns)
+             for chunk, window in shard_dates(dates, all_dates, workers * 4)]
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        frames = [f for f in pool.map(_feature_shard_task, tasks) if not f.empty]
+    if not frames:
+        raise ValueError(f"{start}~{end} 本地仓库没有可用日线，请先运行 backtest.py --sync")
+    panel = pd.concat(frames, ignore_index=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    panel.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    if log:
+        log("参数扫描", f"特征面板 {len(panel)} 行，{len(dates)} 个交易日，用时 {time.perf_counter() - t0:.1f} 秒")
+    return path
+
+
+# ===============================
+# 第二步：并行评估参数组合
+# ===============================
+_FEATURES = {}
+
+
+def _init_worker(path):
+    # 每个进程只读一次特征面板，并按形态参数预先分组
+    panel = pd.read_parquet(path)
+    _FEATURES.update({key: g.reset_index(drop=True) for key, g in panel.groupby(PATTERN_KEYS)})
+
+
+def evaluate(params, top_k=3, universe=None, features=None):
+    """对整个区间评估一组参数，返回参数 + 统计指标"""
+    features = features if features is not None else _FEATURES
+    rows = features.get((float(params['min_gain']), float(params['vol_mother'])))
+    result = dict(params)
+    if rows is None or rows.empty:
+        return dict(result, **summarize(pd.DataFrame(columns=['trade_date', '次日开盘收益', '次日收盘收益'])))
+    if universe:
+        rows = rows[rows['成交额排名'] <= universe].reset_index(drop=True)
+    scores = score_breakouts(
+        rows, rows,
+        index_change=rows['指数涨跌幅'].to_numpy(dtype=float),
+        late_session=True,
+        max_deviation_from_ma120=params['max_deviation'],
+        breakout_threshold=params['breakout_threshold'],
+        vol_ratio_break=params['vol_break'],
+        max_breakthrough_gain=params['max_break'],
+        sector_score=rows['板块强度得分'].to_numpy(dtype=float),
+    )
+    hit = rows.loc[scores['突破有效'].to_numpy(), ['trade_date', '次日开盘收益', '次日收盘收益']]
+    hit['综合得分'] = scores.loc[scores['突破有效'], '综合得分'].to_numpy()
+    hit = hit.sort_values(['trade_date', '综合得分'], ascending=[True, False], kind='mergesort')
+    picks = hit[hit.groupby('trade_date').cumcount() < top_k]
+    return dict(result, **summarize(picks))
+
+
+def _evaluate_task(task):
+    params, top_k, universe = task
+    return evaluate(params, top_k=top_k, universe=universe)
+
+
+def parameter_grid(space, n_random=None, seed=0):
+    """网格（全部组合）或从网格中随机抽取 n_random 组"""
+    keys = PATTERN_KEYS + SCORE_KEYS
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if n_random and n_random < len(combos):
+        combos = random.Random(seed).sample(combos, n_random)
+    return combos
+
+
+def run_sweep(feature_path, combos, top_k=3, universe=None, workers=None, log=None):
+    """并行评估所有组合，返回未排序的结果表"""
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(feature_path,)) as pool:
+        results = list(pool.map(_evaluate_task, [(c, top_k, universe) for c in combos],
+                                chunksize=max(1, len(combos) // (workers * 8))))
+    if log:
+        log("参数扫描", f"评估 {len(combos)} 组参数，用时 {time.perf_counter() - t0:.1f} 秒")
+    return pd.DataFrame(results)
+
+
+def rank_results(results, sort_by='次日收盘平均收益', min_picks=30):
+    """入选次数不足 min_picks 的组合样本太少，排在最后"""
+    enough = results['入选次数'] >= min_picks
+    return pd.concat([
+        results[enough].sort_values(sort_by, ascending=False),
+        results[~enough].sort_values(sort_by, ascending=False),
+    ]).reset_index(drop=True)
+
+
+def _parse_list(text, cast=float):
+    return [cast(x) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="孕线突破参数扫描")
+    parser.add_argument("--start", required=True, help="起始交易日 YYYYMMDD")
+    parser.add_argument("--end", required=True, help="结束交易日 YYYYMMDD")
+    for key, values in DEFAULT_SPACE.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", default=",".join(f"{v:g}" for v in values),
+                            help=f"候选值，逗号分隔（默认 {','.join(f'{v:g}' for v in values)}）")
+    parser.add_argument("--random", type=int, default=None, help="随机抽取N组而不是全网格")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=3, help="每日入选只数")
+    parser.add_argument("--universe", type=int, default=None, help="只评估成交额前N只（默认全市场）")
+    parser.add_argument("--min-picks", type=int, default=30, help="入选次数低于该值的组合排在最后")
+    parser.add_argument("--sort-by", default="次日收盘平均收益", help="排序指标：胜率 / 次日开盘平均收益 / 次日收盘平均收益")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--out", default=None, help="结果 CSV 路径，默认 data_cache/sweep/results_起止日.csv")
+    args = parser.parse_args(argv)
+
+    try:
+        pro = make_pro()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    def log(event, details):
+        print(f"[{event}] {details}")
+
+    space = {key: _parse_list(getattr(args, key)) for key in DEFAULT_SPACE}
+    combos = parameter_grid(space, args.random, args.seed)
+    patterns = sorted({(c['min_gain'], c['vol_mother']) for c in combos})
+    store = DailyBarStore()
+    path = build_feature_panel(args.start, args.end, load_stock_basic(pro, store),
+                               load_index_changes(pro, args.start, args.end), patterns,
+                               backtest_trade_dates(pro, args.start, args.end, store, with_next=True),
+                               store=store, workers=args.workers, log=log)
+    results = rank_results(run_sweep(path, combos, top_k=args.top, universe=args.universe,
+                                     workers=args.workers, log=log),
+                           sort_by=args.sort_by, min_picks=args.min_picks)
+    out = args.out or os.path.join(store.root, SWEEP_DIR, f"results_{args.start}_{args.end}.csv")
+    results.to_csv(out, index=False, encoding="utf-8-sig")
+    log("参数扫描", f"结果已写入 {out}")
+    print(results.head(20).to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+合成行情生成器（固定随机种子，可复现）
+===================================================================
+✅ 大盘 + 行业 + 个股三因子随机游走，行业规模近似幂律，含停牌缺口、次新股、ST 名称
+✅ 在一部分股票的最近两根K线上植入「放量大阳母线 + 缩量阴线子线」孕线，
+   当日快照中这些股票放量突破母线高点
+✅ 供性能基准（benchmark.py）与本地离线数据源（providers.LocalPro）共用
+"""
+import numpy as np
+import pandas as pd
+
+INDUSTRIES = ['银行', '证券', '保险', '白酒', '医药商业', '化学制药', '中成药', '半导体', '元器件', '软件服务',
+              '通信设备', '电气设备', '汽车整车', '汽车配件', '家用电器', '建筑工程', '水泥', '钢铁', '煤炭开采',
+              '有色金属', '化工原料', '农药化肥', '电力', '环境保护', '全国地产', '食品', '饮料', '纺织服装',
+              '影视音像', '互联网']
+
+
+# ===============================
+# 合成行情
+# ===============================
+def synthetic_market(n_stocks=5000, n_days=250, seed=0, plant_ratio=0.05, end_date='20261016'):
+    """
+    返回 (bars, snap)：
+    bars 为 pro.daily 格式的长表（n_days 个已收盘交易日），
+    snap 为与 fetch_from_tushare 相同列名的「今日」快照
+    """
+    rng = np.random.default_rng(seed)
+    dates = [d.strftime('%Y%m%d') for d in pd.bdate_range(end=end_date, periods=n_days + 1)]
+    S, T = n_stocks, n_days
+    codes = np.array([f"{600000 + i:06d}.SH" if i % 2 == 0 else f"{1 + i:06d}.SZ" for i in range(S)])
+    # 行业规模近似幂律：大行业数百只，小行业几十只
+    weights = 1.0 / np.arange(1, len(INDUSTRIES) + 1) ** 0.8
+    industry = rng.choice(len(INDUSTRIES), S, p=weights / weights.sum())
+
+    market = rng.normal(0.0003, 0.01, T + 1)
+    sector = rng.normal(0, 0.012, (len(INDUSTRIES), T + 1))
+    beta = rng.uniform(0.6, 1.4, S)
+    ret = beta[:, None] * market + sector[industry] + rng.normal(0, 0.02, (S, T + 1))
+    ret = np.clip(ret, -0.1, 0.1)
+    close = rng.lognormal(2.5, 0.6, S)[:, None] * np.cumprod(1 + ret, axis=1)
+    prev = np.concatenate([close[:, :1] / (1 + ret[:, :1]), close[:, :-1]], axis=1)
+    open_ = prev * (1 + rng.normal(0, 0.006, (S, T + 1)))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, (S, T + 1))))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, (S, T + 1))))
+    base_vol = rng.lognormal(11, 0.8, S)
+    vol = base_vol[:, None] * np.exp(rng.normal(0, 0.35, (S, T + 1))) * (1 + 20 * np.abs(ret))
+
+    # 植入孕线：母线 T-2（放量大阳、近20日最大量），子线 T-1（缩量阴线、被母线包容）
+    planted = rng.choice(S, int(S * plant_ratio), replace=False)
+    m, c = T - 2, T - 1
+    open_[planted, m] = prev[planted, m]
+    close[planted, m] = open_[planted, m] * (1 + rng.uniform(0.06, 0.09, len(planted)))
+    high[planted, m] = close[planted, m] * 1.005
+    low[planted, m] = open_[planted, m] * 0.995
+    vol[planted, m] = vol[planted, m - 20:m].max(axis=1) * 3
+    open_[planted, c] = close[planted, m] * 0.995
+    close[planted, c] = open_[planted, c] * 0.99
+    high[planted, c] = open_[planted, c] * 1.002
+    low[planted, c] = close[planted, c] * 0.998
+    vol[planted, c] = vol[planted, m] * 0.3
+    prev[planted, c] = close[planted, m]
+    # 今日：孕线股放量突破母线高点 2%~6%
+    prev[:, T] = close[:, T - 1]
+    close[planted, T] = high[planted, m] * rng.uniform(1.02, 1.06, len(planted))
+    high[planted, T] = close[planted, T] * 1.003
+    vol[planted, T] = vol[planted, T - 5:T].mean(axis=1) * rng.uniform(1.8, 3.0, len(planted))
+
+    # 停牌缺口（约2%的股票停牌5~20日）与次新股（约3%的股票只有30~100根K线）
+    present = np.ones((S, T), dtype=bool)
+    halted = np.setdiff1d(rng.choice(S, int(S * 0.02), replace=False), planted)
+    for i in halted:
+        start = rng.integers(20, T - 30)
+        present[i, start:start + rng.integers(5, 20)] = False
+    fresh = np.setdiff1d(rng.choice(S, int(S * 0.03), replace=False), planted)
+    for i in fresh:
+        present[i, :T - rng.integers(30, 100)] = False
+
+    rows, cols = np.nonzero(present)
+    r2 = lambda a: np.round(a[rows, cols], 2)
+    bars = pd.DataFrame({
+        'ts_code': codes[rows],
+        'trade_date': np.array(dates[:T])[cols],
+        'open': r2(open_), 'high': r2(high), 'low': r2(low), 'close': r2(close),
+        'pre_close': r2(prev),
+        'vol': np.round(vol[rows, cols], 2),
+        'amount': np.round(vol[rows, cols] * close[rows, cols] / 10, 3),
+    })
+    bars['change'] = bars['close'] - bars['pre_close']
+    bars['pct_chg'] = bars['change'] / bars['pre_close'] * 100
+
+    price = np.round(close[:, T], 2)
+    pre = np.round(prev[:, T], 2)
+    names = np.array([f"股票{i:04d}" for i in range(S)], dtype=object)
+    st_idx = np.setdiff1d(rng.choice(S, int(S * 0.02), replace=False), planted)
+    names[st_idx] = ["ST" + n for n in names[st_idx]]
+    snap = pd.DataFrame({
+        '代码': codes,
+        '名称': names,
+        '涨跌幅': (price - pre) / pre * 100,
+        '最高涨幅': (np.round(high[:, T], 2) - pre) / pre * 100,
+        '成交额': vol[:, T] * price * 100,
+        '成交量': np.round(vol[:, T], 2),
+        '最新价': price,
+        '最高价': np.round(high[:, T], 2),
+        '所属行业': np.array(INDUSTRIES)[industry],
+        '流通市值': rng.lognormal(13, 1, S),
+        '换手率': rng.lognormal(0.5, 0.7, S),
+        '主力净流入占比': rng.normal(0, 1.5, S),
+    })
+    return bars, snap
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""测试共用：仓库根目录加入 sys.path（模块平铺在根目录），小规模固定种子合成行情"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_history import HistoryPanel  # noqa: E402
+from providers import LocalPro  # noqa: E402
+from synthetic import synthetic_market  # noqa: E402
+
+TODAY = '20261016'
+
+
+@pytest.fixture(scope="session")
+def market():
+    """(bars, snap)：400 只股票 × 150 个交易日，植入较多孕线，含停牌缺口与次新股"""
+    return synthetic_market(n_stocks=400, n_days=150, seed=7, plant_ratio=0.2, end_date=TODAY)
+
+
+@pytest.fixture(scope="session")
+def panel(market):
+    return HistoryPanel(market[0])
+
+
+@pytest.fixture(scope="session")
+def local_pro():
+    """无延迟、不限流的本地数据源：200 只 × 150 日，TODAY 为盘中（无当日日线）"""
+    return LocalPro.synthetic(200, 150, seed=7, end_date=TODAY)
+
+
+@pytest.fixture(scope="session")
+def closed_dates(local_pro):
+    """已收盘交易日（升序）"""
+    return sorted(local_pro.tables['daily']['trade_date'].unique())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+回测与参数扫描（本地合成行情）
+===================================================================
+✅ run_backtest：单进程与多进程结果一致；回看窗口缺日的交易日被跳过
+✅ 参数扫描 evaluate 的统计与同一组参数的 run_backtest 一致
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+import sweep
+from bar_store import DailyBarStore
+from providers import LocalPro
+
+# 宽松参数：合成行情中能选出足够多的股票，比较才有意义
+PARAMS = {'min_gain': 3.0, 'vol_mother': 1.2, 'vol_break': 1.2, 'max_break': 10.0,
+          'breakout_threshold': 1.0, 'max_deviation': 0.4}
+SCORE_KW = dict(vol_ratio_break=PARAMS['vol_break'], max_breakthrough_gain=PARAMS['max_break'],
+                breakout_threshold=PARAMS['breakout_threshold'], max_deviation_from_ma120=PARAMS['max_deviation'])
+
+
+@pytest.fixture(scope="module")
+def env(tmp_path_factory):
+    """(pro, store, start, end, trade_dates, basic, index_changes)：已补齐回测所需日线的本地仓库"""
+    pro = LocalPro.synthetic(150, 220, seed=3, end_date='20261016')
+    store = DailyBarStore(str(tmp_path_factory.mktemp("bars")))
+    closed = sorted(pro.tables['daily']['trade_date'].unique())
+    start, end = closed[-40], closed[-2]
+    trade_dates = backtest.backtest_trade_dates(pro, start, end, store, with_next=True)
+    backtest.sync_history(pro, store, trade_dates)
+    basic = backtest.load_stock_basic(pro, store)
+    index_changes = backtest.load_index_changes(pro, start, end)
+    return pro, store, start, end, trade_dates, basic, index_changes
+
+
+def _run(env, **kwargs):
+    _, store, start, end, trade_dates, basic, index_changes = env
+    kwargs.setdefault('store', store)
+    return backtest.run_backtest(start, end, basic, index_changes, trade_dates,
+                                 min_gain=PARAMS['min_gain'], vol_ratio=PARAMS['vol_mother'], **SCORE_KW, **kwargs)
+
+
+def test_backtest_single_and_multi_process_agree(env):
+    picks, days = _run(env, workers=1)
+    assert days == 39 and len(picks) > 0
+    multi, multi_days = _run(env, workers=2)
+    assert multi_days == days
+    pd.testing.assert_frame_equal(multi, picks)
+
+
+def test_backtest_skips_days_with_incomplete_window(env, tmp_path):
+    _, store, start, end, trade_dates, _, _ = env
+    copy = DailyBarStore(str(tmp_path))
+    gap = trade_dates[trade_dates.index(start) + 10]
+    for d in store.stored_dates():
+        if d != gap:
+            copy.write_date(d, store.read_date(d))
+    logs = []
+    picks, days = _run(env, store=copy, workers=1, log=lambda event, details: logs.append(details))
+    # 缺口日本身及其后 HISTORY_LIMIT + HISTORY_PAD 个交易日内的回测日都缺回看K线；缺口前一日缺次日
+    assert days == 10 - 1
+    assert picks['trade_date'].max() < gap
+    assert any("已跳过" in line for line in logs)
+
+
+def test_sweep_evaluate_matches_backtest(env):
+    _, store, start, end, trade_dates, basic, index_changes = env
+    path = sweep.build_feature_panel(start, end, basic, index_changes, [(PARAMS['min_gain'], PARAMS['vol_mother'])],
+                                     trade_dates, store=store, workers=2)
+    assert os.path.exists(path)
+    panel = pd.read_parquet(path)
+    features = {key: g.reset_index(drop=True) for key, g in panel.groupby(sweep.PATTERN_KEYS)}
+    result = sweep.evaluate(PARAMS, top_k=3, features=features)
+
+    picks, _ = _run(env, workers=1)
+    expected = backtest.summarize(picks)
+    assert expected['入选次数'] > 0
+    for key, value in expected.items():
+        assert np.isclose(result[key], value, equal_nan=True), key
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+交易日历
+===================================================================
+✅ 本地表过期且重新拉取失败时继续使用过期表，不退化为周一至周五
+"""
+import os
+import time
+
+import pandas as pd
+
+from bar_store import DailyBarStore
+from trade_calendar import CALENDAR_TABLE, TradeCalendar
+
+HOLIDAY = '20261001'   # 周四休市
+
+
+class _CalendarPro:
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.calls = 0
+
+    def trade_cal(self, exchange=None, start_date=None, end_date=None):
+        self.calls += 1
+        if self.broken:
+            raise RuntimeError("network down")
+        days = pd.date_range(start_date, end_date).strftime('%Y%m%d')
+        is_open = [(pd.Timestamp(d).weekday() < 5 and d != HOLIDAY) for d in days]
+        return pd.DataFrame({'cal_date': days, 'is_open': [int(x) for x in is_open]})
+
+
+def test_stale_calendar_kept_when_refresh_fails(tmp_path):
+    store = DailyBarStore(str(tmp_path))
+    fresh = TradeCalendar(_CalendarPro(), store, start='20260101')
+    assert not fresh.is_open(HOLIDAY)
+    old = time.time() - 60 * 86400
+    path = os.path.join(str(tmp_path), "tables", f"{CALENDAR_TABLE}.parquet")
+    os.utime(path, (old, old))
+
+    pro = _CalendarPro(broken=True)
+    cal = TradeCalendar(pro, store, start='20260101')
+    assert not cal.is_open(HOLIDAY)
+    assert cal.prev('20261002') == '20260930'
+    assert pro.calls == 1
+    # 同一天内不再重复拉取
+    cal.is_open('20261012')
+    assert pro.calls == 1
+
+
+def test_no_table_and_failed_fetch_falls_back_to_weekdays(tmp_path):
+    cal = TradeCalendar(_CalendarPro(broken=True), DailyBarStore(str(tmp_path)))
+    assert cal.is_open(HOLIDAY)
+    assert not cal.is_open('20261003')
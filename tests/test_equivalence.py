@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+向量化 / 增量实现与原始实现逐项对照
+===================================================================
+✅ find_latest_pregnancy_batch ↔ 逐只 find_latest_pregnancy
+✅ IncrementalScorer ↔ 每次整表 score_breakouts
+✅ SectorEngine ↔ 原 groupby 版 sector_strength_momentum（内嵌于本文件作为参照）
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from incremental_scan import IncrementalScorer
+from premarket import SETUP_FIELDS, compute_setups
+from sector_engine import SectorEngine
+from strategy import (filter_stocks_by_rule, find_latest_pregnancy, find_latest_pregnancy_batch,
+                      score_breakouts)
+
+LIMIT = 60
+
+
+# ===============================
+# 孕线识别：批量 ↔ 逐只
+# ===============================
+@pytest.mark.parametrize("min_gain, vol_ratio", [(5, 1.5), (3, 1.2)])
+def test_pregnancy_batch_matches_scalar(panel, min_gain, vol_ratio):
+    codes = list(panel.codes)
+    bars = {f: panel.aligned(f, codes=codes, limit=LIMIT) for f in SETUP_FIELDS}
+    batch = find_latest_pregnancy_batch(bars['open'], bars['high'], bars['low'], bars['close'], bars['vol'],
+                                        min_gain=min_gain, vol_ratio=vol_ratio)
+    found = 0
+    for i, code in enumerate(codes):
+        info = find_latest_pregnancy(panel.frame(code, LIMIT), min_gain=min_gain, vol_ratio=vol_ratio)
+        row = batch.iloc[i]
+        if info is None:
+            assert row['mother_idx'] == -1, code
+            continue
+        found += 1
+        assert row['mother_idx'] == info['mother_idx'], code
+        for name in ('open', 'high', 'low', 'close', 'vol'):
+            assert row[f'mother_{name}'] == info['mother'][name], (code, name)
+            assert row[f'child_{name}'] == info['child'][name], (code, name)
+    # 植入的孕线必须被识别出来，否则对照没有意义
+    assert found >= 0.1 * len(codes)
+
+
+# ===============================
+# 评分：增量 ↔ 整表
+# ===============================
+def _candidates(market, panel):
+    _, snap = market
+    setups = compute_setups(panel)
+    filtered = filter_stocks_by_rule(snap).sort_values('成交额', ascending=False)
+    to_check = filtered[filtered['代码'].isin(setups.index)].reset_index(drop=True)
+    feats = setups.loc[to_check['代码']].reset_index(drop=True)
+    return to_check, feats
+
+
+def _assert_same_scores(got, want):
+    pd.testing.assert_frame_equal(got[want.columns], want, check_dtype=False)
+
+
+def test_incremental_scorer_matches_full_rescore(market, panel):
+    to_check, feats = _candidates(market, panel)
+    assert len(to_check) > 20
+    rng = np.random.default_rng(0)
+    sectors = to_check['所属行业'].dropna().unique()
+    strength = pd.DataFrame({'强度得分': rng.uniform(0, 100, len(sectors))}, index=sectors)
+    scorer = IncrementalScorer()
+    kw = dict(index_change=0.3, late_session=False, vol_ratio_break=1.5)
+
+    snap, fe = to_check, feats
+    for step in range(6):
+        if step == 1:       # 少数股票价量变化
+            snap = snap.copy()
+            moved = rng.choice(len(snap), 5, replace=False)
+            snap.loc[moved, '最新价'] *= 1.01
+            snap.loc[moved, '成交量'] *= 1.2
+        elif step == 2:     # 有股票跌出、行序打乱
+            keep = np.sort(rng.choice(len(snap), len(snap) - 4, replace=False))[::-1]
+            snap, fe = snap.iloc[keep].reset_index(drop=True), fe.iloc[keep].reset_index(drop=True)
+        elif step == 3:     # 跌出的股票重新进入
+            snap, fe = to_check, feats
+        elif step == 4:     # 单个板块强度变化，只重算该板块的股票
+            strength = strength.copy()
+            strength.iloc[0, 0] += 10
+        elif step == 5:     # 评分参数变化，整表重算
+            kw = dict(index_change=-1.2, late_session=True, vol_ratio_break=1.2)
+        got = scorer.score(snap, fe, sector_strength=strength, **kw)
+        want = score_breakouts(snap, fe, sector_strength=strength, **kw)
+        _assert_same_scores(got, want)
+        if step in (1, 4):
+            assert scorer.last_stats['reused'] > 0
+
+
+def test_incremental_scorer_empty_then_rows(market, panel):
+    """空表（范围内没有孕线股）之后再来非空表，上下文相同也要整表评分"""
+    to_check, feats = _candidates(market, panel)
+    scorer = IncrementalScorer()
+    kw = dict(index_change=0.3, late_session=False)
+    assert scorer.score(to_check.iloc[:0], feats.iloc[:0], **kw).empty
+    _assert_same_scores(scorer.score(to_check, feats, **kw), score_breakouts(to_check, feats, **kw))
+    assert scorer.last_stats['recomputed'] == len(to_check)
+    assert scorer.score(to_check.iloc[:0], feats.iloc[:0], **kw).empty
+    assert scorer.last_stats['removed'] == len(to_check)
+
+
+# ===============================
+# 板块强度：SectorEngine ↔ 原 groupby 版
+# ===============================
+def groupby_sector_strength(df_today, stock_5d):
+    """SectorEngine 之前的 sector_strength_momentum（groupby + 逐行动量），作为对照基准"""
+    if df_today.empty or '所属行业' not in df_today.columns:
+        return pd.DataFrame()
+    df_today = df_today.assign(is_limit_up=df_today['涨跌幅'] >= 9.5)
+    today_sector = df_today.groupby('所属行业').agg({
+        '涨跌幅': 'mean',
+        '成交额': 'sum',
+        'is_limit_up': 'sum',
+        '代码': 'count'
+    }).rename(columns={'代码': '股票数量', 'is_limit_up': '涨停家数'})
+    today_sector['资金占比'] = today_sector['成交额'] / today_sector['成交额'].sum()
+    today_sector['涨停占比'] = today_sector['涨停家数'] / max(1, today_sector['涨停家数'].sum())
+    today_sector['当日强度'] = (today_sector['涨跌幅'].rank(pct=True) * 40 +
+                                today_sector['资金占比'].rank(pct=True) * 40 +
+                                today_sector['涨停占比'].rank(pct=True) * 20)
+    top_stocks = df_today.nlargest(100, '成交额')
+    sector_5d = {}
+    for _, row in top_stocks.iterrows():
+        ind = row['所属行业']
+        pct = stock_5d.get(row['代码'], np.nan)
+        if not np.isnan(pct):
+            sector_5d.setdefault(ind, []).append(pct)
+    sector_5d_avg = {ind: np.mean(vals) for ind, vals in sector_5d.items()}
+    if sector_5d_avg:
+        sectors = list(sector_5d_avg.keys())
+        ranks = pd.Series(list(sector_5d_avg.values())).rank(pct=True) * 100
+        momentum_score = {sectors[i]: ranks.iloc[i] for i in range(len(sectors))}
+    else:
+        momentum_score = {}
+    final_scores = []
+    for sector in today_sector.index:
+        today = today_sector.loc[sector, '当日强度']
+        final_scores.append(0.4 * today + 0.6 * momentum_score.get(sector, today))
+    today_sector['强度得分'] = final_scores
+    return today_sector.sort_values('强度得分', ascending=False)
+
+
+def test_sector_engine_matches_groupby(market, panel):
+    _, snap = market
+    snap = snap.copy()
+    codes = snap['代码'].tolist()
+    close = panel.aligned('close', codes=codes, limit=6)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = (close[:, -1] - close[:, 0]) / close[:, 0] * 100
+    all_5d = {c: p for c, p in zip(codes, pct) if not np.isnan(p)}
+    # 边界：涨停、无行业、涨跌幅缺失
+    snap.loc[snap.index[:15], '涨跌幅'] = 9.8
+    snap.loc[snap.index[20:23], '所属行业'] = np.nan
+    snap.loc[snap.index[30:32], '涨跌幅'] = np.nan
+
+    engine = SectorEngine(top_n=100)
+    ts = datetime(2026, 10, 16, 10, 5)
+    for k in range(4):
+        s = snap.sample(frac=1, random_state=k) if k else snap
+        s = s.copy()
+        s.loc[s.index[:40], '成交额'] *= 1 + k
+        missing = engine.prepare(s, '20261016')
+        engine.set_momentum({c: all_5d.get(c, np.nan) for c in missing})
+        top = s.nlargest(100, '成交额')['代码']
+        want = groupby_sector_strength(s, {c: all_5d[c] for c in top if c in all_5d})
+        got = engine.compute(s, ts=ts)
+        pd.testing.assert_frame_equal(got, want[got.columns], check_dtype=False)
+    assert engine.history().shape[0] == 1
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+历史日线获取与缓存
+===================================================================
+✅ load_market_daily：按字节预算淘汰的缓存不会丢交易日
+✅ HistoryRange：extend 补齐后的切片、更窄请求的切片，都与直接按 (end_date, limit) 获取一致
+"""
+import pandas as pd
+
+from bar_store import DailyBarStore
+from fetcher import ConcurrentFetcher, RateLimiter
+from market_history import HistoryRange, load_market_daily
+from shared_cache import SharedCache
+
+
+def test_load_market_daily_keeps_days_evicted_from_cache(local_pro, closed_dates, tmp_path):
+    dates = closed_dates[-5:]
+    store = DailyBarStore(str(tmp_path))
+    first = load_market_daily(local_pro, dates, {}, store=store)
+    # 预算只够放一天：逐日写入缓存时前面的交易日随即被淘汰
+    cache = SharedCache(budgets={'daily': 1})
+    bars = load_market_daily(local_pro, dates, cache.namespace('daily'), store=store)
+    assert sorted(bars['trade_date'].unique()) == dates
+    assert len(bars) == len(first)
+    assert cache.stats()['daily']['evicted'] == len(dates) - 1
+
+
+# ===============================
+# 单只股票区间缓存
+# ===============================
+def _direct(pro, code, end_date, limit):
+    return HistoryRange.fetch(pro, code, end_date, limit).frame
+
+
+def _sample_codes(pro):
+    """普通股、K线最少的次新股、K线有缺口的停牌股各一只"""
+    counts = pro.tables['daily'].groupby('ts_code').size()
+    return [counts.index[0], counts.idxmin(), counts[counts < counts.max()].index[-1]]
+
+
+def test_history_range_extend_and_slice_match_direct_fetch(local_pro, closed_dates):
+    fetcher = ConcurrentFetcher(RateLimiter(60000))
+    early, late = closed_dates[-60], closed_dates[-1]
+    for code in _sample_codes(local_pro):
+        hist = HistoryRange.fetch(local_pro, code, early, 30, fetcher)
+        pd.testing.assert_frame_equal(hist.slice(early, 30), _direct(local_pro, code, early, 30))
+
+        # 右侧补到 late、左侧补足 120 根
+        calls = local_pro.calls['daily']
+        wide = hist.extend(local_pro, late, 120, fetcher)
+        assert local_pro.calls['daily'] - calls <= 2
+        assert wide.covers(late, 120)
+        pd.testing.assert_frame_equal(wide.slice(late, 120), _direct(local_pro, code, late, 120))
+
+        # 区间内任意更窄的请求直接切片，结果与单独获取相同（上市前的空结果只比较内容，不比较列序）
+        for end_date, limit in ((closed_dates[-30], 20), (early, 60), (late, 5)):
+            if wide.covers(end_date, limit):
+                pd.testing.assert_frame_equal(wide.slice(end_date, limit), _direct(local_pro, code, end_date, limit),
+                                              check_like=True, check_index_type=False, check_dtype=False)
+
+
+def test_history_range_marks_exhausted_listing(local_pro, closed_dates):
+    code = local_pro.tables['daily'].groupby('ts_code').size().idxmin()
+    hist = HistoryRange.fetch(local_pro, code, closed_dates[-1], 500)
+    assert hist.exhausted
+    # 上市以来的全部K线都已获取：任意回看长度都能直接切片
+    assert hist.covers(closed_dates[-1], 1000)
+    pd.testing.assert_frame_equal(hist.slice(closed_dates[-1], 1000), _direct(local_pro, code, closed_dates[-1], 1000))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+盘中分钟环形缓冲的增量因子
+===================================================================
+✅ 首个样本分钟量为 NaN；同一分钟多次轮询以上一分钟收尾状态为基准；跨分钟缺口按间隔分钟数平摊
+✅ 量能加速度、VWAP、高点回撤与逐分钟手算一致；换日原地清空；超出容量的新代码忽略
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from intraday_buffer import IntradayBuffer, session_minute
+from trade_calendar import TZ
+
+
+def _at(hhmmss, day='20261016'):
+    return datetime.strptime(day + hhmmss, '%Y%m%d%H%M%S').replace(tzinfo=TZ)
+
+
+def _snap(rows):
+    """rows：[(代码, 最新价, 累计成交量, 累计成交额, 最高价)]"""
+    return pd.DataFrame(rows, columns=['代码', '最新价', '成交量', '成交额', '最高价'])
+
+
+def test_session_minute_slots():
+    assert session_minute(_at('091500')) == 0
+    assert session_minute(_at('093000')) == 0
+    assert session_minute(_at('112959')) == 119
+    assert session_minute(_at('120000')) == 119
+    assert session_minute(_at('130000')) == 120
+    assert session_minute(_at('150500')) == 239
+
+
+def test_minute_volume_acceleration_vwap_drawdown():
+    buf = IntradayBuffer(capacity=4)
+    buf.record(_snap([('A', 10.0, 1000, 10000, 10.0)]), _at('093005'))
+    f = buf.factors().loc['A']
+    assert np.isnan(f['分钟量']) and np.isnan(f['量能加速度'])   # 首个样本：没有上一分钟可比
+
+    # 同一分钟内再次轮询：仍以开盘首个样本为基准，分钟量仍为 NaN，只更新最新值
+    buf.record(_snap([('A', 10.2, 1500, 15300, 10.2)]), _at('093050'))
+    assert np.isnan(buf.factors().loc['A', '分钟量'])
+    assert buf.series('A', 'volume')[0] == 1500
+
+    # 进入下一分钟：基准为上一分钟收尾的 1500
+    buf.record(_snap([('A', 10.1, 1800, 18330, 10.2)]), _at('093110'))
+    buf.record(_snap([('A', 10.0, 2100, 21330, 10.2)]), _at('093150'))
+    f = buf.factors().loc['A']
+    assert f['分钟量'] == 600
+    assert np.isnan(f['量能加速度'])
+
+    # 缺两分钟后的样本：累计增量按间隔分钟数平摊
+    buf.record(_snap([('A', 9.8, 3300, 33090, 10.2)]), _at('093420'))
+    f = buf.factors().loc['A']
+    assert f['分钟量'] == (3300 - 2100) / 3
+    assert f['量能加速度'] == (3300 - 2100) / 3 - 600
+    assert np.isclose(f['VWAP'], 33090 / 3300)
+    assert np.isclose(f['偏离VWAP'], (9.8 / (33090 / 3300) - 1) * 100)
+    assert np.isclose(f['高点回撤'], (10.2 - 9.8) / 10.2 * 100)
+    series = buf.series('A', 'volume')
+    assert np.isnan(series[2:4]).all() and series[4] == 3300
+
+
+def test_late_listing_new_day_and_capacity():
+    buf = IntradayBuffer(capacity=2)
+    buf.record(_snap([('A', 10.0, 100, 1000, 10.0)]), _at('093000'))
+    buf.record(_snap([('A', 10.0, 200, 2000, 10.0), ('B', 5.0, 8000, 40000, 5.0),
+                      ('C', 1.0, 10, 10, 1.0)]), _at('093100'))
+    f = buf.factors()
+    assert list(f.index) == ['A', 'B']                           # 超出容量的 C 被忽略
+    assert f.loc['A', '分钟量'] == 100
+    assert np.isnan(f.loc['B', '分钟量'])                        # B 的首个样本不拿全天累计量充当分钟量
+
+    buf.record(_snap([('A', 11.0, 50, 550, 11.0)]), _at('093000', day='20261019'))
+    assert buf.trade_date == '20261019'
+    f = buf.factors()
+    assert np.isnan(f.loc['A', '分钟量'])
+    assert f.loc['B'].isna().all()                               # 新交易日尚未出现的代码保留行号但无数据
+    assert buf.nbytes == 2 * 240 * 4 * 4
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+共享缓存的内存预算
+===================================================================
+✅ 超出命名空间预算时按最近最少使用淘汰，占用始终不超过预算；读取会刷新使用顺序
+✅ 无预算的命名空间不受影响；HistoryRange 按 __sizeof__ 计入占用
+"""
+import numpy as np
+import pandas as pd
+
+from market_history import HistoryRange
+from shared_cache import SharedCache, estimate_bytes
+
+
+def _frame(n, seed):
+    return pd.DataFrame({'close': np.random.default_rng(seed).random(n), 'code': [f"{i:06d}.SH" for i in range(n)]})
+
+
+def test_lru_eviction_respects_byte_budget():
+    frames = {i: _frame(100, i) for i in range(10)}
+    size = estimate_bytes(frames[0])
+    cache = SharedCache(budgets={'hist': size * 3 + size // 2})
+    for i in range(3):
+        cache.set(('hist', i), frames[i])
+    cache.get(('hist', 0))                  # 0 变为最近使用，下一次淘汰 1
+    cache.set(('hist', 3), frames[3])
+    assert cache.peek(('hist', 1)) is None
+    assert all(cache.peek(('hist', i)) is not None for i in (0, 2, 3))
+
+    for i in range(4, 10):
+        cache.set(('hist', i), frames[i])
+        stats = cache.stats()['hist']
+        assert stats['bytes'] <= stats['budget']
+        assert stats['entries'] == 3
+    stats = cache.stats()['hist']
+    assert stats['evicted'] == 7
+    assert [i for i in range(10) if cache.peek(('hist', i)) is not None] == [7, 8, 9]
+
+    # 覆盖写入同一个键不重复计入占用
+    cache.set(('hist', 9), frames[9])
+    assert cache.stats()['hist']['bytes'] == 3 * size
+
+
+def test_oversized_entry_kept_alone_and_unbudgeted_namespace_untouched():
+    big, small = _frame(1000, 0), _frame(10, 1)
+    cache = SharedCache(budgets={'hist': estimate_bytes(small) * 2})
+    for i in range(5):
+        cache.set(('index', i), big)
+    cache.set(('hist', 'a'), small)
+    cache.set(('hist', 'big'), big)
+    # 超过预算的单个条目仍保留（至少保留刚写入的一条），其余被淘汰
+    assert cache.peek(('hist', 'big')) is big
+    assert cache.peek(('hist', 'a')) is None
+    stats = cache.stats()
+    assert stats['index']['entries'] == 5 and stats['index']['bytes'] is None
+
+
+def test_history_range_sized_by_its_frame(local_pro, closed_dates):
+    ranges = [HistoryRange.fetch(local_pro, code, closed_dates[-1], 120)
+              for code in local_pro.tables['daily']['ts_code'].unique()[:6]]
+    sizes = [estimate_bytes(r) for r in ranges]
+    assert all(est >= r.__sizeof__() > 0 for est, r in zip(sizes, ranges))
+    size = max(sizes)
+    cache = SharedCache(budgets={'hist': size * 4})
+    for r in ranges:
+        cache.set(('hist', r.ts_code), r)
+    stats = cache.stats()['hist']
+    assert stats['bytes'] == sum(sizes[-stats['entries']:])
+    assert stats['bytes'] <= stats['budget'] and stats['evicted'] == 6 - stats['entries'] > 0
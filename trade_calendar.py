@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+交易日历缓存（上交所 trade_cal，落盘 + 内存二分查找）
+===================================================================
+✅ 核心逻辑：
+   - 首次使用时一次性拉取 2005 年至明年年底的全部日历（含休市日），整表存入本地仓库 trade_cal，
+     超过 max_age_days 或查询日期超出已发布范围时才重新拉取（同一天最多重拉一次）；
+     重新拉取失败时继续使用已过期的本地表
+   - 「今天」一律按北京时间计算，不受服务器时区影响
+   - 开市日保存为升序 numpy 数组，is_open / prev / next / recent / between 都是 searchsorted，
+     不再为「前一交易日」「最近 N 个交易日」额外调用接口
+   - 拉取失败或日期超出已发布范围时 is_open 退化为「周一至周五」判断，不阻塞行情与选股
+✅ 用法：
+   cal = TradeCalendar(pro, DailyBarStore())
+   cal.is_open('20261001')        # 国庆节 → False
+   cal.prev('20261009')           # 节后首日的前一交易日 → '20260930'
+   cal.recent('20261016', 140)    # 截至该日（含）的最近 140 个开市日
+"""
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+CALENDAR_TABLE = "trade_cal"
+CALENDAR_START = "20050101"
+TZ = ZoneInfo("Asia/Shanghai")
+
+
+class TradeCalendar:
+    def __init__(self, pro, store=None, max_age_days=30, start=CALENDAR_START, log=None):
+        self.pro = pro
+        self.store = store
+        self.max_age_days = max_age_days
+        self.start = start
+        self.log = log
+        self._lock = threading.Lock()
+        self._open = None          # 升序开市日数组
+        self._first = self._last = None  # 已知日历覆盖范围（含休市日）
+        self._fetched_on = None
+        self._expired = False      # 当前日历来自已过期的本地表
+
+    # ---------- 加载 ----------
+    def _load(self, need=None):
+        """确保日历已加载且覆盖 need；本地表过期或不覆盖时从接口重新拉取"""
+        with self._lock:
+            if self._open is None and self.store is not None:
+                cal = self.store.read_table(CALENDAR_TABLE, max_age_days=self.max_age_days)
+                self._expired = cal is None
+                # 过期的本地表先载入：重新拉取失败时仍有日历可用
+                self._set(cal if cal is not None else self.store.read_table(CALENDAR_TABLE))
+            today = datetime.now(TZ).strftime('%Y%m%d')
+            stale = self._open is None or self._expired or (need is not None and need > self._last)
+            if stale and self._fetched_on != today:
+                self._fetched_on = today
+                self._fetch()
+
+    def _fetch(self):
+        end = f"{datetime.now(TZ).year + 1}1231"
+        try:
+            cal = self.pro.trade_cal(exchange='SSE', start_date=self.start, end_date=end)
+        except Exception as e:
+            if self.log:
+                self.log("交易日历", f"获取失败: {str(e)[:50]}")
+            return
+        if cal is None or cal.empty:
+            return
+        cal = cal[['cal_date', 'is_open']].astype(str)
+        self._set(cal)
+        self._expired = False
+        if self.store is not None:
+            self.store.write_table(CALENDAR_TABLE, cal)
+        if self.log:
+            self.log("交易日历", f"已更新 {self._first} ~ {self._last}，{len(self._open)} 个开市日")
+
+    def _set(self, cal):
+        if cal is None or cal.empty:
+            return
+        dates = cal['cal_date'].astype(str)
+        self._first, self._last = dates.min(), dates.max()
+        self._open = np.sort(dates[cal['is_open'].astype(str) == '1'].unique())
+
+    def _dates(self, need=None):
+        self._load(need)
+        return self._open if self._open is not None else np.array([], dtype=str)
+
+    def covers(self, date):
+        self._load(date)
+        return self._open is not None and self._first <= date <= self._last
+
+    # ---------- 查询 ----------
+    def is_open(self, date):
+        """date 是否开市；日历不可用或超出已发布范围时按周一至周五判断"""
+        date = _as_str(date)
+        if not self.covers(date):
+            return pd.Timestamp(date).weekday() < 5
+        dates = self._open
+        i = np.searchsorted(dates, date)
+        return i < len(dates) and dates[i] == date
+
+    def prev(self, date, n=1):
+        """date 之前（不含）第 n 个开市日；不足时返回 None"""
+        dates = self._dates(_as_str(date))
+        i = np.searchsorted(dates, _as_str(date)) - n
+        return str(dates[i]) if i >= 0 else None
+
+    def next(self, date, n=1):
+        """date 之后（不含）第 n 个开市日；超出已发布日历时返回 None"""
+        dates = self._dates(_as_str(date))
+        i = np.searchsorted(dates, _as_str(date), side='right') + n - 1
+        return str(dates[i]) if i < len(dates) else None
+
+    def recent(self, end_date, n):
+        """截至 end_date（含）的最近 n 个开市日，升序列表"""
+        dates = self._dates(_as_str(end_date))
+        i = np.searchsorted(dates, _as_str(end_date), side='right')
+        return [str(d) for d in dates[max(0, i - n):i]]
+
+    def between(self, start, end):
+        """[start, end] 内的开市日，升序列表"""
+        dates = self._dates(_as_str(end))
+        lo, hi = np.searchsorted(dates, _as_str(start)), np.searchsorted(dates, _as_str(end), side='right')
+        return [str(d) for d in dates[lo:hi]]
+
+
+def _as_str(date):
+    return date if isinstance(date, str) else pd.Timestamp(date).strftime('%Y%m%d')